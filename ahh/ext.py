@@ -1,15 +1,43 @@
 import numpy as np
-import pandas as pd
-from netCDF4 import Dataset, num2date
-from operator import itemgetter
+from netCDF4 import Dataset, Variable, num2date, date2num
+from collections import OrderedDict
 import datetime
-import calendar
+import hashlib
+import glob
+import pickle
 import os
 
+from ahh.profiler import PROFILE_SETTINGS, Timer, add_bytes_read
+
 __author__ = 'huang.andrew12@gmail.com'
 __copyright__ = 'Andrew Huang'
 
 
+TIME_UNITS_US = {'microseconds': 1,
+                 'milliseconds': 1e3,
+                 'seconds': 1e6,
+                 'minutes': 6e7,
+                 'hours': 3.6e9,
+                 'days': 8.64e10,
+                 'weeks': 6.048e11}
+TIME_UNIT_ALIASES = {'us': 'microseconds', 'usec': 'microseconds',
+                     'usecs': 'microseconds', 'microsec': 'microseconds',
+                     'microsecs': 'microseconds',
+                     'ms': 'milliseconds', 'msec': 'milliseconds',
+                     'msecs': 'milliseconds', 'millisec': 'milliseconds',
+                     'millisecs': 'milliseconds',
+                     's': 'seconds', 'sec': 'seconds', 'secs': 'seconds',
+                     'min': 'minutes', 'mins': 'minutes',
+                     'h': 'hours', 'hr': 'hours', 'hrs': 'hours',
+                     'd': 'days'}
+DT64_CALENDARS = ('standard', 'gregorian', 'proleptic_gregorian')
+SUMMARY_CHUNK_ELEMENTS = 10 ** 7
+EARTH_RADIUS = 6371.  # km
+COORD_CACHE = OrderedDict()
+TREE_CACHE = OrderedDict()
+COORD_CACHE_SETTINGS = {'size': 128, 'directory': None}
+
+
 class OutOfRange(Exception):
     pass
 
@@ -18,6 +46,129 @@ class FileExists(Exception):
     pass
 
 
+class MissingDimension(Exception):
+    pass
+
+
+class Unsupported(Exception):
+    pass
+
+
+def add_nc_bytes_read(source, block):
+    """
+    Credits the bytes of block to the running timers if it was read from a
+    netCDF4 variable; arrays already in memory are not counted, and
+    LazyVar and MultiFileVar credit their own reads.
+
+    :param: source (np.array/netCDF4.Variable) - data the block came from
+    :param: block (np.ma.array) - values read
+    """
+    if PROFILE_SETTINGS['enabled'] and isinstance(source, Variable):
+        add_bytes_read(np.ma.getdata(block).nbytes)
+
+
+@Timer()
+def get_summary(variable,
+                fillval_high=99999.,
+                fillval_low=-99999.,
+                quantiles=(0.01, 0.25, 0.5, 0.75, 0.99),
+                sample_size=100000,
+                chunk_size=None,
+                seed=0):
+    """
+    Summarizes a variable in a single chunked pass along its first axis,
+    so lazy netCDF4 variables (or LazyVar/MultiFileVar) never have to be
+    loaded whole. Mean and standard deviation are merged chunk by chunk;
+    quantiles are approximated from a uniform random sample of the valid
+    values (exact if there are fewer than sample_size).
+
+    :param: variable (array/netCDF4.Variable) - variable to be summarized
+    :param: fillval_high (float) - values equal/greater are counted as fill
+    :param: fillval_low (float) - values equal/less are counted as fill
+    :param: quantiles (tuple) - quantiles to approximate, from 0 to 1
+    :param: sample_size (int) - number of values kept for the quantiles
+    :param: chunk_size (int) - number of first-axis rows to read at a time;
+                               defaults to about 10 million values per read
+    :param: seed (int) - seed of the random sample
+    :return: summary (dict) - size, valid, masked, nan and fill counts,
+             min, max, mean, std and quantiles
+    """
+    shape = tuple(np.shape(variable))
+    if len(shape) == 0:
+        variable = np.atleast_1d(np.asarray(variable))
+        shape = variable.shape
+    if chunk_size is None:
+        row_size = int(np.prod(shape[1:])) if len(shape) > 1 else 1
+        chunk_size = max(1, SUMMARY_CHUNK_ELEMENTS // max(row_size, 1))
+
+    rng = np.random.RandomState(seed)
+    summary = {'size': 0, 'valid': 0, 'masked': 0, 'nan': 0, 'fill': 0,
+               'min': None, 'max': None, 'mean': None, 'std': None}
+    mean = 0.
+    m2 = 0.
+    sample = np.zeros(0)
+    sample_keys = np.zeros(0)
+
+    for start in range(0, shape[0], chunk_size):
+        block = variable[start:start + chunk_size]
+        add_nc_bytes_read(variable, block)
+        block = np.ma.asarray(block)
+        mask = np.ma.getmaskarray(block).ravel()
+        values = np.ma.getdata(block).ravel().astype(float)
+        summary['size'] += values.size
+        summary['masked'] += int(mask.sum())
+
+        nan = np.isnan(values) & ~mask
+        fill = ((values >= fillval_high) | (values <= fillval_low)) & \
+            ~mask & ~nan
+        summary['nan'] += int(nan.sum())
+        summary['fill'] += int(fill.sum())
+        values = values[~(mask | nan | fill)]
+        if values.size == 0:
+            continue
+
+        count_a = summary['valid']
+        count_b = values.size
+        count = count_a + count_b
+        mean_b = values.mean()
+        delta = mean_b - mean
+        mean += delta * count_b / count
+        m2 += np.square(values - mean_b).sum() + \
+            np.square(delta) * count_a * count_b / count
+        summary['valid'] = count
+
+        block_min = values.min()
+        block_max = values.max()
+        if summary['min'] is None or block_min < summary['min']:
+            summary['min'] = block_min
+        if summary['max'] is None or block_max > summary['max']:
+            summary['max'] = block_max
+
+        keys = rng.random_sample(count_b)
+        if count_b > sample_size:
+            keep = np.argpartition(keys, sample_size - 1)[:sample_size]
+            keys = keys[keep]
+            values = values[keep]
+        sample = np.concatenate((sample, values))
+        sample_keys = np.concatenate((sample_keys, keys))
+        if len(sample) > sample_size:
+            keep = np.argpartition(sample_keys, sample_size - 1)[
+                :sample_size]
+            sample = sample[keep]
+            sample_keys = sample_keys[keep]
+
+    if summary['valid'] > 0:
+        summary['mean'] = mean
+        summary['std'] = np.sqrt(m2 / summary['valid'])
+        summary['quantiles'] = dict(
+            zip(quantiles, np.percentile(sample,
+                                         [q * 100 for q in quantiles])))
+    else:
+        summary['quantiles'] = dict((q, None) for q in quantiles)
+    return summary
+
+
+@Timer()
 def ahh(variable,
         n='ahh',
         center=3,
@@ -31,10 +182,14 @@ def ahh(variable,
         snippet=True,
         time=0,
         level=0,
+        stream=False,
+        chunk_size=None,
         ):
     """
     Explores type, unnested type, length, and shape of a variable.
     Can optionally include a name to differentiate from other 'ahh's.
+    If stream, the statistics come from get_summary in one chunked pass and
+    only the snippet is read, so lazy netCDF4 variables are never loaded.
 
     :param: variable (array) - variable to be evaluated
     :param: n (boolean) - name of variable
@@ -51,7 +206,50 @@ def ahh(variable,
     :param: snippet (boolean) - whether to exclude snippet of values
     :param: time (integer) - index of time to print in snippet
     :param: level (integer) - index of time to print in snippet
+    :param: stream (boolean) - summarize in chunks without loading variable
+    :param: chunk_size (int) - number of first-axis rows to read at a time
+    :return: summary (dict) - if stream, the summary from get_summary
     """
+    if stream:
+        summary = get_summary(variable,
+                              fillval_high=fillval_high,
+                              fillval_low=fillval_low,
+                              chunk_size=chunk_size)
+        shape_of_var = tuple(np.shape(variable))
+        np.set_printoptions(
+                            suppress=suppress,
+                            threshold=threshold,
+                            precision=precision,
+                            edgeitems=edgeitems
+                            )
+        print('')
+        print('            Name: {}'.format(n))
+        print('Overarching Type: {}'.format(type(variable)))
+        print('  Original Shape: {}'.format(shape_of_var))
+        print('          Length: {}'.format(
+            shape_of_var[0] if len(shape_of_var) > 0 else None))
+        print('         Maximum: {}'.format(summary['max']))
+        print('         Minimum: {}'.format(summary['min']))
+        print('            Mean: {}'.format(summary['mean']))
+        print('         Std Dev: {}'.format(summary['std']))
+        print('    Valid/Masked: {}/{}'.format(summary['valid'],
+                                              summary['masked']))
+        print('        NaN/Fill: {}/{}'.format(summary['nan'],
+                                              summary['fill']))
+        for quantile, value in sorted(summary['quantiles'].items()):
+            print('   ~{:>5.1f}th pct: {}'.format(quantile * 100, value))
+        print('')
+        if snippet and len(shape_of_var) > 0:
+            print('Snippet of values:')
+            if len(shape_of_var) == 3:
+                print(np.array(variable[time, 0, :]))
+            elif len(shape_of_var) == 4:
+                print(np.array(variable[time, level, 0, :]))
+            else:
+                print(np.array(variable[:2 * edgeitems]))
+            print('')
+        return summary
+
     try:
         variable = np.array(variable)
         try:
@@ -204,37 +402,257 @@ def p(num=1):
 def lonw2e(lon, reverse=False):
     """
     Converts a west longitude to east longitude, can also do in reverse.
-    :param: lon (int) - a west longitude
-    :param: reverse (boolean) - indicator whether input is an array
-    :param: array (boolean) - indicator whether to go the other direction
-    :return: translated_lon (int) - translated longitude
-    """
-    if not reverse:
-        if len(lon) > 1:
-            translated_lon = np.array(lon)
-            west_lon_idc = np.where(translated_lon < 0)
-            translated_lon[west_lon_idc] += 360
+    Works on scalars and arrays alike.
+
+    :param: lon (float/np.array) - west longitude(s)
+    :param: reverse (boolean) - indicator whether to go the other direction
+    :return: translated_lon (float/np.array) - translated longitude(s)
+    """
+    if np.ndim(lon) > 0:
+        translated_lon = np.array(lon)
+        if not reverse:
+            translated_lon[translated_lon < 0] += 360
         else:
-            if lon < 0:
-                translated_lon = 360 + lon
-            else:
-                print('Input lon, {}, is already in east coordinates!'
-                      .format(lon))
-    else:
-        if len(lon) > 1:
-            translated_lon = np.array(lon)
-            west_lon_idc = np.where(translated_lon > 180)
-            translated_lon[west_lon_idc] -= 360
+            translated_lon[translated_lon > 180] -= 360
+        return translated_lon
+
+    if not reverse and lon < 0:
+        return 360 + lon
+    if reverse and lon > 180:
+        return lon - 360
+    print('Input lon, {}, is already in {} coordinates!'
+          .format(lon, 'west' if reverse else 'east'))
+    return lon
+
+
+def _expand_key(key, ndim):
+    """
+    Expands an index key to one entry per dimension.
+
+    :param: key (tuple) - index key, possibly with an Ellipsis
+    :param: ndim (int) - number of dimensions
+    :return: key (list) - one entry per dimension
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+    key = list(key)
+    for idx, value in enumerate(key):
+        if value is Ellipsis:
+            key[idx:idx + 1] = [slice(None)] * (ndim - len(key) + 1)
+            break
+    return key + [slice(None)] * (ndim - len(key))
+
+
+class RecenteredVar(object):
+    """
+    Reader of a variable with its longitude axis rotated to another
+    convention (i.e. 0 to 360 as -180 to 180) without copying it. Indices
+    are given in the new convention and translated to at most two
+    hyperslabs of the original, one per side of the seam; a request that
+    falls on one side is returned as a view for arrays (or one read for
+    netCDF4 variables), and only a request spanning the seam is joined.
+
+    :param: variable (np.array/netCDF4.Variable/LazyVar/MultiFileVar) -
+            data with a longitude axis
+    :param: lons (np.array) - ascending longitudes of the variable
+    :param: west (float) - western edge of the new convention; -180 for
+                           -180 to 180, 0 for 0 to 360
+    :param: axis (int) - longitude axis of the variable
+    """
+
+    def __init__(self, variable, lons, west=-180., axis=-1):
+        self.variable = variable
+        self.shape = tuple(np.shape(variable))
+        self.ndim = len(self.shape)
+        self.axis = axis % self.ndim
+        lons = np.asarray(lons)
+        if len(lons) != self.shape[self.axis]:
+            print('There are {} lons but the lon axis has length {}!'
+                  .format(len(lons), self.shape[self.axis]))
+            raise(MissingDimension)
+
+        shifted = (lons - west) % 360 + west
+        self.split = int(np.argmin(shifted)) if len(lons) > 0 else 0
+        self.lons = np.concatenate((shifted[self.split:],
+                                    shifted[:self.split]))
+        if np.any(np.diff(self.lons) < 0):
+            print('Longitudes must be ascending and span less than 360!')
+            raise(Unsupported)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def get_orig_idc(self, lons_idc):
+        """
+        Translates longitude indices of the new convention to the original.
+
+        :param: lons_idc (int/np.array) - indices in the new convention
+        :return: orig_idc (int/np.array) - indices in the original
+        """
+        num_lons = self.shape[self.axis]
+        return (np.asarray(lons_idc) % num_lons + self.split) % num_lons
+
+    def get_lon_key(self, left_lon, right_lon):
+        """
+        Finds the longitude indices of a box in the new convention; if
+        left_lon is greater than right_lon the box wraps around the edge of
+        the convention, like ext.get_idc.
+
+        :param: left_lon (float) - western longitude boundary
+        :param: right_lon (float) - eastern longitude boundary
+        :return: lon_key (slice/np.array) - indices in the new convention
+        """
+        if left_lon > right_lon:
+            west_idc = _search_idc(self.lons, left_lon, np.inf)[0][0]
+            east_idc = _search_idc(self.lons, -np.inf, right_lon)[0][0]
+            lons_idc = np.concatenate((west_idc, east_idc))
+        else:
+            lons_idc = _search_idc(self.lons, left_lon, right_lon)[0][0]
+        if len(lons_idc) == 0:
+            print('Unable to find any lon indices within the range!')
+        return get_selection(lons_idc)
+
+    def _read_parts(self, key):
+        """
+        Reads the selection as one block per side of the seam.
+
+        :param: key (tuple) - index key in the new convention
+        :return: parts, out_axis (list, int) - (positions, block) pairs and
+                 the longitude axis of the blocks
+        """
+        key = _expand_key(key, self.ndim)
+        lon_key = key[self.axis]
+        num_lons = self.shape[self.axis]
+        if isinstance(lon_key, slice):
+            lons_idc = np.arange(*lon_key.indices(num_lons))
+        elif np.ndim(lon_key) == 0:
+            key[self.axis] = int(self.get_orig_idc(lon_key))
+            return [(None, self.variable[tuple(key)])], None
         else:
-            if lon > 180:
-                translated_lon = lon - 360
+            lons_idc = np.asarray(lon_key)
+            if lons_idc.dtype == bool:
+                lons_idc = np.where(lons_idc)[0]
+            lons_idc = lons_idc % num_lons
+
+        out_axis = self.axis - len([value for value in key[:self.axis]
+                                    if np.ndim(value) == 0 and
+                                    not isinstance(value, slice)])
+        orig_idc = self.get_orig_idc(lons_idc)
+        parts = []
+        for side in (orig_idc >= self.split, orig_idc < self.split):
+            positions = np.where(side)[0]
+            if len(positions) == 0:
+                continue
+            side_idc = orig_idc[positions]
+            sel = get_selection(side_idc)
+            if isinstance(sel, slice) and sel.step == 1:
+                key[self.axis] = sel
+                block = self.variable[tuple(key)]
             else:
-                print('Input lon, {}, is already in east coordinates!'
-                      .format(lon))
+                key[self.axis] = slice(side_idc.min(), side_idc.max() + 1)
+                block = self.variable[tuple(key)].take(
+                    side_idc - side_idc.min(), axis=out_axis)
+            add_nc_bytes_read(self.variable, block)
+            parts.append((positions, block))
+        if len(parts) == 0:
+            key[self.axis] = slice(0, 0)
+            parts.append((np.zeros(0, dtype=int),
+                          self.variable[tuple(key)]))
+        return parts, out_axis
+
+    def get_parts(self, key=Ellipsis):
+        """
+        Reads the selection as separate blocks, one per side of the seam,
+        without joining them (i.e. to plot each half of a global field);
+        contiguous blocks are views of arrays.
+
+        :param: key (tuple) - index key in the new convention
+        :return: parts (list) - (positions, block) pairs, where positions
+                 are where the block's longitudes go in the selection
+        """
+        return self._read_parts(key)[0]
+
+    def __getitem__(self, key):
+        parts, out_axis = self._read_parts(key)
+        if len(parts) == 1:
+            return parts[0][1]
+        positions = np.concatenate([part[0] for part in parts])
+        blocks = [part[1] for part in parts]
+        if any(isinstance(block, np.ma.MaskedArray) for block in blocks):
+            block = np.ma.concatenate(blocks, axis=out_axis)
+        else:
+            block = np.concatenate(blocks, axis=out_axis)
+        if np.any(np.diff(positions) < 0):
+            block = block.take(np.argsort(positions), axis=out_axis)
+        return block
+
+    @Timer()
+    def subset(self, left_lon, right_lon, key=Ellipsis):
+        """
+        Reads a longitude box of the new convention; a box crossing the
+        seam of the original grid is read as two hyperslabs.
+
+        :param: left_lon (float) - western longitude boundary
+        :param: right_lon (float) - eastern longitude boundary
+        :param: key (tuple) - index key of the other dimensions
+        :return: lons, subset (np.array, np.ma.array) - longitudes and
+                 values of the box
+        """
+        lon_key = self.get_lon_key(left_lon, right_lon)
+        key = _expand_key(key, self.ndim)
+        key[self.axis] = lon_key
+        return self.lons[lon_key], self[tuple(key)]
+
+
+def _search_idc(arr, lower, upper, monotonic=None):
+    """
+    Finds the indices of arr within lower and upper (inclusive). If arr is
+    monotonic (ascending or descending), the bounds are found by binary
+    search instead of building a full boolean mask; the check for order is
+    a single pass over arr.
+
+    :param: arr (np.array) - coordinate values, not masked
+    :param: lower (float/datetime.datetime) - lower boundary
+    :param: upper (float/datetime.datetime) - upper boundary
+    :param: monotonic (boolean) - whether arr is known to be sorted; None
+                                  to check, False to always scan
+    :return: idc, idc_slice (tuple, slice) - np.where-style indices and the
+             equivalent slice; the slice is None if arr is not monotonic
+    """
+    len_arr = len(arr) if arr.ndim == 1 else 0
+    start = None
+    if len_arr > 1 and monotonic is not False:
+        if arr[-1] >= arr[0]:
+            if monotonic or np.count_nonzero(
+                    arr[1:] >= arr[:-1]) == len_arr - 1:
+                start = arr.searchsorted(lower, side='left')
+                end = arr.searchsorted(upper, side='right')
+        elif monotonic or np.count_nonzero(
+                arr[1:] <= arr[:-1]) == len_arr - 1:
+            rev = arr[::-1]
+            start = len_arr - rev.searchsorted(upper, side='right')
+            end = len_arr - rev.searchsorted(lower, side='left')
+    if start is not None:
+        start = int(start)
+        end = max(int(end), start)
+        return (np.arange(start, end),), slice(start, end)
+    return np.where((arr >= lower) & (arr <= upper)), None
+
+
+def _to_slice(idc, idc_slice):
+    """
+    Returns the slice if there is one, else the cheapest selection of idc.
 
-    return translated_lon
+    :param: idc (tuple) - np.where-style indices
+    :param: idc_slice (slice) - equivalent slice or None
+    :return: selection (slice/np.array) - slice or index array
+    """
+    if idc_slice is not None:
+        return idc_slice
+    return get_selection(idc[0])
 
 
+@Timer()
 def get_idc(lats,
             lons,
             lower_lat,
@@ -243,9 +661,16 @@ def get_idc(lats,
             right_lon,
             maxmin=False,
             w2e=False,
-            e2w=False):
+            e2w=False,
+            slices=False,
+            monotonic=None):
     """
     Finds the indices for given latitudes and longitudes boundary.
+    Monotonic (ascending or descending) coordinates are searched by binary
+    search; others fall back to a full scan. If left_lon is greater than
+    right_lon, the box is taken to wrap around the end of the longitudes
+    (i.e. 350 to 10) and the indices from both sides are returned in
+    west-to-east order.
 
     :param: lats (np.array) - array of latitudes
     :param: lons (np.array) - array of longitudes
@@ -256,13 +681,19 @@ def get_idc(lats,
     :param: maxmin (boolean) - return only the max and min of lat/lon idc
     :param: w2e (boolean) - convert input west longitudes to east longitudes
     :param: e2w (boolean) - convert input east longitudes to west longitudes
+    :param: slices (boolean) - return ready-to-use slices instead of indices;
+                               a wrapped lon box gives a tuple of two slices
+    :param: monotonic (boolean) - whether lats and lons are known to be
+                                  sorted, to skip checking their order;
+                                  False to always scan
     :return: lats_idc, lons_idc (np.array, np.array) - indices of lats/lons
     :return: lat_start_idc, lat_end_idc, lon_start_idc, lon_end_idc -
              (np.int64, np.int64, np.int64, np.int64)
              the lowest and highest lat/lon indices
+    :return: lat_slice, lon_slice (slice, slice) - if slices
     """
-    lats = np.array(lats)
-    lons = np.array(lons)
+    lats = np.ma.getdata(lats)
+    lons = np.ma.getdata(lons)
 
     if w2e:
         left_lon = lonw2e(left_lon)
@@ -272,23 +703,30 @@ def get_idc(lats,
         left_lon = lonw2e(left_lon, reverse=True)
         right_lon = lonw2e(right_lon, reverse=True)
 
-    lats_idc = np.where(
-                         (lats >= lower_lat)
-                         &
-                         (lats <= upper_lat)
-                         )
-    lons_idc = np.where(
-                         (lons >= left_lon)
-                         &
-                         (lons <= right_lon)
-                         )
-
-    if len(lats_idc) == 0:
+    lats_idc, lat_slice = _search_idc(lats, lower_lat, upper_lat, monotonic)
+    if left_lon > right_lon:
+        west_idc, west_slice = _search_idc(lons, left_lon, np.inf, monotonic)
+        east_idc, east_slice = _search_idc(lons, -np.inf, right_lon,
+                                           monotonic)
+        lons_idc = (np.concatenate((west_idc[0], east_idc[0])),)
+    else:
+        lons_idc, lon_slice = _search_idc(lons, left_lon, right_lon,
+                                          monotonic)
+
+    if len(lats_idc[0]) == 0:
         print('Unable to find any lat indices within the range!')
-    if len(lons_idc) == 0:
+    if len(lons_idc[0]) == 0:
         print('Unable to find any lon indices within the range!')
         print('Perhaps convert west longitudes to east, or vice versa?')
 
+    if slices:
+        if left_lon > right_lon:
+            lon_slice = (_to_slice(west_idc, west_slice),
+                         _to_slice(east_idc, east_slice))
+        else:
+            lon_slice = _to_slice(lons_idc, lon_slice)
+        return _to_slice(lats_idc, lat_slice), lon_slice
+
     if maxmin:
         lats_idc = lats_idc[0].min(), lats_idc[0].max()
         lons_idc = lons_idc[0].min(), lons_idc[0].max()
@@ -301,29 +739,36 @@ def get_idc(lats,
     return lats_idc[0], lons_idc[0]
 
 
-def get_lvl_idc(lvls, lower_lvl, upper_lvl, maxmin=False):
+@Timer()
+def get_lvl_idc(lvls, lower_lvl, upper_lvl, maxmin=False, slices=False,
+                monotonic=None):
     """
     Finds the level indices for given lower and upper boundary.
+    Monotonic levels are searched by binary search.
 
     :param: lvls (np.array) - array of levels
     :param: lower_lvl (float) - lower level boundary
     :param: upper_lvl (float) - upper level boundary
     :param: maxmin (boolean) - return only the max and min of level idc
+    :param: slices (boolean) - return a ready-to-use slice instead
+    :param: monotonic (boolean) - whether lvls are known to be sorted, to
+                                  skip checking their order; False to
+                                  always scan
     :return: lvls_idc (np.array) - indices of levels
     :return: lvl_start_idc, lvl_end_idc - (np.int64, np.int64)
              the lowest and highest level indices
+    :return: lvl_slice (slice) - if slices
     """
-    lvls = np.array(lvls)
+    lvls = np.ma.getdata(lvls)
 
-    lvls_idc = np.where(
-                         (lvls >= lower_lvl)
-                         &
-                         (lvls <= upper_lvl)
-                         )
+    lvls_idc, lvl_slice = _search_idc(lvls, lower_lvl, upper_lvl, monotonic)
 
-    if len(lvls_idc) == 0:
+    if len(lvls_idc[0]) == 0:
         print('Unable to find any lat indices within the range!')
 
+    if slices:
+        return _to_slice(lvls_idc, lvl_slice)
+
     if maxmin:
         lvls_idc = lvls_idc[0].min(), lvls_idc[0].max()
         lvl_start_idc = lvls_idc[0]
@@ -333,14 +778,19 @@ def get_lvl_idc(lvls, lower_lvl, upper_lvl, maxmin=False):
     return lvls_idc[0]
 
 
+@Timer()
 def get_time_idc(times, start_yr, end_yr,
                  start_mth=1, end_mth=12,
                  start_day=1, end_day=31,
-                 maxmin=False):
+                 maxmin=False,
+                 slices=False,
+                 monotonic=None):
     """
     Finds the time indices for given start time and end time.
+    Monotonic times are searched by binary search; np.datetime64 times
+    are compared natively.
 
-    :param: times (np.array) - array of datetimes
+    :param: times (np.array) - array of datetimes or np.datetime64
     :param: start_yr (int) - lower year boundary
     :param: end_yr (int) - upper year boundary
     :param: start_mth (int) - lower month boundary
@@ -348,9 +798,14 @@ def get_time_idc(times, start_yr, end_yr,
     :param: start_day (int) - lower day boundary
     :param: end_day (int) - upper day boundary
     :param: maxmin (boolean) - return only the max and min of time idc
+    :param: slices (boolean) - return a ready-to-use slice instead
+    :param: monotonic (boolean) - whether times are known to be sorted, to
+                                  skip checking their order; False to
+                                  always scan
     :return: times_idc (np.array) - indices of times
     :return: time_start_idc, time_end_idc - (np.int64, np.int64)
              the lowest and highest time indices
+    :return: time_slice (slice) - if slices
     """
     start_dt = datetime.datetime(start_yr, start_mth, start_day)
     while True:
@@ -364,15 +819,19 @@ def get_time_idc(times, start_yr, end_yr,
             print('Changing end day to {}!'
                   .format(end_day))
 
-    times_idc = np.where(
-                         (times >= start_dt)
-                         &
-                         (times <= end_dt)
-                         )
+    times = np.ma.getdata(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        start_dt = np.datetime64(start_dt, 'us')
+        end_dt = np.datetime64(end_dt, 'us')
 
-    if len(times_idc) == 0:
+    times_idc, time_slice = _search_idc(times, start_dt, end_dt, monotonic)
+
+    if len(times_idc[0]) == 0:
         print('Unable to find any times indices within the range!')
 
+    if slices:
+        return _to_slice(times_idc, time_slice)
+
     if maxmin:
         times_idc = times_idc[0].min(), times_idc[0].max()
         time_start_idc = times_idc[0]
@@ -382,6 +841,7 @@ def get_time_idc(times, start_yr, end_yr,
     return times_idc[0]
 
 
+@Timer()
 def get_closest(data, target_val, type_var='typical'):
     """
     Get the closest value and index to target value.
@@ -394,7 +854,7 @@ def get_closest(data, target_val, type_var='typical'):
     """
     if type_var == 'typical':
         diff = np.abs(np.array(data) - target_val)
-        closest_val_idc = min(enumerate(diff), key=itemgetter(1))[0]
+        closest_val_idc = int(np.argmin(diff))
         return data[closest_val_idc], closest_val_idc
     if type_var == 'datetime':
         closest_val = min(data, key=lambda d: abs(d - target_val))
@@ -404,6 +864,517 @@ def get_closest(data, target_val, type_var='typical'):
             closest_val_idc = np.where(data == closest_val)[0]
         return closest_val, closest_val_idc
 
+
+def _dt2num(dts):
+    """
+    Converts datetimes to seconds since 1970 so they can be compared as
+    numbers; handles datetime64, datetime.datetime and cftime arrays.
+
+    :param: dts (np.array) - array of datetimes
+    :return: nums (np.array) - seconds since 1970-01-01
+    """
+    dts = np.atleast_1d(np.asarray(dts))
+    if np.issubdtype(dts.dtype, np.datetime64):
+        return dts.astype('datetime64[us]').astype(np.int64) / 1e6
+    calendar = getattr(dts.flat[0], 'calendar', '') or 'standard'
+    return np.asarray(date2num(list(dts.ravel()),
+                               units='seconds since 1970-01-01',
+                               calendar=calendar),
+                      dtype=float).reshape(dts.shape)
+
+
+@Timer()
+def get_closest_arr(data, target_vals, type_var='typical'):
+    """
+    Get the closest values and indices to many target values at once, with
+    one sort of data and a binary search per target. Ties go to the smaller
+    value, and repeated values to their first index.
+
+    :param: data (np.array) - data
+    :param: target_vals (np.array) - target values
+    :param: type_var (str) - typical (float) or datetime (datetime.datetime,
+                             cftime or np.datetime64)
+
+    :return: closest_vals, closest_val_idc (np.array, np.array) -
+             the closest values to the target values and their indices
+    """
+    if type_var == 'datetime':
+        data_num = _dt2num(data)
+        target_num = _dt2num(target_vals)
+    else:
+        data_num = np.asarray(data, dtype=float)
+        target_num = np.atleast_1d(np.asarray(target_vals, dtype=float))
+
+    len_data = len(data_num)
+    if len_data == 0:
+        print('Unable to find closest values in empty data!')
+        raise(OutOfRange)
+
+    order = None
+    if np.all(data_num[1:] >= data_num[:-1]):
+        sorted_num = data_num
+    else:
+        order = np.argsort(data_num, kind='mergesort')
+        sorted_num = data_num[order]
+
+    if len_data == 1:
+        pos = np.zeros(len(target_num), dtype=int)
+    else:
+        pos = np.clip(np.searchsorted(sorted_num, target_num), 1,
+                      len_data - 1)
+        left_diff = target_num - sorted_num[pos - 1]
+        right_diff = sorted_num[pos] - target_num
+        pos -= left_diff <= right_diff
+        pos = np.searchsorted(sorted_num, sorted_num[pos], side='left')
+
+    closest_val_idc = pos if order is None else order[pos]
+    return np.asarray(data)[closest_val_idc], closest_val_idc
+
+
+def _to_xyz(lats, lons):
+    """
+    Turns latitudes and longitudes into 3D points on the unit sphere.
+
+    :param: lats (np.array) - latitudes
+    :param: lons (np.array) - longitudes
+    :return: xyz (np.array) - points shaped (..., 3)
+    """
+    lats = np.radians(np.asarray(np.ma.getdata(lats), dtype=np.float64))
+    lons = np.radians(np.asarray(np.ma.getdata(lons), dtype=np.float64))
+    cos_lats = np.cos(lats)
+    return np.stack((cos_lats * np.cos(lons),
+                     cos_lats * np.sin(lons),
+                     np.sin(lats)), axis=-1)
+
+
+class GridTree(object):
+    """
+    Spatial index of a grid, built once as a KD-tree on the unit sphere so
+    nearest gridpoint lookups work on curvilinear (2D lat/lon) grids, near
+    the poles and across the dateline alike. See get_grid_tree to reuse a
+    tree between calls and runs.
+
+    :param: lats (np.array) - 2D latitudes, or 1D for a rectilinear grid
+    :param: lons (np.array) - 2D longitudes, or 1D for a rectilinear grid
+    :param: mask (np.array) - True where gridpoints are left out
+                              (i.e. land on an ocean grid)
+    """
+
+    def __init__(self, lats, lons, mask=None):
+        from scipy.spatial import cKDTree
+
+        lats = np.asarray(np.ma.getdata(lats), dtype=np.float64)
+        lons = np.asarray(np.ma.getdata(lons), dtype=np.float64)
+        if lats.ndim == 1 and lons.ndim == 1 and lats.shape != lons.shape:
+            lats, lons = np.meshgrid(lats, lons, indexing='ij')
+        if lats.shape != lons.shape:
+            print('Shapes of lats {} and lons {} do not match!'
+                  .format(lats.shape, lons.shape))
+            raise(Unsupported)
+
+        self.shape = lats.shape
+        if mask is None:
+            self.points = np.arange(lats.size)
+        else:
+            self.points = np.where(~np.asarray(mask, dtype=bool).ravel())[0]
+        self.tree = cKDTree(_to_xyz(lats.ravel()[self.points],
+                                    lons.ravel()[self.points]))
+
+    def __len__(self):
+        return len(self.points)
+
+    @Timer()
+    def query(self, lats, lons, k=1, max_dist=None):
+        """
+        Finds the k nearest gridpoints of many points in one call.
+
+        :param: lats (float/np.array) - latitudes of the points
+        :param: lons (float/np.array) - longitudes of the points
+        :param: k (int) - number of neighbours per point
+        :param: max_dist (float) - farthest neighbour allowed, in km
+        :return: dists, idc (np.ma.array, tuple) - great circle distances in
+                 km and a tuple of grid indices (one masked array per grid
+                 dimension, ready to index data) shaped like the points,
+                 plus a last axis of k if k > 1; neighbours not found within
+                 max_dist are masked
+        """
+        xyz = _to_xyz(lats, lons)
+        pts_shape = xyz.shape[:-1]
+        upper_bound = np.inf
+        if max_dist is not None:
+            upper_bound = 2 * np.sin(
+                min(max_dist / (2. * EARTH_RADIUS), np.pi / 2))
+            upper_bound = np.nextafter(upper_bound, np.inf)
+        chords, tree_idc = self.tree.query(
+            xyz.reshape(-1, 3), k=k, distance_upper_bound=upper_bound)
+
+        missing = tree_idc >= len(self.points)
+        grid_idc = self.points[np.where(missing, 0, tree_idc)]
+        dists = 2 * EARTH_RADIUS * np.arcsin(
+            np.clip(np.where(missing, 0, chords) / 2., 0, 1))
+
+        out_shape = pts_shape + ((k,) if k > 1 else ())
+        missing = missing.reshape(out_shape)
+        dists = np.ma.masked_array(dists.reshape(out_shape), mask=missing)
+        idc = tuple(np.ma.masked_array(dim_idc.reshape(out_shape),
+                                       mask=missing)
+                    for dim_idc in np.unravel_index(grid_idc, self.shape))
+        return dists, idc
+
+
+@Timer()
+def get_grid_tree(lats, lons, mask=None, cache=True):
+    """
+    Builds a GridTree, or reuses one of an identical grid; trees are kept in
+    memory and, if ext.set_coord_cache was given a directory, on disk so
+    later runs skip the build.
+
+    :param: lats (np.array) - 2D latitudes, or 1D for a rectilinear grid
+    :param: lons (np.array) - 2D longitudes, or 1D for a rectilinear grid
+    :param: mask (np.array) - True where gridpoints are left out
+    :param: cache (boolean) - look up and store the tree in the cache
+    :return: grid_tree (GridTree) - spatial index of the grid
+    """
+    if not cache:
+        return GridTree(lats, lons, mask=mask)
+
+    key_hash = hashlib.sha1()
+    for arr in (lats, lons, mask):
+        if arr is None:
+            continue
+        arr = np.ascontiguousarray(np.ma.getdata(arr))
+        key_hash.update('{}{}'.format(arr.dtype, arr.shape).encode('utf-8'))
+        key_hash.update(arr.tobytes())
+    key = ('grid_tree', key_hash.hexdigest())
+
+    grid_tree = _get_cached(TREE_CACHE, key, persist=True)
+    if grid_tree is None:
+        grid_tree = GridTree(lats, lons, mask=mask)
+        _put_cached(TREE_CACHE, key, grid_tree, persist=True)
+    return grid_tree
+
+
+def _wrap_idc(idc, length):
+    """
+    Turns negative indices into their positive equivalents.
+
+    :param: idc (np.array) - indices
+    :param: length (int) - length of the dimension
+    :return: idc (np.array) - indices from 0 to length - 1
+    """
+    if len(idc) > 0 and (idc.min() < -length or idc.max() >= length):
+        print('Indices {} are out of bounds for a dimension of length {}!'
+              .format(idc, length))
+        raise(OutOfRange)
+    return np.where(idc < 0, idc + length, idc)
+
+
+def get_selection(idc, length=None):
+    """
+    Turns the indices of one dimension into the cheapest way to read them:
+    a slice if they are evenly spaced and increasing, else an index array.
+    Negative indices count from the end of the dimension, which needs its
+    length; without it they are left as an index array for read_selection.
+
+    :param: idc (np.array/slice) - indices, boolean mask or slice; None for
+                                   the whole dimension
+    :param: length (int) - length of the dimension
+    :return: selection (slice/np.array) - slice or index array
+    """
+    if idc is None:
+        return slice(None)
+    if isinstance(idc, slice):
+        return idc
+    idc = np.atleast_1d(np.asarray(idc))
+    if idc.dtype == bool:
+        idc = np.flatnonzero(idc)
+    if length is not None:
+        idc = _wrap_idc(idc, length)
+    elif len(idc) > 0 and idc.min() < 0:
+        return idc
+    if len(idc) == 0:
+        return slice(0, 0)
+    if len(idc) == 1:
+        return slice(int(idc[0]), int(idc[0]) + 1)
+    step = int(idc[1] - idc[0])
+    if step > 0 and np.all(np.diff(idc) == step):
+        return slice(int(idc[0]), int(idc[-1]) + 1, step)
+    return idc
+
+
+def read_selection(data, selection):
+    """
+    Reads the selection out of data; slices are taken as views (or one
+    hyperslab read for netCDF4 variables) and index arrays are gathered
+    only from within their bounding slice. Negative indices count from
+    the end of their dimension.
+
+    :param: data (np.ma.array/netCDF4.Variable) - input data
+    :param: selection (tuple) - slice or index array per dimension
+    :return: block (np.ma.array) - selected data
+    """
+    selection = tuple(sel if isinstance(sel, slice)
+                      else _wrap_idc(np.asarray(sel), data.shape[ax])
+                      for ax, sel in enumerate(selection))
+    bounds = tuple(sel if isinstance(sel, slice)
+                   else slice(sel.min(), sel.max() + 1)
+                   for sel in selection)
+    block = data[bounds]
+    for ax, sel in enumerate(selection):
+        if not isinstance(sel, slice):
+            block = block.take(sel - sel.min(), axis=ax)
+    return block
+
+
+class LazyVar(object):
+    """
+    Handle to a netCDF4 variable that reads nothing until asked, and then
+    only the requested hyperslab. Dimensions can be selected by index
+    arrays, masks or slices, or by coordinate bounds; evenly spaced indices
+    are read as one slice per dimension.
+
+    :param: variable (netCDF4.Variable) - unopened variable
+    :param: fi_in (netCDF4.Dataset) - dataset holding coordinate variables
+    :param: roles (dict) - short names (i.e. 'lat', 'lon', 'time') to the
+                           variable's dimension names
+    :param: coord_names (dict) - dimension names to the names of their
+                                 coordinate variables, if these differ
+                                 (i.e. 'lat' to 'latitude')
+    """
+
+    def __init__(self, variable, fi_in=None, roles=None, coord_names=None):
+        self.variable = variable
+        self.fi_in = fi_in
+        self.roles = roles if roles is not None else {}
+        self.coord_names = coord_names if coord_names is not None else {}
+        self.dimensions = tuple(variable.dimensions)
+        self.shape = tuple(variable.shape)
+        self.coords = {}
+
+    def __getitem__(self, key):
+        block = self.variable[key]
+        add_bytes_read(np.ma.getdata(block).nbytes)
+        return block
+
+    def __len__(self):
+        return self.shape[0]
+
+    def get_axis(self, dim):
+        """
+        Finds the axis of a dimension given its name or short name.
+
+        :param: dim (str) - dimension name or short name
+        :return: axis (int) - axis of the dimension
+        """
+        dim = self.roles.get(dim, dim)
+        if dim not in self.dimensions:
+            print('{} is not one of the dimensions {}!'
+                  .format(dim, self.dimensions))
+            raise(MissingDimension)
+        return self.dimensions.index(dim)
+
+    def get_coord(self, dim):
+        """
+        Reads (once) the coordinate variable of a dimension.
+
+        :param: dim (str) - dimension name or short name
+        :return: coord (netCDF4.Variable, np.array) - coordinate variable
+                 and its values
+        """
+        dim = self.dimensions[self.get_axis(dim)]
+        if dim not in self.coords:
+            name = self.coord_names.get(dim, dim)
+            if self.fi_in is None or name not in self.fi_in.variables:
+                print('Unable to find a coordinate variable for {}!'
+                      .format(dim))
+                raise(MissingDimension)
+            coord_var = self.fi_in.variables[name]
+            self.coords[dim] = coord_var, coord_var[:]
+        return self.coords[dim]
+
+    def get_selection(self, idc=None, bounds=None):
+        """
+        Turns indices and coordinate bounds into a selection per dimension.
+
+        :param: idc (dict) - dimension to indices, mask or slice
+        :param: bounds (dict) - dimension to (lower, upper) coordinate
+                                values, inclusive; datetimes are allowed
+                                for a time dimension with units
+        :return: selection (tuple) - slice or index array per dimension
+        """
+        selection = [slice(None)] * len(self.dimensions)
+        if idc is not None:
+            for dim, dim_idc in idc.items():
+                axis = self.get_axis(dim)
+                selection[axis] = get_selection(dim_idc, self.shape[axis])
+        if bounds is not None:
+            for dim, (lower, upper) in bounds.items():
+                coord_var, coord = self.get_coord(dim)
+                if isinstance(lower, datetime.datetime):
+                    lower, upper = date2num(
+                        [lower, upper],
+                        units=coord_var.units,
+                        calendar=getattr(coord_var, 'calendar', 'standard'))
+                dim_idc = np.where((coord >= lower) & (coord <= upper))[0]
+                if len(dim_idc) == 0:
+                    print('Unable to find any {} indices within the range!'
+                          .format(dim))
+                selection[self.get_axis(dim)] = get_selection(dim_idc)
+        return tuple(selection)
+
+    @Timer()
+    def subset(self, idc=None, bounds=None):
+        """
+        Reads only the selected hyperslab from disk.
+
+        :param: idc (dict) - dimension to indices, mask or slice
+        :param: bounds (dict) - dimension to (lower, upper) coordinate values
+        :return: subset (np.ma.array) - selected values
+        """
+        return read_selection(self, self.get_selection(idc=idc,
+                                                       bounds=bounds))
+
+
+@Timer()
+def set_coord_cache(size=128, directory=None):
+    """
+    Configures the coordinate cache used by read_nc. Coordinates and decoded
+    times are kept per file (keyed by path, size and modification time), so
+    a cached file is not even opened unless more than those is asked for.
+    Spatial indices from get_grid_tree are kept per grid as well. The least
+    recently used entries are evicted beyond size.
+
+    :param: size (int) - max number of entries kept in memory; 0 to disable
+    :param: directory (str) - directory to also persist entries in, so they
+                              survive across runs; None to keep in memory
+    """
+    COORD_CACHE_SETTINGS['size'] = size
+    COORD_CACHE_SETTINGS['directory'] = directory
+    if directory is not None and not os.path.isdir(directory):
+        os.makedirs(directory)
+    _trim_cache(COORD_CACHE)
+    _trim_cache(TREE_CACHE)
+
+
+@Timer()
+def clear_coord_cache():
+    """
+    Empties the in-memory coordinate cache; persisted entries are kept.
+    """
+    COORD_CACHE.clear()
+    TREE_CACHE.clear()
+
+
+def _trim_cache(cache):
+    """
+    Evicts the least recently used entries beyond the cache size.
+
+    :param: cache (OrderedDict) - cache to trim
+    """
+    while len(cache) > max(COORD_CACHE_SETTINGS['size'], 0):
+        cache.popitem(last=False)
+
+
+def _get_cache_path(key):
+    """
+    Finds where a cache entry is persisted.
+
+    :param: key (tuple) - cache key
+    :return: cache_path (str) - path of pickled entry; None if not persisting
+    """
+    directory = COORD_CACHE_SETTINGS['directory']
+    if directory is None:
+        return None
+    key_hash = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(directory, '{}.pkl'.format(key_hash))
+
+
+def _get_cached(cache, key, persist=False):
+    """
+    Looks up a cache entry, marking it as recently used.
+
+    :param: cache (OrderedDict) - cache to look in
+    :param: key (tuple) - cache key
+    :param: persist (boolean) - whether to also look on disk
+    :return: value (object) - cached value; None if missing
+    """
+    if COORD_CACHE_SETTINGS['size'] <= 0:
+        return None
+    if key in cache:
+        value = cache.pop(key)
+        cache[key] = value
+        return value
+    cache_path = _get_cache_path(key) if persist else None
+    if cache_path is not None and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'rb') as cache_fi:
+                value = pickle.load(cache_fi)
+        except Exception:
+            return None
+        cache[key] = value
+        _trim_cache(cache)
+        return value
+    return None
+
+
+def _put_cached(cache, key, value, persist=False):
+    """
+    Stores a cache entry, evicting the least recently used if full.
+
+    :param: cache (OrderedDict) - cache to store in
+    :param: key (tuple) - cache key
+    :param: value (object) - value to store
+    :param: persist (boolean) - whether to also write it to disk
+    """
+    if COORD_CACHE_SETTINGS['size'] <= 0:
+        return
+    cache[key] = value
+    _trim_cache(cache)
+    cache_path = _get_cache_path(key) if persist else None
+    if cache_path is not None:
+        with open(cache_path, 'wb') as cache_fi:
+            pickle.dump(value, cache_fi, protocol=2)
+
+
+def _copy(value):
+    """
+    Copies a cached array so callers can modify it freely.
+
+    :param: value (np.array) - cached array or None
+    :return: value (np.array) - copy of the array or None
+    """
+    if value is None:
+        return None
+    return value.copy()
+
+
+def _find_coords(fi_in, lat, lon, time):
+    """
+    Finds the dimension and coordinate variable behind each of lat, lon and
+    time, trying 'latitude' and 'longitude' as well.
+
+    :param: fi_in (netCDF4.Dataset) - opened dataset
+    :param: lat (str) - name of the latitude variable
+    :param: lon (str) - name of the longitude variable
+    :param: time (str) - name of the time variable
+    :return: roles, coord_names (dict, dict) - short names to dimension
+             names, and dimension names to coordinate variable names
+    """
+    roles = {}
+    coord_names = {}
+    for role, names in (('lat', (lat, 'latitude')),
+                        ('lon', (lon, 'longitude')),
+                        ('time', (time,))):
+        for name in names:
+            if name in fi_in.variables:
+                dim = fi_in.variables[name].dimensions[0]
+                roles[role] = dim
+                coord_names[dim] = name
+                break
+    return roles, coord_names
+
+
+@Timer()
 def read_nc(file_path,
             lat='lat',
             lon='lon',
@@ -414,10 +1385,16 @@ def read_nc(file_path,
             extra2=None,
             extra3=None,
             original=False,
-            already=False):
+            already=False,
+            lazy=False,
+            cache=True,
+            dt64=False):
     """
     Reads the netCDF4 file's lats, lons, and time and returns those
-    parameters in addition to an opened netCDF4 dataset.
+    parameters in addition to an opened netCDF4 dataset. If lazy, the
+    extras are returned as LazyVar handles that only read the requested
+    subset from disk (the file is then left open). Coordinates and decoded
+    times are cached per file; see set_coord_cache.
 
     :param: file_path (str) - path to file
     :param: peek (boolean) - print out description of netCDF4 dataset
@@ -427,52 +1404,87 @@ def read_nc(file_path,
     :param: extra3 (str) - return a third variable given name of variable
     :param: already (boolean) - whether lat, lon, time is already imported
                                 if so, only return the extras
+    :param: lazy (boolean) - return the extras as LazyVar handles
+    :param: cache (boolean) - use the coordinate cache
+    :param: dt64 (boolean) - with num2date, decode time to np.datetime64
     :return: fi_in, time, lats, lons
             (netCDF4.Dataset, np.array, np.array, np.array)
             netCDF4 dataset, time array, latitude array, longitude array
     """
+    cached = None
+    if cache and not already:
+        fi_stat = os.stat(file_path)
+        cache_key = (os.path.abspath(file_path),
+                     fi_stat.st_size,
+                     fi_stat.st_mtime,
+                     lat, lon, time, num2date, dt64)
+        cached = _get_cached(COORD_CACHE, cache_key, persist=True)
+        if cached is not None and not (peek or original or
+                                       extra is not None):
+            return tuple(_copy(value) for value in cached)
+
     fi_in = Dataset(file_path, mode='r')
     if peek:
         print(fi_in)
+
+    roles, coord_names = _find_coords(fi_in, lat, lon, time)
+
+    def read_extra(name):
+        if lazy:
+            return LazyVar(fi_in.variables[name], fi_in=fi_in, roles=roles,
+                           coord_names=coord_names)
+        extra_var = fi_in.variables[name][:]
+        add_bytes_read(extra_var.nbytes)
+        return extra_var
+
     if already:
         if extra is not None:
-            extra_var = fi_in.variables[extra][:]
+            extra_var = read_extra(extra)
             if extra2 is not None:
-                extra_var2 = fi_in.variables[extra2][:]
+                extra_var2 = read_extra(extra2)
                 if extra3 is not None:
-                    extra_var3 = fi_in.variables[extra3][:]
+                    extra_var3 = read_extra(extra3)
                     return extra_var, extra_var2, extra_var3
                 return extra_var, extra_var2
             return extra_var
     else:
-        try:
-            lats = fi_in.variables[lat][:]
-            lons = fi_in.variables[lon][:]
-        except:
-            print('Unable to find the given lat, lon variable name!')
-            print('Will try the variable names: "latitude" and "longitude"')
+        if cached is not None:
+            time, lats, lons = [_copy(value) for value in cached]
+        else:
             try:
-                lats = fi_in.variables['latitude'][:]
-                lons = fi_in.variables['longitude'][:]
+                lats = fi_in.variables[lat][:]
+                lons = fi_in.variables[lon][:]
             except:
-                print('Unable to find any lat, lon variable; returning None')
-                lats = None
-                lons = None
-        try:
-            if num2date:
-                time_var = fi_in.variables[time]
-                time = create_dt_arr(time_var)
-            else:
-                time = fi_in.variables[time][:]
-        except:
-            print('Unable to create time variable; returning None')
-            time = None
+                print('Unable to find the given lat, lon variable name!')
+                print('Will try the variable names: '
+                      '"latitude" and "longitude"')
+                try:
+                    lats = fi_in.variables['latitude'][:]
+                    lons = fi_in.variables['longitude'][:]
+                except:
+                    print('Unable to find any lat, lon variable; '
+                          'returning None')
+                    lats = None
+                    lons = None
+            try:
+                if num2date:
+                    time_var = fi_in.variables[time]
+                    time = create_dt_arr(time_var, dt64=dt64)
+                else:
+                    time = fi_in.variables[time][:]
+            except:
+                print('Unable to create time variable; returning None')
+                time = None
+            if cache:
+                _put_cached(COORD_CACHE, cache_key,
+                            (_copy(time), _copy(lats), _copy(lons)),
+                            persist=True)
         if extra is not None:
-            extra_var = fi_in.variables[extra][:]
+            extra_var = read_extra(extra)
             if extra2 is not None:
-                extra_var2 = fi_in.variables[extra2][:]
+                extra_var2 = read_extra(extra2)
                 if extra3 is not None:
-                    extra_var3 = fi_in.variables[extra3][:]
+                    extra_var3 = read_extra(extra3)
                     return time, lats, lons, extra_var, extra_var2, extra_var3
                 return time, lats, lons, extra_var, extra_var2
             return time, lats, lons, extra_var
@@ -483,6 +1495,210 @@ def read_nc(file_path,
             return time, lats, lons
 
 
+class MultiFileVar(object):
+    """
+    Virtual concatenation of a variable along time over many files, i.e.
+    daily files of one series. Nothing is copied or written; any read is
+    routed to the files that hold the requested time steps, which are
+    opened only for that read. Every file must share the grid (the
+    dimensions other than time) of the first one. Can be sliced like a
+    netCDF4 variable and passed to functions that read in blocks (i.e.
+    sci.get_scores).
+
+    :param: file_paths (list) - paths of files, in time order
+    :param: var_name (str) - name of the variable
+    :param: lat (str) - name of the latitude variable
+    :param: lon (str) - name of the longitude variable
+    :param: time (str) - name of the time (record) variable
+    """
+
+    def __init__(self, file_paths, var_name,
+                 lat='lat', lon='lon', time='time'):
+        if len(file_paths) == 0:
+            print('No files were given!')
+            raise(OutOfRange)
+        self.file_paths = list(file_paths)
+        self.var_name = var_name
+        self.time_name = time
+
+        self.times = []
+        self.lens = []
+        for file_path in self.file_paths:
+            fi_in, times, lats, lons = read_nc(file_path,
+                                               lat=lat,
+                                               lon=lon,
+                                               time=time,
+                                               num2date=True,
+                                               original=True)
+            try:
+                variable = fi_in.variables[var_name]
+                if len(self.lens) == 0:
+                    self.lats = lats
+                    self.lons = lons
+                    roles, coord_names = _find_coords(fi_in, lat, lon, time)
+                    roles['time'] = variable.dimensions[0]
+                    self.template = LazyVar(variable, fi_in=fi_in,
+                                            roles=roles,
+                                            coord_names=coord_names)
+                    for dim in self.template.dimensions[1:]:
+                        if coord_names.get(dim, dim) in fi_in.variables:
+                            self.template.get_coord(dim)
+                    self.template.fi_in = None
+                elif (tuple(variable.dimensions[1:]) !=
+                      self.template.dimensions[1:] or
+                      tuple(variable.shape[1:]) != self.template.shape[1:]):
+                    print('{} has dimensions {} shaped {}, unlike {} '
+                          'shaped {} in {}!'
+                          .format(file_path, variable.dimensions[1:],
+                                  variable.shape[1:],
+                                  self.template.dimensions[1:],
+                                  self.template.shape[1:],
+                                  self.file_paths[0]))
+                    raise(MissingDimension)
+                self.lens.append(variable.shape[0])
+                self.times.append(times)
+            finally:
+                fi_in.close()
+
+        self.offsets = np.concatenate(([0], np.cumsum(self.lens)))
+        self.dimensions = self.template.dimensions
+        self.shape = (int(self.offsets[-1]),) + self.template.shape[1:]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def get_times(self):
+        """
+        Gets the concatenated, decoded time axis.
+
+        :return: times (np.array) - array of datetimes
+        """
+        return np.concatenate(self.times)
+
+    def _read_file(self, file_idx, local_idc, rest):
+        """
+        Reads the given time indices of one file.
+
+        :param: file_idx (int) - index of the file
+        :param: local_idc (np.array) - time indices within the file
+        :param: rest (tuple) - keys of the other dimensions
+        :return: block (np.ma.array) - values read
+        """
+        fi_in = Dataset(self.file_paths[file_idx], mode='r')
+        try:
+            variable = fi_in.variables[self.var_name]
+            sel = get_selection(local_idc)
+            if isinstance(sel, slice):
+                block = variable[(sel,) + rest]
+            else:
+                bounds = slice(sel.min(), sel.max() + 1)
+                block = variable[(bounds,) + rest].take(sel - sel.min(),
+                                                       axis=0)
+            add_bytes_read(block.nbytes)
+            return block
+        finally:
+            fi_in.close()
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) == 0 or key[0] is Ellipsis:
+            key = (slice(None),) + key
+        time_key, rest = key[0], tuple(key[1:])
+
+        if isinstance(time_key, (int, np.integer)):
+            if time_key < 0:
+                time_key += len(self)
+            if time_key < 0 or time_key >= len(self):
+                print('Time index {} is out of range!'.format(key[0]))
+                raise(OutOfRange)
+            return self[(slice(time_key, time_key + 1),) + rest][0]
+
+        if isinstance(time_key, slice):
+            time_idc = np.arange(*time_key.indices(len(self)))
+        else:
+            time_idc = np.atleast_1d(np.asarray(time_key))
+            if time_idc.dtype == bool:
+                time_idc = np.flatnonzero(time_idc)
+            time_idc = np.where(time_idc < 0, time_idc + len(self), time_idc)
+
+        if len(time_idc) == 0:
+            return self._read_file(0, np.zeros(0, dtype=int), rest)
+
+        file_idc = np.searchsorted(self.offsets, time_idc, side='right') - 1
+        breaks = np.flatnonzero(np.diff(file_idc)) + 1
+        blocks = []
+        for run in np.split(np.arange(len(time_idc)), breaks):
+            file_idx = file_idc[run[0]]
+            local_idc = time_idc[run] - self.offsets[file_idx]
+            blocks.append(self._read_file(file_idx, local_idc, rest))
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.ma.concatenate(blocks, axis=0)
+
+    def get_selection(self, idc=None, bounds=None):
+        """
+        Turns indices and coordinate bounds into a selection per dimension;
+        time bounds are compared against the decoded datetimes.
+
+        :param: idc (dict) - dimension to indices, mask or slice
+        :param: bounds (dict) - dimension to (lower, upper) coordinate values
+        :return: selection (tuple) - slice or index array per dimension
+        """
+        bounds = dict(bounds) if bounds is not None else {}
+        time_bounds = None
+        for dim in list(bounds):
+            if self.template.get_axis(dim) == 0:
+                time_bounds = bounds.pop(dim)
+        selection = list(self.template.get_selection(idc=idc,
+                                                     bounds=bounds))
+        if time_bounds is not None:
+            lower, upper = time_bounds
+            times = self.get_times()
+            time_idc = np.where((times >= lower) & (times <= upper))[0]
+            if len(time_idc) == 0:
+                print('Unable to find any times indices within the range!')
+            selection[0] = get_selection(time_idc)
+        return tuple(selection)
+
+    @Timer()
+    def subset(self, idc=None, bounds=None):
+        """
+        Reads only the selected hyperslab from the files that hold it.
+
+        :param: idc (dict) - dimension to indices, mask or slice
+        :param: bounds (dict) - dimension to (lower, upper) coordinate values
+        :return: subset (np.ma.array) - selected values
+        """
+        return read_selection(self, self.get_selection(idc=idc,
+                                                       bounds=bounds))
+
+
+@Timer()
+def read_mfnc(glob_str, var_name, directory='./',
+              lat='lat', lon='lon', time='time'):
+    """
+    Opens every netCDF file matching glob_str as one virtual variable
+    concatenated along time, without writing a concatenated file like
+    pre.concat_nc.
+
+    :param: glob_str (str) - the naming pattern of the files
+    :param: var_name (str) - name of the variable
+    :param: directory (str) - directory of files
+    :param: lat (str) - name of the latitude variable
+    :param: lon (str) - name of the longitude variable
+    :param: time (str) - name of the time (record) variable
+    :return: time, lats, lons, mf_var
+             (np.array, np.array, np.array, MultiFileVar)
+             datetime array, latitude array, longitude array, virtual variable
+    """
+    fi_dir = os.path.join(directory, glob_str)
+    file_paths = sorted(glob.glob(fi_dir))
+    mf_var = MultiFileVar(file_paths, var_name, lat=lat, lon=lon, time=time)
+    return mf_var.get_times(), mf_var.lats, mf_var.lons, mf_var
+
+
+@Timer()
 def export_nc(lat, lon, var_list, name_list, units_list,
               out='untitled', time=None, z=None, description=None,
               format='NETCDF3_64BIT', time_name='time', z_name='z',
@@ -526,9 +1742,9 @@ def export_nc(lat, lon, var_list, name_list, units_list,
         fi_out.createDimension(time_name, len(time))
         fi_out_time = fi_out.createVariable(time_name, 'f4', (time_name,))
         fi_out_time.units = time_units
-        if time_units is 'unknown':
+        if time_units == 'unknown':
             print('\nPlease set time_units; defaulting to unknown\n')
-        if time_calendar is not 'unknown':
+        if time_calendar != 'unknown':
             fi_out_time.calendar = time_calendar
         fi_out_time[:] = time
 
@@ -581,57 +1797,317 @@ def export_nc(lat, lon, var_list, name_list, units_list,
     fi_out.close()
 
 
-def create_dt_arr(time_var, calendar='standard'):
+class NCWriter(object):
+    """
+    Writes a netCDF file one time step at a time along an unlimited time
+    dimension, so only one step has to be in memory. If the file already
+    exists it is opened for appending, and time steps that are not after
+    the last one written are skipped, so re-running with new days only
+    adds the new days. NETCDF4 formats support zlib/shuffle compression
+    and chunk sizes.
+
+    :param: out (str) - name of output file (without .nc)
+    :param: lat (np.array) - array of latitudes
+    :param: lon (np.array) - array of longitudes
+    :param: name_list (list) - list of variable names in string
+    :param: units_list (list) - list of units names in string
+    :param: z (np.array) - z/level/depth variable
+    :param: description (str) - description of data
+    :param: format (str) - output format
+    :param: time_name (str) - what to name the time variable
+    :param: z_name (str) - what to name the z variable
+    :param: lat_units (str) - units of latitude
+    :param: lon_units (str) - units of longitude
+    :param: time_units (str) - units of time
+    :param: z_units (str) - units of z
+    :param: time_calendar (str) - type of calendar
+    :param: dtype (str) - data type of the variables
+    :param: zlib (boolean) - compress the variables (NETCDF4 only)
+    :param: complevel (int) - compression level from 1 to 9
+    :param: shuffle (boolean) - shuffle bytes before compressing
+    :param: chunksizes (tuple) - chunk sizes of the variables; defaults to
+                                 one time step
+    :param: fill_value (float) - fill value of the variables
+    """
+
+    def __init__(self, out, lat, lon, name_list, units_list,
+                 z=None, description=None, format='NETCDF4',
+                 time_name='time', z_name='z',
+                 lat_units='degrees_north', lon_units='degrees_east',
+                 time_units='unknown', z_units='unknown',
+                 time_calendar='unknown', dtype='f4',
+                 zlib=False, complevel=4, shuffle=True,
+                 chunksizes=None, fill_value=None):
+        self.output_fi_name = '{}.nc'.format(out)
+        self.name_list = list(name_list)
+        self.time_name = time_name
+        self.time_units = time_units
+        self.time_calendar = time_calendar
+
+        if os.path.isfile(self.output_fi_name):
+            self.fi_out = Dataset(self.output_fi_name, 'a')
+            for name in [time_name] + self.name_list:
+                if name not in self.fi_out.variables:
+                    self.fi_out.close()
+                    print('\n{} is missing from existing {}!\n'
+                          .format(name, self.output_fi_name))
+                    raise(FileExists)
+            self.time_units = getattr(self.fi_out.variables[time_name],
+                                      'units', time_units)
+            self.time_calendar = getattr(self.fi_out.variables[time_name],
+                                         'calendar', time_calendar)
+            return
+
+        if zlib and not format.startswith('NETCDF4'):
+            print('\nCompression needs a NETCDF4 format; not compressing\n')
+            zlib = False
+
+        fi_out = Dataset(self.output_fi_name, 'w', format=format)
+        self.fi_out = fi_out
+
+        if description is not None:
+            fi_out.description = description
+
+        fi_out.createDimension(time_name, None)
+        fi_out_time = fi_out.createVariable(time_name, 'f8', (time_name,))
+        fi_out_time.units = time_units
+        if time_units == 'unknown':
+            print('\nPlease set time_units; defaulting to unknown\n')
+        if time_calendar != 'unknown':
+            fi_out_time.calendar = time_calendar
+
+        dims = (time_name,)
+        if z is not None:
+            fi_out.createDimension(z_name, len(z))
+            fi_out_z = fi_out.createVariable(z_name, 'f4', (z_name,))
+            fi_out_z.units = z_units
+            if z_units == 'unknown':
+                print('\nPlease set z_units; defaulting to unknown\n')
+            fi_out_z[:] = z
+            dims += (z_name,)
+
+        fi_out.createDimension('lat', len(lat))
+        fi_out_lat = fi_out.createVariable('latitude', 'f4', ('lat',))
+        fi_out_lat.units = lat_units
+        fi_out_lat[:] = lat
+
+        fi_out.createDimension('lon', len(lon))
+        fi_out_lon = fi_out.createVariable('longitude', 'f4', ('lon',))
+        fi_out_lon.units = lon_units
+        fi_out_lon[:] = lon
+        dims += ('lat', 'lon')
+
+        if chunksizes is None and format.startswith('NETCDF4'):
+            chunksizes = (1,) + tuple(len(fi_out.dimensions[dim])
+                                      for dim in dims[1:])
+        elif not format.startswith('NETCDF4'):
+            chunksizes = None
+
+        for name, units in zip(self.name_list, units_list):
+            fi_out_var = fi_out.createVariable(name, dtype, dims,
+                                               zlib=zlib,
+                                               complevel=complevel,
+                                               shuffle=shuffle,
+                                               chunksizes=chunksizes,
+                                               fill_value=fill_value)
+            fi_out_var.units = units
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.fi_out.variables[self.time_name])
+
+    @Timer()
+    def write(self, time, var_list):
+        """
+        Appends one time step; skipped if time is not after the last one
+        written.
+
+        :param: time (float/datetime.datetime) - time of the step; datetimes
+                                                 are converted with time_units,
+                                                 which have to be set
+        :param: var_list (list) - one np.array per variable, shaped
+                                  (lat, lon) or (z, lat, lon)
+        :return: written (boolean) - whether the step was written
+        """
+        if isinstance(time, datetime.datetime):
+            if ' since ' not in self.time_units:
+                print('Unable to write datetimes with time_units {}; set '
+                      'them like "hours since 1970-01-01"!'
+                      .format(self.time_units))
+                raise(Unsupported)
+            calendar = self.time_calendar
+            if calendar == 'unknown':
+                calendar = 'standard'
+            time = date2num(time, units=self.time_units, calendar=calendar)
+        fi_out_time = self.fi_out.variables[self.time_name]
+        len_time = len(fi_out_time)
+        if len_time > 0 and time <= fi_out_time[len_time - 1]:
+            return False
+        fi_out_time[len_time] = time
+        for var, name in zip(var_list, self.name_list):
+            self.fi_out.variables[name][len_time] = var
+        return True
+
+    @Timer()
+    def write_all(self, steps):
+        """
+        Appends every (time, var_list) from an iterable or generator.
+
+        :param: steps (iterable) - (time, var_list) of each time step
+        :return: count (int) - number of time steps written
+        """
+        count = 0
+        for step_time, var_list in steps:
+            count += self.write(step_time, var_list)
+        return count
+
+    def sync(self):
+        """
+        Flushes what has been written so far to disk.
+        """
+        self.fi_out.sync()
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        if self.fi_out.isopen():
+            self.fi_out.close()
+
+
+@Timer()
+def num2dt64(nums, units, calendar='proleptic_gregorian'):
+    """
+    Converts numeric times to np.datetime64 with array arithmetic instead
+    of building a datetime object per element. Only valid for the standard
+    (proleptic) Gregorian calendar; masked times become NaT. Singular and
+    abbreviated units (i.e. 'hour', 'hr', 'd') are accepted; units not
+    in TIME_UNITS_US fall back to num2date with the given calendar.
+
+    :param: nums (np.array) - numeric times
+    :param: units (str) - CF time units (i.e. 'hours since 1900-01-01')
+    :param: calendar (str) - one of DT64_CALENDARS
+    :return: datetime_array (np.array) - array of np.datetime64[us]
+    """
+    nums = np.ma.asarray(nums)
+    mask = np.ma.getmaskarray(nums)
+
+    step = units.split(' since ')[0].strip().lower()
+    step = TIME_UNIT_ALIASES.get(step, step)
+    if step not in TIME_UNITS_US and step + 's' in TIME_UNITS_US:
+        step += 's'
+    if step not in TIME_UNITS_US:
+        try:
+            dates = num2date(np.ma.filled(nums, 0), units=units,
+                             calendar=calendar,
+                             only_use_cftime_datetimes=False)
+        except Exception as e:
+            print('Unable to decode time units {} due to this error\n{}'
+                  .format(units, e))
+            raise(OutOfRange)
+        datetime_array = np.asarray(dates).astype('datetime64[us]')
+        datetime_array[mask] = np.datetime64('NaT')
+        return datetime_array
+
+    ref_dt = num2date(0, units=units, calendar=calendar,
+                      only_use_cftime_datetimes=False)
+    ref_dt64 = np.datetime64(ref_dt, 'us')
+
+    offsets = np.ma.filled(nums.astype(float), 0) * TIME_UNITS_US[step]
+    datetime_array = ref_dt64 + np.round(offsets).astype(np.int64) \
+        .astype('timedelta64[us]')
+    datetime_array[mask] = np.datetime64('NaT')
+    return datetime_array
+
+
+@Timer()
+def create_dt_arr(time_var, calendar='standard', dt64=False):
     """
     Creates a datetime array based on an unopened time variable.
 
     :param: time_var (netCDF4.Variable) - unopened time variable
-    :param: calendar (str) - type of calendar
+    :param: calendar (str) - type of calendar, used if time_var has none
+                             or it cannot be decoded with its own
+    :param: dt64 (boolean) - decode to np.datetime64 arithmetically; only
+                             for Gregorian calendars, else falls back
     :return: datetime_array (np.array) - array of datetimes
     """
+    var_calendar = getattr(time_var, 'calendar', calendar)
+    if dt64:
+        if var_calendar.lower() in DT64_CALENDARS:
+            return num2dt64(time_var[:], time_var.units,
+                            calendar=var_calendar.lower())
+        print('Unable to use datetime64 with the {} calendar; '
+              'using num2date'.format(var_calendar))
     try:
         datetime_array = num2date(
-            time_var[:], units=time_var.units, calendar=time_var.calendar)
+            time_var[:], units=time_var.units, calendar=var_calendar)
     except:
         datetime_array = num2date(
             time_var[:], units=time_var.units, calendar=calendar)
     return datetime_array
 
 
+@Timer()
 def dt2jul(dt):
     """
-    Return julian day out of a datetime.
+    Return julian day out of a datetime, or an array of julian days out of
+    an array of datetimes; datetime.datetime and np.datetime64 values are
+    converted arithmetically, cftime ones use their own calendar.
 
-    :param: dt (datetime.datetime/int) - datetime
-    :return: jday (int) - julian day
+    :param: dt (datetime.datetime/np.datetime64/np.array) - datetime(s)
+    :return: jday (int/np.array) - julian day(s); an int for a scalar
     """
-    return dt.timetuple().tm_yday
-
-
+    if isinstance(dt, datetime.datetime):
+        return dt.timetuple().tm_yday
+    dt = np.asanyarray(dt)
+    if not np.issubdtype(dt.dtype, np.datetime64):
+        if dt.size > 0 and not isinstance(dt.flat[0], datetime.datetime):
+            jday = np.array([getattr(d, 'dayofyr', None) or
+                             d.timetuple().tm_yday for d in dt.ravel()],
+                            dtype=np.int64).reshape(dt.shape)
+            return int(jday) if jday.ndim == 0 else jday
+        dt = dt.astype('datetime64[us]')
+    dt_day = dt.astype('datetime64[D]')
+    year_start = dt.astype('datetime64[Y]').astype('datetime64[D]')
+    jday = (dt_day - year_start).astype(np.int64) + 1
+    return int(jday) if jday.ndim == 0 else jday
+
+
+@Timer()
 def jul2dt(jday, year):
     """
-    Find the datetime from a julian date.
+    Find the datetime from a julian date. Arrays of julian days and years
+    are converted together into an np.datetime64 array.
 
-    :param: jday (int) - julian day
-    :param: year (int) - year to determine if leap
-    :return: dt (datetime.datetime) - respective datetime
+    :param: jday (int/np.array) - julian day(s)
+    :param: year (int/np.array) - year(s) to determine if leap
+    :return: dt (datetime.datetime/np.array) - respective datetime(s)
     """
-    if calendar.isleap(year):
-        cal = pd.read_csv('./data/jd_cal_leap.csv')
-        if jday < 1 or jday > 366:
+    scalar = np.isscalar(jday) and np.isscalar(year)
+    jday = np.asarray(jday, dtype=np.int64)
+    year = np.asarray(year, dtype=np.int64)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    out_of_range = (jday < 1) | (jday > 365 + leap)
+    if np.any(out_of_range):
+        if np.all(leap[out_of_range] if leap.ndim else leap):
             print('\nInput Julian day is out of 1-366 range!\n')
-            raise(OutOfRange)
-    else:
-        if jday < 1 or jday > 365:
+        else:
             print('\nInput Julian day is out of 1-365 range!\n')
-            raise(OutOfRange)
-        cal = pd.read_csv('./data/jd_cal.csv')
-    jday_idc = np.where(cal == jday)
-    mth = jday_idc[1][0] + 1
-    day = jday_idc[0][0] + 1
-    return datetime.datetime(year, mth, day)
+        raise(OutOfRange)
+    dt = (year - 1970).astype('datetime64[Y]').astype('datetime64[D]') + \
+        (jday - 1).astype('timedelta64[D]')
+    if scalar:
+        return datetime.datetime.combine(dt.item(), datetime.time())
+    return dt
 
 
+@Timer()
 def dtnow():
     """
     Get current UTC in datetime.
@@ -640,6 +2116,8 @@ def dtnow():
     """
     return datetime.datetime.utcnow()
 
+
+@Timer()
 def clockit(start, n=''):
     """
     Print out elapsed time since start.
@@ -1,36 +1,832 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, urljoin, unquote, quote
+import http.client
+import fnmatch
+import hashlib
+import ftplib
+import base64
+import json
+import netrc
+import queue
+import time
 import glob
 import os
 
+from ahh import ext, profiler
+
 __author__ = 'huang.andrew12@gmail.com'
 __copyright__ = 'Andrew Huang'
 
+DOWNLOAD_CHUNK_SIZE = 2 ** 20
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21}
+SCHEMES = ('http', 'https', 'ftp')
+VERIFY_MODES = ('size', 'checksum', None)
+MANIFEST_NAME = '.ahh_manifest.json'
+
+
+class Unsupported(Exception):
+    pass
+
+
+class DownloadError(Exception):
+    pass
+
+
+class _PermanentError(DownloadError):
+    pass
+
+
+class _LinkParser(HTMLParser):
+    """
+    Collects the links of a directory listing page.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.links = []
 
-def wget_fi(base_url, glob_str, user=None, pwd=None, directory=None):
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.links.append(value)
+
+
+class Downloader(object):
     """
-    Wrapper of wget; downloads files that matches the given glob_str. Can input
-    username and password if authentication is required.
+    Fetches files of a remote HTTP(S) or FTP directory concurrently over a
+    bounded pool of reused connections (one per worker at most). Partial
+    downloads are kept as .part files and resumed with HTTP range requests
+    or FTP REST; failed attempts are retried with exponential backoff.
+    HTTP redirects are followed, up to MAX_REDIRECTS at a time.
+    Credentials are sent as HTTP basic auth or an FTP login, never on a
+    command line, and are looked up in ~/.netrc if not given; basic auth
+    is not sent to hosts the server redirects to.
 
     :param: base_url (str) - the dir of all the to be downloaded files
-    :param: glob_str (str) - the naming pattern of the files
     :param: user (str) - username
     :param: pwd (str) - password
+    :param: workers (int) - number of concurrent downloads and connections
+    :param: retries (int) - retries per file after the first attempt
+    :param: backoff (float) - seconds to wait before the first retry,
+                              doubled for each retry after
+    :param: timeout (float) - seconds to wait on the network
+    """
+
+    def __init__(self, base_url, user=None, pwd=None, workers=4, retries=3,
+                 backoff=1., timeout=60.):
+        if not base_url.endswith('/'):
+            base_url += '/'
+        url_parts = urlsplit(base_url)
+        if url_parts.scheme not in SCHEMES:
+            print('Scheme of {} is not one of {}!'.format(base_url, SCHEMES))
+            raise(Unsupported)
+        self.base_url = base_url
+        self.scheme = url_parts.scheme
+        self.host = url_parts.hostname
+        self.port = url_parts.port
+        self.path = url_parts.path
+        if user is None and pwd is None:
+            try:
+                auth = netrc.netrc().authenticators(self.host)
+            except (IOError, netrc.NetrcParseError):
+                auth = None
+            if auth is not None:
+                user, pwd = auth[0], auth[2]
+        self.user = user
+        self.pwd = pwd
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.pool = queue.LifoQueue()
+        self.stats = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _connect(self, url_parts=None):
+        """
+        Opens a new connection to the host.
+
+        :param: url_parts (urllib.parse.SplitResult) - another HTTP(S) host
+                                                      to connect to instead
+        :return: conn (http.client.HTTPConnection/ftplib.FTP) - connection
+        """
+        if url_parts is not None:
+            scheme, host, port = (url_parts.scheme, url_parts.hostname,
+                                  url_parts.port)
+        else:
+            scheme, host, port = self.scheme, self.host, self.port
+        if scheme == 'ftp':
+            conn = ftplib.FTP(timeout=self.timeout)
+            conn.connect(host, port or 21)
+            conn.login(self.user or 'anonymous', self.pwd or '')
+            conn.voidcmd('TYPE I')
+            return conn
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port,
+                                               timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _is_origin(self, url_parts):
+        """
+        Checks whether a URL is on the same scheme, host and port as the
+        base URL.
+
+        :param: url_parts (urllib.parse.SplitResult) - split URL
+        :return: same (boolean) - whether it is the same origin
+        """
+        return (url_parts.scheme == self.scheme and
+                url_parts.hostname == self.host and
+                (url_parts.port or DEFAULT_PORTS[url_parts.scheme]) ==
+                (self.port or DEFAULT_PORTS[self.scheme]))
+
+    def _acquire(self):
+        try:
+            return self.pool.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _release(self, conn):
+        self.pool.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Closes all pooled connections.
+        """
+        while True:
+            try:
+                self._discard(self.pool.get_nowait())
+            except queue.Empty:
+                break
+
+    def _send(self, conn, path, headers, method):
+        """
+        Sends one request, reconnecting once if the server dropped an
+        idle connection.
+
+        :param: conn (http.client.HTTPConnection) - connection
+        :param: path (str) - quoted path on the host
+        :param: headers (dict) - request headers
+        :param: method (str) - 'GET' or 'HEAD'
+        :return: response (http.client.HTTPResponse) - server response
+        """
+        try:
+            conn.request(method, path, headers=headers)
+            return conn.getresponse()
+        except (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                ConnectionResetError, BrokenPipeError):
+            conn.close()
+            conn.request(method, path, headers=headers)
+            return conn.getresponse()
+
+    def _request(self, conn, path, headers=None, method='GET'):
+        """
+        Sends a request, following redirects. Redirects on the same host
+        reuse conn; others get a connection of their own, which is closed
+        once the response is read. Basic auth only goes to the base host.
+
+        :param: conn (http.client.HTTPConnection) - pooled connection
+        :param: path (str) - quoted path on the host
+        :param: headers (dict) - extra request headers
+        :param: method (str) - 'GET' or 'HEAD'
+        :return: response (http.client.HTTPResponse) - server response,
+                 with the URL it finally came from as response.url
+        """
+        url = urljoin(self.base_url, path)
+        for _ in range(MAX_REDIRECTS + 1):
+            url_parts = urlsplit(url)
+            request_headers = dict(headers or {})
+            if self._is_origin(url_parts):
+                if self.user is not None:
+                    credentials = '{}:{}'.format(self.user, self.pwd or '')
+                    request_headers['Authorization'] = 'Basic {}'.format(
+                        base64.b64encode(credentials.encode('utf-8'))
+                        .decode('ascii'))
+                response = self._send(conn, path, request_headers, method)
+            else:
+                request_headers['Connection'] = 'close'
+                response = self._send(self._connect(url_parts), path,
+                                      request_headers, method)
+            location = response.getheader('Location')
+            if response.status not in REDIRECT_STATUSES or location is None:
+                response.url = url
+                return response
+            response.read()
+            url = urljoin(url, location)
+            url_parts = urlsplit(url)
+            if url_parts.scheme not in ('http', 'https'):
+                raise(_PermanentError('Cannot follow a redirect to {}'
+                                      .format(url)))
+            path = url_parts.path or '/'
+            if url_parts.query:
+                path = '{}?{}'.format(path, url_parts.query)
+        raise(_PermanentError('Stopped after {} redirects at {}'
+                              .format(MAX_REDIRECTS, url)))
+
+    def _check_status(self, response, expected=(200,)):
+        """
+        Raises if the response is not one of the expected statuses, in a way
+        that tells apart the errors worth retrying.
+
+        :param: response (http.client.HTTPResponse) - server response
+        :param: expected (tuple) - acceptable statuses
+        """
+        if response.status in expected:
+            return
+        response.read()
+        message = 'HTTP {} {}'.format(response.status, response.reason)
+        if response.status in RETRY_STATUSES:
+            raise(DownloadError(message))
+        raise(_PermanentError(message))
+
+    def _retry(self, func, *args):
+        """
+        Runs func with a pooled connection, retrying with backoff.
+
+        :param: func (function) - called as func(conn, *args)
+        :return: value, attempts (object, int) - value of func and attempts
+        """
+        for attempt in range(self.retries + 1):
+            conn = None
+            try:
+                conn = self._acquire()
+                value = func(conn, *args)
+            except _PermanentError as error:
+                self._release(conn)
+                error.attempts = attempt + 1
+                raise
+            except ftplib.error_perm as error:
+                self._discard(conn)
+                error = _PermanentError(str(error))
+                error.attempts = attempt + 1
+                raise(error)
+            except (DownloadError, OSError, EOFError,
+                    http.client.HTTPException, ftplib.Error) as error:
+                if conn is not None:
+                    self._discard(conn)
+                if attempt == self.retries:
+                    error.attempts = attempt + 1
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+            else:
+                self._release(conn)
+                return value, attempt + 1
+
+    def _list_files(self, conn):
+        if self.scheme == 'ftp':
+            conn.cwd(self.path)
+            try:
+                names = []
+                for name, facts in conn.mlsd(facts=['type', 'size',
+                                                    'modify']):
+                    if facts.get('type', 'file') != 'file':
+                        continue
+                    names.append(name)
+                    self.stats[name] = {
+                        'size': int(facts['size']) if 'size' in facts
+                        else None,
+                        'mtime': facts.get('modify'),
+                        'etag': None}
+                return names
+            except ftplib.error_perm:
+                return [os.path.basename(name) for name in conn.nlst()]
+        response = self._request(conn, quote(self.path))
+        self._check_status(response)
+        parser = _LinkParser()
+        parser.feed(response.read().decode('utf-8', 'replace'))
+        list_path = urlsplit(response.url).path
+        names = []
+        for link in parser.links:
+            link_path = urlsplit(urljoin(response.url, link)).path
+            if os.path.dirname(link_path) + '/' == list_path:
+                names.append(unquote(os.path.basename(link_path)))
+        return names
+
+    @profiler.Timer()
+    def list_files(self, glob_str='*'):
+        """
+        Lists the remote files matching glob_str, from the HTTP directory
+        page or the FTP listing.
+
+        :param: glob_str (str) - the naming pattern of the files
+        :return: names (list) - sorted matching file names
+        """
+        names = self._retry(self._list_files)[0]
+        return sorted(set(name for name in names
+                          if name and fnmatch.fnmatch(name, glob_str)))
+
+    def _get_meta(self, response, offset=0):
+        """
+        Reads the size, modification time and ETag of a remote file from the
+        headers of a response.
+
+        :param: response (http.client.HTTPResponse) - server response
+        :param: offset (int) - first byte requested
+        :return: meta (dict) - size, mtime and etag; None where unknown
+        """
+        size = None
+        content_range = response.getheader('Content-Range')
+        content_length = response.getheader('Content-Length')
+        if content_range is not None and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            if total.isdigit():
+                size = int(total)
+        elif content_length is not None and response.status in (200, 206):
+            size = int(content_length) + (offset
+                                          if response.status == 206 else 0)
+        return {'size': size,
+                'mtime': response.getheader('Last-Modified'),
+                'etag': response.getheader('ETag')}
+
+    def _stat_file(self, conn, name):
+        if name in self.stats:
+            return dict(self.stats[name])
+        if self.scheme == 'ftp':
+            conn.cwd(self.path)
+            meta = {'size': None, 'mtime': None, 'etag': None}
+            try:
+                meta['size'] = conn.size(name)
+                meta['mtime'] = conn.sendcmd(
+                    'MDTM {}'.format(name)).split()[-1]
+            except ftplib.error_perm:
+                pass
+            return meta
+        response = self._request(conn, quote(self.path + name),
+                                 method='HEAD')
+        self._check_status(response)
+        response.read()
+        return self._get_meta(response)
+
+    @profiler.Timer()
+    def stat(self, name):
+        """
+        Finds the size, modification time and ETag of a remote file without
+        downloading it, from an HTTP HEAD request or the FTP listing.
+
+        :param: name (str) - remote file name
+        :return: meta (dict) - size, mtime and etag; None where unknown
+        """
+        return self._retry(self._stat_file, name)[0]
+
+    def _fetch_file(self, conn, name, part_path, meta, validator=None):
+        """
+        Downloads one file into part_path, resuming from its current size.
+
+        :param: conn (http.client.HTTPConnection/ftplib.FTP) - connection
+        :param: name (str) - remote file name
+        :param: part_path (str) - local partial file
+        :param: meta (dict) - filled with the remote size, mtime and etag
+        :param: validator (str) - ETag or Last-Modified the partial file
+                                  was downloaded with; if the remote file
+                                  no longer matches it, start over
+        :return: nbytes (int) - bytes received
+        """
+        offset = 0
+        if os.path.isfile(part_path):
+            offset = os.path.getsize(part_path)
+
+        if self.scheme == 'ftp':
+            meta.update(self._stat_file(conn, name))
+            nbytes = [0]
+            with open(part_path, 'ab' if offset else 'wb') as fi_out:
+                def write(block):
+                    fi_out.write(block)
+                    nbytes[0] += len(block)
+                conn.retrbinary('RETR {}'.format(name), write,
+                                blocksize=DOWNLOAD_CHUNK_SIZE,
+                                rest=offset or None)
+            return nbytes[0]
+
+        headers = {}
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
+            if validator is not None:
+                headers['If-Range'] = validator
+        response = self._request(conn, quote(self.path + name), headers)
+        if response.status == 416 and offset:
+            response.read()
+            meta.update(self._get_meta(response, offset))
+            return 0
+        self._check_status(response, expected=(200, 206))
+        meta.update(self._get_meta(response, offset))
+        mode = 'ab' if response.status == 206 else 'wb'
+        expected = response.getheader('Content-Length')
+        nbytes = 0
+        with open(part_path, mode) as fi_out:
+            while True:
+                block = response.read(DOWNLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                fi_out.write(block)
+                nbytes += len(block)
+        if expected is not None and nbytes != int(expected):
+            raise(DownloadError('Received {} of {} bytes'
+                                .format(nbytes, expected)))
+        return nbytes
+
+    @profiler.Timer()
+    def fetch(self, name, directory='./', validator=None, size=None):
+        """
+        Downloads one file, resuming an earlier partial download if any, and
+        checks its size against the remote size when known.
+
+        :param: name (str) - remote file name
+        :param: directory (str) - name of directory for the file
+        :param: validator (str) - ETag or Last-Modified of the remote file
+                                  when the partial download began
+        :param: size (int) - expected size if the server does not tell
+        :return: result (dict) - name, path, status ('downloaded' or
+                 'failed'), bytes received over all attempts, attempts,
+                 error message, sha256 checksum and remote size, mtime
+                 and etag
+        """
+        out_path = os.path.join(directory, name)
+        part_path = '{}.part'.format(out_path)
+        meta = {'size': None, 'mtime': None, 'etag': None}
+        result = {'name': name, 'path': out_path, 'status': 'failed',
+                  'bytes': 0, 'attempts': 0, 'error': None, 'sha256': None,
+                  'remote': meta}
+        offset = 0
+        if os.path.isfile(part_path):
+            offset = os.path.getsize(part_path)
+        try:
+            attempts = self._retry(self._fetch_file, name, part_path, meta,
+                                   validator)[1]
+        except Exception as error:
+            result['attempts'] = getattr(error, 'attempts', 1)
+            result['error'] = '{}: {}'.format(type(error).__name__, error)
+            return result
+
+        if meta['size'] is None:
+            meta['size'] = size
+        part_size = os.path.getsize(part_path)
+        result['attempts'] = attempts
+        if meta['size'] is not None and part_size != meta['size']:
+            if part_size > meta['size']:
+                os.remove(part_path)
+            result['error'] = 'DownloadError: Got {} of {} bytes'.format(
+                part_size, meta['size'])
+            return result
+        os.replace(part_path, out_path)
+        nbytes = part_size - offset if part_size >= offset else part_size
+        result.update(status='downloaded', bytes=nbytes,
+                      sha256=get_checksum(out_path))
+        return result
+
+    @profiler.Timer()
+    def fetch_all(self, names, directory='./', clobber=False):
+        """
+        Downloads many files concurrently.
+
+        :param: names (list) - remote file names
+        :param: directory (str) - name of directory for files to be saved
+        :param: clobber (boolean) - download files that already exist
+        :return: results (OrderedDict) - name to the result of fetch, with
+                 status 'skipped' for files already present
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        results = OrderedDict()
+        pending = OrderedDict()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for name in names:
+                out_path = os.path.join(directory, name)
+                if not clobber and os.path.isfile(out_path):
+                    results[name] = _get_skipped(name, out_path)
+                else:
+                    pending[name] = pool.submit(self.fetch, name, directory)
+            for name, future in pending.items():
+                results[name] = future.result()
+        return OrderedDict((name, results[name]) for name in names)
+
+    @profiler.Timer()
+    def sync(self, names, directory='./', verify='size', check_remote=True,
+             clobber=False, adopt_unverified=False):
+        """
+        Downloads only the files that are new, changed or incomplete
+        according to the manifest of the directory, verifying the integrity
+        of the others from disk, and records what was downloaded.
+
+        :param: names (list) - remote file names
+        :param: directory (str) - name of directory for files to be saved
+        :param: verify (str) - check files already downloaded by 'size',
+                               by 'checksum' (re-reads them) or not (None)
+        :param: check_remote (boolean) - ask the server whether files
+                                         changed, by a HEAD request (no
+                                         body) per file or the FTP listing;
+                                         if False only the FTP listing is
+                                         compared, so changed HTTP files
+                                         are not noticed
+        :param: clobber (boolean) - download all files again
+        :param: adopt_unverified (boolean) - keep files found on disk
+                                             without an entry even if the
+                                             server gives no size to check
+                                             them against
+        :return: results (OrderedDict) - name to the result of fetch, with
+                 a reason ('new', 'changed', 'incomplete', 'corrupt',
+                 'missing', 'unverified', 'clobber' or 'unchanged');
+                 unchanged files are 'skipped', as are files found on disk
+                 without an entry whose size matches the remote size
+        """
+        if verify not in VERIFY_MODES:
+            print('Verify {} is not one of {}!'.format(verify, VERIFY_MODES))
+            raise(Unsupported)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        manifest = Manifest(os.path.join(directory, MANIFEST_NAME))
+
+        remote = dict((name, dict(self.stats[name])) for name in names
+                      if name in self.stats)
+        # files on disk without an entry are stated once to be adopted
+        to_stat = [name for name in names if name not in remote and (
+            (check_remote and name in manifest) or
+            (name not in manifest and
+             os.path.isfile(os.path.join(directory, name))))]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [(name, pool.submit(self.stat, name))
+                       for name in to_stat]
+            for name, future in futures:
+                try:
+                    remote[name] = future.result()
+                except Exception:
+                    remote[name] = {}
+
+        results = OrderedDict()
+        reasons = OrderedDict()
+        for name in names:
+            out_path = os.path.join(directory, name)
+            entry = manifest.get(name)
+            meta = remote.get(name, {})
+            if clobber:
+                reason = 'clobber'
+            elif entry is None:
+                reason = 'new'
+                if os.path.isfile(out_path):
+                    local_size = os.path.getsize(out_path)
+                    if meta.get('size') == local_size or (
+                            meta.get('size') is None and adopt_unverified):
+                        adopted = dict(meta, size=local_size)
+                        manifest.update(name, complete=True,
+                                        sha256=get_checksum(out_path),
+                                        url=self.base_url + name,
+                                        **adopted)
+                        manifest.save()
+                        results[name] = _get_skipped(name, out_path)
+                        results[name]['reason'] = 'unchanged'
+                        continue
+                    reason = ('unverified' if meta.get('size') is None
+                              else 'incomplete')
+            elif not entry.get('complete'):
+                reason = 'incomplete'
+            elif not os.path.isfile(out_path):
+                reason = 'missing'
+            elif manifest.is_changed(name, meta):
+                reason = 'changed'
+            elif not manifest.verify(name, out_path, verify):
+                reason = 'corrupt'
+            else:
+                results[name] = _get_skipped(name, out_path)
+                results[name]['reason'] = 'unchanged'
+                continue
+            reasons[name] = reason
+
+        pending = OrderedDict()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for name, reason in reasons.items():
+                entry = manifest.get(name) or {}
+                part_path = '{}.part'.format(os.path.join(directory, name))
+                stale = reason != 'incomplete' or manifest.is_changed(
+                    name, remote.get(name, {}))
+                if stale and os.path.isfile(part_path):
+                    os.remove(part_path)
+                validator = None
+                size = None
+                if not stale:
+                    validator = entry.get('etag') or entry.get('mtime')
+                    size = entry.get('size')
+                pending[pool.submit(self.fetch, name, directory,
+                                    validator, size)] = (name, reason)
+
+            for future in as_completed(pending):
+                name, reason = pending[future]
+                result = future.result()
+                result['reason'] = reason
+                results[name] = result
+                entry = dict(result['remote'])
+                entry['url'] = self.base_url + name
+                if result['status'] == 'downloaded':
+                    entry.update(complete=True, sha256=result['sha256'],
+                                 fetched=ext.dtnow().isoformat())
+                else:
+                    entry['complete'] = False
+                manifest.update(name, **entry)
+                manifest.save()
+        return OrderedDict((name, results[name]) for name in names)
+
+
+def _get_skipped(name, out_path):
+    """
+    Makes the result of a file that was not downloaded again.
+
+    :param: name (str) - remote file name
+    :param: out_path (str) - local path
+    :return: result (dict) - result with status 'skipped'
+    """
+    return {'name': name, 'path': out_path, 'status': 'skipped', 'bytes': 0,
+            'attempts': 0, 'error': None, 'sha256': None, 'remote': None}
+
+
+@profiler.Timer()
+def get_checksum(file_path, algorithm='sha256'):
+    """
+    Computes the checksum of a file, reading it in chunks.
+
+    :param: file_path (str) - path of the file
+    :param: algorithm (str) - any algorithm of hashlib
+    :return: checksum (str) - hex digest
+    """
+    file_hash = hashlib.new(algorithm)
+    with open(file_path, 'rb') as fi_in:
+        while True:
+            block = fi_in.read(DOWNLOAD_CHUNK_SIZE)
+            if not block:
+                break
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class Manifest(object):
+    """
+    Local record of every file downloaded into a directory: its remote size,
+    modification time and ETag, its sha256 checksum, and whether it was
+    completed, saved as JSON after each change so interrupted runs keep
+    what they finished.
+
+    :param: file_path (str) - path of the manifest
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.files = {}
+        if os.path.isfile(file_path):
+            with open(file_path) as fi_in:
+                self.files = json.load(fi_in).get('files', {})
+
+    def __contains__(self, name):
+        return name in self.files
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, name):
+        """
+        Finds the entry of a file.
+
+        :param: name (str) - file name
+        :return: entry (dict) - recorded fields; None if never downloaded
+        """
+        return self.files.get(name)
+
+    def update(self, name, **fields):
+        """
+        Records fields of a file; fields that are None are left as they
+        were.
+
+        :param: name (str) - file name
+        :param: fields (dict) - i.e. size, mtime, etag, sha256, complete
+        """
+        entry = self.files.setdefault(name, {})
+        entry.update((key, value) for key, value in fields.items()
+                     if value is not None)
+
+    def is_changed(self, name, meta):
+        """
+        Compares the remote size, mtime and etag of a file with its entry;
+        fields unknown on either side are not compared.
+
+        :param: name (str) - file name
+        :param: meta (dict) - remote size, mtime and etag
+        :return: changed (boolean) - whether the remote file changed
+        """
+        entry = self.files.get(name, {})
+        for key in ('size', 'mtime', 'etag'):
+            if meta.get(key) is not None and entry.get(key) is not None \
+                    and meta[key] != entry[key]:
+                return True
+        return False
+
+    def verify(self, name, file_path, verify='size'):
+        """
+        Checks a local file against its entry without downloading it.
+
+        :param: name (str) - file name
+        :param: file_path (str) - path of the local file
+        :param: verify (str) - 'size', 'checksum' or None to skip
+        :return: valid (boolean) - whether the file is intact
+        """
+        entry = self.files.get(name, {})
+        if verify is None:
+            return True
+        if entry.get('size') is not None and \
+                os.path.getsize(file_path) != entry['size']:
+            return False
+        if verify == 'checksum' and entry.get('sha256') is not None:
+            return get_checksum(file_path) == entry['sha256']
+        return True
+
+    def save(self):
+        """
+        Writes the manifest, replacing the old one only once fully written.
+        """
+        tmp_path = '{}.tmp'.format(self.file_path)
+        with open(tmp_path, 'w') as fi_out:
+            json.dump({'version': 1, 'files': self.files}, fi_out,
+                      indent=1, sort_keys=True)
+        os.replace(tmp_path, self.file_path)
+
+
+@profiler.Timer()
+def wget_fi(base_url, glob_str, user=None, pwd=None, directory=None,
+            workers=4, retries=3, backoff=1., timeout=60., clobber=False,
+            manifest=True, verify='size', check_remote=True,
+            adopt_unverified=False):
+    """
+    Downloads files that match the given glob_str from an HTTP(S) or FTP
+    directory, several at a time over reused connections; interrupted
+    downloads are resumed and failures retried with backoff. A manifest in
+    the directory records what was downloaded, so re-runs only fetch new,
+    changed or incomplete files. Can input username and password if
+    authentication is required; they are never put on a command line.
+
+    :param: base_url (str) - the dir of all the to be downloaded files
+    :param: glob_str (str) - the naming pattern of the files
+    :param: user (str) - username; defaults to ~/.netrc
+    :param: pwd (str) - password; defaults to ~/.netrc
     :param: directory (str) - name of directory for files to be saved
+    :param: workers (int) - number of concurrent downloads
+    :param: retries (int) - retries per file after the first attempt
+    :param: backoff (float) - seconds before the first retry, then doubled
+    :param: timeout (float) - seconds to wait on the network
+    :param: clobber (boolean) - download files that already exist
+    :param: manifest (boolean) - keep a manifest; if False existing files
+                                 are skipped by name only, like wget -nc
+    :param: verify (str) - check files already downloaded by 'size',
+                           'checksum' or not at all (None)
+    :param: check_remote (boolean) - ask the server whether downloaded
+                                     files changed, by a HEAD request (no
+                                     body) per file or the FTP listing
+    :param: adopt_unverified (boolean) - keep files already on disk that
+                                         the server gives no size for,
+                                         instead of downloading them again
+    :return: results (OrderedDict) - file name to a dict of path, status
+             ('downloaded', 'skipped' or 'failed'), bytes, attempts,
+             error and, with a manifest, the reason it was fetched
     """
-    fi_dir = os.path.join(base_url, glob_str)
-    if user is not None and pwd is not None:
-        wget_cmd =\
-                  "wget -r -np -nd -nc --glob=on --user={user} \
-                  --password={pwd} '{fi_dir}'"\
-                  .format(user=user, pwd=pwd, fi_dir=fi_dir)
-    else:
-        wget_cmd = """wget -r -np -nd -nc --glob=on '{fi_dir}'""" \
-            .format(fi_dir=fi_dir)
-    if directory is not None:
-        add_on_cmd = """ -P {}""".format(directory)
-        wget_cmd += add_on_cmd
-    os.system(wget_cmd)
+    if directory is None:
+        directory = './'
+    with Downloader(base_url, user=user, pwd=pwd, workers=workers,
+                    retries=retries, backoff=backoff,
+                    timeout=timeout) as downloader:
+        try:
+            names = downloader.list_files(glob_str)
+        except Exception:
+            print('Could not list the files at {}!'.format(base_url))
+            raise
+        if len(names) == 0:
+            print('Unable to find any files matching {} at {}!'
+                  .format(glob_str, base_url))
+        if manifest:
+            results = downloader.sync(names, directory=directory,
+                                      verify=verify,
+                                      check_remote=check_remote,
+                                      clobber=clobber,
+                                      adopt_unverified=adopt_unverified)
+        else:
+            results = downloader.fetch_all(names, directory=directory,
+                                           clobber=clobber)
+    for name, result in results.items():
+        if result['status'] == 'failed':
+            print('Could not download {}! {}'.format(name, result['error']))
+    return results
 
 
+@profiler.Timer()
 def ncdump(glob_str, directory='./'):
     """
     Wrapper of ncdump; prints out netCDF metadata.
@@ -47,6 +843,7 @@ def ncdump(glob_str, directory='./'):
         print('Could not ncdump file!')
 
 
+@profiler.Timer()
 def concat_nc(glob_str, output_fi, directory='./', rec_dim=None):
     """
     Wrapper of NCO's ncrcat and optional ncks; concatenates a list of netCDF
@@ -0,0 +1,216 @@
+from collections import OrderedDict
+import tracemalloc
+import threading
+import functools
+import atexit
+import json
+import time
+import os
+
+__author__ = 'huang.andrew12@gmail.com'
+__copyright__ = 'Andrew Huang'
+
+
+def _env_flag(name):
+    return os.environ.get(name, '').strip().lower() not in ('', '0',
+                                                            'false', 'no')
+
+
+PROFILE_SETTINGS = {'enabled': _env_flag('AHH_PROFILE'),
+                    'memory': _env_flag('AHH_PROFILE_MEMORY'),
+                    'max_samples': 10000}
+PROFILE_STATS = OrderedDict()
+PROFILE_LOCK = threading.Lock()
+PROFILE_LOCAL = threading.local()
+
+
+def enable_profiling(memory=False, max_samples=10000):
+    """
+    Turns on the instrumentation of ahh's public functions; same as setting
+    the AHH_PROFILE (and AHH_PROFILE_MEMORY) environment variable before
+    import.
+
+    :param: memory (boolean) - capture the peak memory of each call with
+                               tracemalloc, which slows calls down
+    :param: max_samples (int) - latest call times kept per function for p95
+    """
+    PROFILE_SETTINGS['enabled'] = True
+    PROFILE_SETTINGS['memory'] = memory
+    PROFILE_SETTINGS['max_samples'] = max_samples
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable_profiling():
+    """
+    Turns off the instrumentation; collected stats are kept.
+    """
+    PROFILE_SETTINGS['enabled'] = False
+    PROFILE_SETTINGS['memory'] = False
+
+
+def reset_profiling():
+    """
+    Clears the collected stats.
+    """
+    with PROFILE_LOCK:
+        PROFILE_STATS.clear()
+
+
+def _get_profile_stack():
+    stack = getattr(PROFILE_LOCAL, 'stack', None)
+    if stack is None:
+        stack = PROFILE_LOCAL.stack = []
+    return stack
+
+
+def add_bytes_read(nbytes):
+    """
+    Credits bytes read from disk to every timer running in this thread.
+
+    :param: nbytes (int) - number of bytes read
+    """
+    if not PROFILE_SETTINGS['enabled']:
+        return
+    for entry in _get_profile_stack():
+        entry['bytes_read'] += int(nbytes)
+
+
+class Timer(object):
+    """
+    Times a block of code, or every call of a function when used as a
+    decorator, with a monotonic high resolution clock. Calls of the same
+    name are aggregated into PROFILE_STATS; nothing is recorded unless
+    profiling is enabled, through enable_profiling or the AHH_PROFILE
+    environment variable. Nested timers are inclusive.
+
+    :param: name (str) - label of the block; defaults to module.function
+                         when used as a decorator
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.entry = None
+
+    def __call__(self, func):
+        name = self.name
+        if name is None:
+            name = '{}.{}'.format(
+                func.__module__, getattr(func, '__qualname__', func.__name__))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_SETTINGS['enabled']:
+                return func(*args, **kwargs)
+            with Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        if not PROFILE_SETTINGS['enabled']:
+            return self
+        stack = _get_profile_stack()
+        self.entry = {'bytes_read': 0, 'mem_start': None, 'mem_peak': 0}
+        if PROFILE_SETTINGS['memory']:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            for entry in stack:
+                entry['mem_peak'] = max(entry['mem_peak'], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.entry['mem_start'] = current
+            self.entry['mem_peak'] = current
+        stack.append(self.entry)
+        self.entry['start'] = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        if self.entry is None:
+            return False
+        elapsed = time.perf_counter() - self.entry['start']
+        stack = _get_profile_stack()
+        for idx in range(len(stack) - 1, -1, -1):
+            if stack[idx] is self.entry:
+                del stack[idx]
+                break
+        peak = None
+        if self.entry['mem_start'] is not None and tracemalloc.is_tracing():
+            mem_peak = max(self.entry['mem_peak'],
+                           tracemalloc.get_traced_memory()[1])
+            for entry in stack:
+                entry['mem_peak'] = max(entry['mem_peak'], mem_peak)
+            peak = mem_peak - self.entry['mem_start']
+
+        with PROFILE_LOCK:
+            stats = PROFILE_STATS.get(self.name)
+            if stats is None:
+                stats = PROFILE_STATS[self.name] = {
+                    'calls': 0, 'total': 0., 'max': 0., 'times': [],
+                    'bytes_read': 0, 'peak_memory': None}
+            stats['calls'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['times'].append(elapsed)
+            if len(stats['times']) > PROFILE_SETTINGS['max_samples']:
+                del stats['times'][0]
+            stats['bytes_read'] += self.entry['bytes_read']
+            if peak is not None:
+                stats['peak_memory'] = max(stats['peak_memory'] or 0, peak)
+        self.entry = None
+        return False
+
+
+def _get_percentile(values, percent):
+    values = sorted(values)
+    rank = (len(values) - 1) * percent / 100.
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def get_profile_report():
+    """
+    Aggregates the collected stats, slowest total first.
+
+    :return: report (OrderedDict) - name to calls, total, mean, p95 and max
+             seconds, bytes read and peak memory in bytes (None unless
+             memory capture is on)
+    """
+    report = OrderedDict()
+    with PROFILE_LOCK:
+        items = sorted(PROFILE_STATS.items(),
+                       key=lambda item: item[1]['total'], reverse=True)
+        for name, stats in items:
+            report[name] = OrderedDict(
+                (('calls', stats['calls']),
+                 ('total', stats['total']),
+                 ('mean', stats['total'] / stats['calls']),
+                 ('p95', _get_percentile(stats['times'], 95)),
+                 ('max', stats['max']),
+                 ('bytes_read', stats['bytes_read']),
+                 ('peak_memory', stats['peak_memory'])))
+    return report
+
+
+def dump_profile_report(file_path=None):
+    """
+    Writes the profile report as JSON; registered at exit when the
+    AHH_PROFILE_REPORT environment variable names a file.
+
+    :param: file_path (str) - output file; defaults to AHH_PROFILE_REPORT
+    :return: report (OrderedDict) - report that was written
+    """
+    if file_path is None:
+        file_path = os.environ.get('AHH_PROFILE_REPORT', 'ahh_profile.json')
+    report = get_profile_report()
+    with open(file_path, 'w') as fi_out:
+        json.dump(report, fi_out, indent=2)
+    return report
+
+
+if PROFILE_SETTINGS['enabled']:
+    if PROFILE_SETTINGS['memory']:
+        tracemalloc.start()
+    if os.environ.get('AHH_PROFILE_REPORT'):
+        atexit.register(dump_profile_report)
\ No newline at end of file
@@ -1,127 +1,750 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
+from fractions import Fraction
+from scipy import sparse
 import numpy as np
+import hashlib
+import glob
+import os
+
+from ahh import ext, profiler
 
 __author__ = 'huang.andrew12@gmail.com'
 __copyright__ = 'Andrew Huang'
 
+SCORES = ('uac', 'cac', 'rmse', 'mse', 'bias', 'mae')
+CLIM_SCORES = ('uac', 'cac')
+CLIM_BINS = {'daily': 366, 'monthly': 12}
+PRECISIONS = (np.dtype(np.float32), np.dtype(np.float64))
+SINGLE_CHUNK_SIZE = 64
+REGRID_METHODS = ('bilinear', 'conservative')
+REGRID_CACHE = OrderedDict()
+REGRID_CACHE_SIZE = 16
+LEAP_CUM_DAYS = np.array([0, 31, 60, 91, 121, 152,
+                          182, 213, 244, 274, 305, 335])
+
+
+class MissingInput(Exception):
+    pass
+
 
-def get_uac(obs, fcst, clim):
+class Unsupported(Exception):
+    pass
+
+
+def _get_dtype(dtype):
     """
-    Calculates the uncentered anomaly correlation
+    Checks the compute precision; only float32 and float64 are supported.
 
-    :param: obs (np.array) - observation
-    :param: fcst (np.array) - forecast
-    :param: clim - (np.array) - climatology
-    return: uac - (np.array) - uncentered anomaly correlation
+    :param: dtype (str/np.dtype) - compute precision; None for float64
+    :return: dtype (np.dtype) - compute precision
+    """
+    if dtype is None:
+        return np.dtype(np.float64)
+    dtype = np.dtype(dtype)
+    if dtype not in PRECISIONS:
+        print('Precision {} is not one of {}!'.format(dtype, PRECISIONS))
+        raise(Unsupported)
+    return dtype
+
+
+def _kahan_add(total, comp, value):
+    """
+    Adds value to a running total with Kahan compensation, so that summing
+    many partial results in float32 does not accumulate rounding error.
+
+    :param: total (np.array) - running total
+    :param: comp (np.array) - running compensation
+    :param: value (np.array) - value to add
+    :return: total, comp (np.array, np.array) - updated total and compensation
     """
+    value = value - comp
+    new_total = total + value
+    comp = (new_total - total) - value
+    return new_total, comp
+
+
+def _get_chunks(len_arr, chunk_size=None):
+    """
+    Yields the start and end indices of consecutive blocks along the first
+    axis, each at most chunk_size long.
+
+    :param: len_arr (int) - length of the first axis
+    :param: chunk_size (int) - max length of each block; None for one block
+    :return: start, end (int, int) - bounds of each block
+    """
+    if chunk_size is None or chunk_size < 1:
+        chunk_size = max(len_arr, 1)
+    for start in range(0, len_arr, chunk_size):
+        yield start, min(start + chunk_size, len_arr)
+
+
+def _get_box(idc, shape):
+    """
+    Turns lat/lon indices into the spatial selection used by get_cac and
+    get_rmse; indices that are not evenly spaced (i.e. a lon box wrapping
+    around 0/360 from ext.get_idc) are kept as index arrays.
+
+    :param: idc (tuple) - indices of lats and lons; None for whole grid
+    :param: shape (tuple) - lengths of the lat and lon dimensions
+    :return: box (tuple) - lat and lon selection (slice or index array)
+    """
+    if idc is None:
+        return (slice(None), slice(None))
+    box = (ext.get_selection(idc[0], shape[0]),
+           ext.get_selection(idc[1], shape[1]))
+    for sel, length in zip(box, shape):
+        if isinstance(sel, slice):
+            size = len(range(*sel.indices(length)))
+        else:
+            size = len(sel)
+        if size == 0:
+            print('No grid points were found within the given idc!')
+            raise(MissingInput)
+    return box
+
+
+def _get_primes(obs, fcst, clim, start, end, box=None, dtype=None):
+    """
+    Reads one time block of obs and fcst, subtracts the climatology once and
+    flattens the spatial dimensions; points masked in obs, fcst or clim are
+    masked in both.
+
+    :param: obs (np.array/netCDF4.Variable) - observation
+    :param: fcst (np.array/netCDF4.Variable) - forecast
+    :param: clim (np.array) - climatology; None to use the raw values
+    :param: start (int) - first time index of block
+    :param: end (int) - last time index of block (exclusive)
+    :param: box (tuple) - spatial selection from _get_box; None for whole
+                          grid
+    :param: dtype (np.dtype) - compute precision
+    :return: obs_prime, fcst_prime (np.ma.array, np.ma.array) -
+             anomalies shaped (time, grid points)
+    """
+    clim_box = 0
+    if box is None:
+        obs_block = obs[start:end]
+        fcst_block = fcst[start:end]
+        if clim is not None:
+            clim_box = np.ma.asarray(clim, dtype=dtype)
+    else:
+        selection = (slice(start, end),) + tuple(box)
+        obs_block = ext.read_selection(obs, selection)
+        fcst_block = ext.read_selection(fcst, selection)
+        if clim is not None:
+            clim_box = ext.read_selection(np.ma.asarray(clim, dtype=dtype),
+                                          tuple(box))
+    ext.add_nc_bytes_read(obs, obs_block)
+    ext.add_nc_bytes_read(fcst, fcst_block)
+    obs_prime = np.ma.asarray(obs_block, dtype=dtype) - clim_box
+    fcst_prime = np.ma.asarray(fcst_block, dtype=dtype) - clim_box
+    mask = np.ma.getmaskarray(obs_prime) | np.ma.getmaskarray(fcst_prime)
+    obs_prime = np.ma.array(obs_prime, mask=mask).reshape(end - start, -1)
+    fcst_prime = np.ma.array(fcst_prime, mask=mask).reshape(end - start, -1)
+    return obs_prime, fcst_prime
+
+
+@profiler.Timer()
+def get_scores(obs, fcst, clim=None, idc=None, scores=SCORES,
+               chunk_size=None, dtype=None):
+    """
+    Calculates several verification scores from a single read of obs, fcst
+    and clim. For each block of time steps, the anomalies and errors are
+    computed once and every requested score is reduced from them over the
+    box. Grid points masked in either obs or fcst are left out of every sum.
+    With dtype=np.float32, blocks are read and reduced in single precision;
+    each spatial sum is a pairwise reduction over a contiguous row, which
+    keeps the rounding error close to that of float64.
+
+    Available scores:
+    uac - uncentered anomaly correlation (needs clim)
+    cac - centered anomaly correlation (needs clim)
+    rmse - root mean square error
+    mse - mean square error
+    bias - mean error (fcst - obs)
+    mae - mean absolute error
+
+    :param: obs (np.array/netCDF4.Variable) - observation
+    :param: fcst (np.array/netCDF4.Variable) - forecast
+    :param: clim (np.array) - climatology
+    :param: idc (np.array) - indices of grid points; None for whole grid
+    :param: scores (tuple) - names of scores to compute
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
+    :return: scores_dict (dict) - score name to np.array over time
+    """
+    for score in scores:
+        if score not in SCORES:
+            print('Score {} is not one of {}!'.format(score, SCORES))
+            raise(Unsupported)
+        if score in CLIM_SCORES and clim is None:
+            print('Score {} requires clim!'.format(score))
+            raise(MissingInput)
+
+    dtype = _get_dtype(dtype)
     size_arr = obs.shape
     len_arr = size_arr[0]
-    uac = np.zeros(len_arr)
+    scores_dict = dict((score, np.zeros(len_arr, dtype=dtype))
+                       for score in scores)
+    box = _get_box(idc, size_arr[1:3])
 
-    for i in range(len_arr):
-        fcst_prime = np.array(fcst[i, :, :] - clim)
-        obs_prime = np.array(obs[i, :, :] - clim)
-        numerator = np.sum(fcst_prime * obs_prime)
-        denominator = np.sum(
-            np.square(fcst_prime)) * np.sum(np.square(obs_prime))
-        uac[i] = numerator / np.sqrt(denominator)
+    for start, end in _get_chunks(len_arr, chunk_size):
+        obs_prime, fcst_prime = _get_primes(obs, fcst, clim, start, end,
+                                            box=box, dtype=dtype)
 
-    return uac
+        if set(scores) & set(('rmse', 'mse', 'bias', 'mae')):
+            count = np.ma.count(obs_prime, axis=1)
+            diff = fcst_prime - obs_prime
+            if 'bias' in scores:
+                scores_dict['bias'][start:end] = np.ma.filled(
+                    np.ma.sum(diff, axis=1) / count, np.nan)
+            if 'mae' in scores:
+                scores_dict['mae'][start:end] = np.ma.filled(
+                    np.ma.sum(np.abs(diff), axis=1) / count, np.nan)
+            if 'rmse' in scores or 'mse' in scores:
+                mse = np.ma.filled(
+                    np.ma.sum(np.square(diff), axis=1) / count, np.nan)
+                if 'mse' in scores:
+                    scores_dict['mse'][start:end] = mse
+                if 'rmse' in scores:
+                    scores_dict['rmse'][start:end] = np.sqrt(mse)
 
+        if 'uac' in scores:
+            numerator = np.ma.sum(fcst_prime * obs_prime, axis=1)
+            denominator = np.ma.sum(np.square(fcst_prime), axis=1) * \
+                np.ma.sum(np.square(obs_prime), axis=1)
+            scores_dict['uac'][start:end] = np.ma.filled(
+                numerator / np.ma.sqrt(denominator), np.nan)
 
-def get_cac(obs, fcst, clim, idc):
+        if 'cac' in scores:
+            fcst_prime -= np.ma.mean(fcst_prime, axis=1)[:, np.newaxis]
+            obs_prime -= np.ma.mean(obs_prime, axis=1)[:, np.newaxis]
+            numerator = np.ma.sum(fcst_prime * obs_prime, axis=1)
+            denominator = np.ma.sum(np.square(fcst_prime), axis=1) * \
+                np.ma.sum(np.square(obs_prime), axis=1)
+            scores_dict['cac'][start:end] = np.ma.filled(
+                numerator / np.ma.sqrt(denominator), np.nan)
+
+    return scores_dict
+
+
+@profiler.Timer()
+def get_uac(obs, fcst, clim, chunk_size=None, dtype=None):
     """
-    Calculates the centered anomaly correlation
+    Calculates the uncentered anomaly correlation for all time steps at once,
+    reducing over the spatial axes. Masked grid points are ignored. If
+    chunk_size is given, only that many time steps are read and held in
+    memory at a time, so obs and fcst may be lazy netCDF4 variables.
+
+    :param: obs (np.array) - observation
+    :param: fcst (np.array) - forecast
+    :param: clim - (np.array) - climatology
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
+    return: uac - (np.array) - uncentered anomaly correlation
+    """
+    return get_scores(obs, fcst, clim, scores=('uac',),
+                      chunk_size=chunk_size, dtype=dtype)['uac']
+
+
+@profiler.Timer()
+def get_cac(obs, fcst, clim, idc, chunk_size=None, dtype=None):
+    """
+    Calculates the centered anomaly correlation for all time steps at once.
+    Each anomaly is computed only once; the means, covariance and variances
+    are then reduced over the box for every time step together. Grid points
+    masked in either obs or fcst are left out of every sum.
 
     :param: obs (np.array) - observation
     :param: fcst (np.array) - forecast
     :param: clim - (np.array) - climatology
     :param: idc - (np.array) - indices of grid points
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
     return: cac - (np.array) - centered anomaly correlation
     """
-    size_arr = obs.shape
-    len_arr = size_arr[0]
-    cac = np.zeros(len_arr)
+    return get_scores(obs, fcst, clim, idc=idc, scores=('cac',),
+                      chunk_size=chunk_size, dtype=dtype)['cac']
 
-    lat_start_idc = idc[0][0]
-    lat_end_idc = idc[0][-1]
 
-    lon_start_idc = idc[1][0]
-    lon_end_idc = idc[1][-1]
+@profiler.Timer()
+def get_rmse(obs, fcst, idc, chunk_size=None, dtype=None):
+    """
+    Calculates the root mean square error for all time steps at once, over
+    the valid (non-masked) grid points in the box; same as the 'rmse' of
+    get_scores.
 
-    for i in range(len_arr):
-        fcst_prime = np.array(
-            fcst[i, lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc] -
-            clim[lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc])
-        obs_prime = np.array(
-            obs[i, lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc] -
-            clim[lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc])
+    :param: obs (np.array) - observation
+    :param: fcst (np.array) - forecast
+    :param: idc - (np.array) - indices of grid points
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
+    return: rmse - (np.array) - root mean square error
+    """
+    return get_scores(obs, fcst, idc=idc, scores=('rmse',),
+                      chunk_size=chunk_size, dtype=dtype)['rmse']
 
-        fcst_prime_avg = np.ma.average(
-            np.array(
-                fcst[i, lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc] -
-                clim[lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc])
-            )
-        obs_prime_avg = np.ma.average(
-            np.array(
-                obs[i, lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc] -
-                clim[lat_start_idc:lat_end_idc, lon_start_idc:lon_end_idc])
-            )
 
-        numerator = np.sum((
-            fcst_prime - fcst_prime_avg) * (obs_prime - obs_prime_avg))
-        denominator = np.sum(np.square(fcst_prime - fcst_prime_avg)) * \
-            np.sum(np.square(obs_prime - obs_prime_avg))
-        cac[i] = numerator / np.sqrt(denominator)
+class RMSEAccumulator(object):
+    """
+    Accumulates squared errors block by block so the root mean square error
+    of an archive can be found without holding it in memory. Blocks can be
+    numpy arrays or lazy netCDF4 variables from separate files; partial
+    accumulators from separate workers can be combined with merge.
 
-    return cac
+    As in get_rmse, the mean is taken over the valid (non-masked) grid
+    points that were actually added.
 
+    :param: idc (np.array) - indices of grid points; None for whole grid
+    """
+
+    def __init__(self, idc=None):
+        self.idc = idc
+        self.sq_sum = np.zeros(0)
+        self.count = np.zeros(0, dtype=np.int64)
+
+    def _grow(self, len_arr):
+        """
+        Pads the per-time sums so they are at least len_arr long.
+
+        :param: len_arr (int) - required number of time steps
+        """
+        pad = len_arr - len(self.sq_sum)
+        if pad > 0:
+            self.sq_sum = np.concatenate((self.sq_sum, np.zeros(pad)))
+            self.count = np.concatenate(
+                (self.count, np.zeros(pad, dtype=np.int64)))
+
+    @profiler.Timer()
+    def add(self, obs, fcst, start=None, chunk_size=None):
+        """
+        Adds a (time, lat, lon) block of obs and fcst.
+
+        :param: obs (np.array/netCDF4.Variable) - observation
+        :param: fcst (np.array/netCDF4.Variable) - forecast
+        :param: start (int) - time index of the block's first step within
+                              the whole record; None to append at the end
+        :param: chunk_size (int) - number of time steps to read at a time
+        :return: self (RMSEAccumulator) - this accumulator
+        """
+        if start is None:
+            start = len(self.sq_sum)
+        len_arr = obs.shape[0]
+        self._grow(start + len_arr)
+        box = _get_box(self.idc, obs.shape[1:3])
+
+        for blk_start, blk_end in _get_chunks(len_arr, chunk_size):
+            blk_sel = (slice(blk_start, blk_end),) + box
+            diff = np.ma.asarray(ext.read_selection(fcst, blk_sel)) - \
+                np.ma.asarray(ext.read_selection(obs, blk_sel))
+            diff = diff.reshape(blk_end - blk_start, -1)
+            self.sq_sum[start + blk_start:start + blk_end] += np.ma.filled(
+                np.ma.sum(np.square(diff), axis=1), 0)
+            self.count[start + blk_start:start + blk_end] += \
+                np.ma.count(diff, axis=1)
+        return self
+
+    def merge(self, other):
+        """
+        Combines another accumulator into this one; time steps are matched
+        by their index in the whole record, so workers may split the record
+        by time, by region or both.
 
-def get_rmse(obs, fcst, idc):
+        :param: other (RMSEAccumulator) - partial accumulator
+        :return: self (RMSEAccumulator) - this accumulator
+        """
+        self._grow(len(other.sq_sum))
+        self.sq_sum[:len(other.sq_sum)] += other.sq_sum
+        self.count[:len(other.count)] += other.count
+        return self
+
+    def get_rmse(self):
+        """
+        Finds the root mean square error of each time step added.
+
+        :return: rmse (np.array) - root mean square error; nan if no points
+        """
+        rmse = np.full(len(self.sq_sum), np.nan)
+        valid = self.count > 0
+        rmse[valid] = np.sqrt(self.sq_sum[valid] / self.count[valid])
+        return rmse
+
+    def get_total_rmse(self):
+        """
+        Finds the root mean square error over every point added.
+
+        :return: total_rmse (float) - aggregate root mean square error
+        """
+        total_count = self.count.sum()
+        if total_count == 0:
+            return np.nan
+        return np.sqrt(self.sq_sum.sum() / total_count)
+
+
+def _get_clim_bins(times, freq='daily'):
     """
-    Calculates the root mean square error
+    Finds the climatology bin of each time; daily bins follow a leap year
+    calendar so that a given month and day always share a bin.
 
-    :param: obs (np.array) - observation
-    :param: fcst (np.array) - forecast
-    :param: idc - (np.array) - indices of grid points
-    return: rmse - (np.array) - root mean square error
+    :param: times (np.array) - array of datetimes or np.datetime64
+    :param: freq (str) - daily or monthly
+    :return: bins (np.array) - 0-based day of (leap) year or month index
     """
-    size_arr = obs.shape
-    len_arr = size_arr[0]
-    grid_points = size_arr[1] * size_arr[2]
-    rmse = np.zeros(len_arr)
-
-    lat_start_idc = idc[0][0]
-    lat_end_idc = idc[0][-1]
-
-    lon_start_idc = idc[1][0]
-    lon_end_idc = idc[1][-1]
-
-    for i in range(len_arr):
-        rmse[i] = np.sqrt(
-                    (1 / grid_points) *
-                    np.sum(
-                        np.square(
-                            fcst[
-                                i,
-                                lat_start_idc:lat_end_idc,
-                                lon_start_idc:lon_end_idc] -
-                            obs[
-                                i,
-                                lat_start_idc:lat_end_idc,
-                                lon_start_idc:lon_end_idc]
-                                )
-                            )
-                        )
-    return rmse
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        times_mth = times.astype('datetime64[M]')
+        months = times_mth.astype(np.int64) % 12 + 1
+        days = (times.astype('datetime64[D]') -
+                times_mth.astype('datetime64[D]')).astype(np.int64) + 1
+    else:
+        months = np.array([t.month for t in times])
+        days = np.array([t.day for t in times])
+    if freq == 'monthly':
+        return months - 1
+    return LEAP_CUM_DAYS[months - 1] + days - 1
+
+
+class Climatology(object):
+    """
+    Builds a daily or monthly climatology incrementally. Data is streamed
+    block by block and merged into running means (and optionally variances)
+    per bin, so only the climatology itself is held in memory. Files that
+    have already been added are remembered, and the climatology can be
+    saved and loaded again to add new years later.
+
+    :param: freq (str) - daily (366 day of year bins) or monthly (12 bins)
+    :param: variance (boolean) - whether to also accumulate the variance
+    """
+
+    def __init__(self, freq='daily', variance=False):
+        if freq not in CLIM_BINS:
+            print('Frequency {} is not one of {}!'
+                  .format(freq, tuple(CLIM_BINS)))
+            raise(Unsupported)
+        self.freq = freq
+        self.variance = variance
+        self.count = None
+        self.mean = None
+        self.m2 = None
+        self.lats = None
+        self.lons = None
+        self.sources = []
+
+    def _init_arrays(self, grid_shp):
+        """
+        Allocates the per-bin arrays for the given grid shape.
+
+        :param: grid_shp (tuple) - shape of the non-time dimensions
+        """
+        shp = (CLIM_BINS[self.freq],) + tuple(grid_shp)
+        self.count = np.zeros(shp, dtype=np.int64)
+        self.mean = np.zeros(shp)
+        if self.variance:
+            self.m2 = np.zeros(shp)
+
+    @profiler.Timer()
+    def add(self, data, times, chunk_size=None):
+        """
+        Merges a (time, ...) block of data into the climatology.
 
+        :param: data (np.array/netCDF4.Variable) - data values
+        :param: times (np.array) - array of datetimes matching data
+        :param: chunk_size (int) - number of time steps to read at a time
+        :return: self (Climatology) - this climatology
+        """
+        bins = _get_clim_bins(times, freq=self.freq)
+        len_arr = data.shape[0]
+        if self.count is None:
+            self._init_arrays(data.shape[1:])
 
+        for start, end in _get_chunks(len_arr, chunk_size):
+            block = np.ma.asarray(data[start:end])
+            block_bins = bins[start:end]
+            for clim_bin in np.unique(block_bins):
+                sub = block[block_bins == clim_bin]
+                count_b = np.ma.count(sub, axis=0)
+                mean_b = np.ma.filled(np.ma.mean(sub, axis=0), 0)
+
+                count_a = self.count[clim_bin]
+                count = count_a + count_b
+                weight = count_b / np.maximum(count, 1).astype(float)
+                delta = mean_b - self.mean[clim_bin]
+                self.mean[clim_bin] += delta * weight
+                if self.variance:
+                    m2_b = np.ma.filled(
+                        np.ma.sum(np.square(sub - mean_b), axis=0), 0)
+                    self.m2[clim_bin] += m2_b + \
+                        np.square(delta) * count_a * weight
+                self.count[clim_bin] = count
+        return self
+
+    @profiler.Timer()
+    def add_file(self, file_path, var_name, lat='lat', lon='lon',
+                 time='time', chunk_size=None):
+        """
+        Streams a variable from a netCDF file into the climatology; files
+        that were already added are skipped.
+
+        :param: file_path (str) - path to file
+        :param: var_name (str) - name of the variable
+        :param: lat (str) - name of the latitude variable
+        :param: lon (str) - name of the longitude variable
+        :param: time (str) - name of the time variable
+        :param: chunk_size (int) - number of time steps to read at a time
+        :return: self (Climatology) - this climatology
+        """
+        source = os.path.abspath(file_path)
+        if source in self.sources:
+            print('{} was already added; skipping!'.format(file_path))
+            return self
+        fi_in, times, lats, lons = ext.read_nc(file_path,
+                                              lat=lat,
+                                              lon=lon,
+                                              time=time,
+                                              num2date=True,
+                                              original=True)
+        try:
+            self.add(fi_in.variables[var_name], times, chunk_size=chunk_size)
+        finally:
+            fi_in.close()
+        self.lats = lats
+        self.lons = lons
+        self.sources.append(source)
+        return self
+
+    @profiler.Timer()
+    def add_files(self, glob_str, var_name, directory='./', **kwargs):
+        """
+        Streams a variable from every file matching glob_str.
+
+        :param: glob_str (str) - the naming pattern of the files
+        :param: var_name (str) - name of the variable
+        :param: directory (str) - directory of files
+        :param: kwargs (dict) - passed on to add_file
+        :return: self (Climatology) - this climatology
+        """
+        fi_dir = os.path.join(directory, glob_str)
+        for file_path in sorted(glob.glob(fi_dir)):
+            self.add_file(file_path, var_name, **kwargs)
+        return self
+
+    def get_clim(self, dt=None):
+        """
+        Gets the climatological mean; bins without data are masked.
+
+        :param: dt (datetime.datetime) - only return the bin of this date
+        :return: clim (np.ma.array) - mean of every bin, or of dt's bin
+        """
+        clim = np.ma.masked_where(self.count == 0, self.mean)
+        if dt is not None:
+            return clim[_get_clim_bins([dt], freq=self.freq)[0]]
+        return clim
+
+    def get_var(self, dt=None):
+        """
+        Gets the sample variance; bins with fewer than 2 values are masked.
+
+        :param: dt (datetime.datetime) - only return the bin of this date
+        :return: var (np.ma.array) - variance of every bin, or of dt's bin
+        """
+        if not self.variance:
+            print('Climatology was made without variance=True!')
+            raise(MissingInput)
+        var = np.ma.masked_where(
+            self.count < 2, self.m2 / np.maximum(self.count - 1, 1))
+        if dt is not None:
+            return var[_get_clim_bins([dt], freq=self.freq)[0]]
+        return var
+
+    def save(self, file_path):
+        """
+        Saves the climatology so new data can be added later.
+
+        :param: file_path (str) - path of .npz file
+        """
+        arrays = {'freq': np.array(self.freq),
+                  'count': self.count,
+                  'mean': self.mean,
+                  'sources': np.array(self.sources, dtype=str)}
+        if self.variance:
+            arrays['m2'] = self.m2
+        if self.lats is not None:
+            arrays['lats'] = np.asarray(self.lats)
+            arrays['lons'] = np.asarray(self.lons)
+        np.savez(file_path, **arrays)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Loads a climatology saved with save.
+
+        :param: file_path (str) - path of .npz file
+        :return: clim (Climatology) - the saved climatology
+        """
+        with np.load(file_path) as fi_in:
+            clim = cls(freq=str(fi_in['freq']), variance='m2' in fi_in.files)
+            clim.count = fi_in['count']
+            clim.mean = fi_in['mean']
+            if clim.variance:
+                clim.m2 = fi_in['m2']
+            if 'lats' in fi_in.files:
+                clim.lats = fi_in['lats']
+                clim.lons = fi_in['lons']
+            clim.sources = [str(source) for source in fi_in['sources']]
+        return clim
+
+
+def _to_fraction(value):
+    """
+    Turns a number into an exact fraction of its decimal representation.
+
+    :param: value (float/int/Fraction) - number
+    :return: fraction (Fraction) - exact fraction
+    """
+    if isinstance(value, (Fraction, int)):
+        return Fraction(value)
+    return Fraction(str(value))
+
+
+def register_unit(unit, kind, scale, offset=0):
+    """
+    Adds a unit to the registry as an affine transform to the base unit of
+    its kind (base = value * scale + offset). Factors are kept as exact
+    fractions so that composed transforms do not accumulate rounding.
+
+    :param: unit (str) - name of unit
+    :param: kind (str) - kind of unit (e.g. temperature); only units of the
+                         same kind can be converted between
+    :param: scale (float/Fraction) - scale factor to the base unit
+    :param: offset (float/Fraction) - offset to the base unit after scaling
+    """
+    UNITS[unit] = (kind, _to_fraction(scale), _to_fraction(offset))
+
+
+UNITS = {}
+register_unit('K', 'temperature', 1)
+register_unit('C', 'temperature', 1, 273.15)
+register_unit('F', 'temperature', Fraction(5, 9),
+              Fraction('273.15') - Fraction(160, 9))
+register_unit('m', 'length', 1)
+register_unit('cm', 'length', 0.01)
+register_unit('mm', 'length', 0.001)
+register_unit('km', 'length', 1000)
+register_unit('in', 'length', 0.0254)
+register_unit('ft', 'length', 0.3048)
+register_unit('mi', 'length', 1609.344)
+register_unit('m/s', 'speed', 1)
+register_unit('km/h', 'speed', Fraction(10, 36))
+register_unit('mph', 'speed', Fraction('1609.344') / 3600)
+register_unit('kt', 'speed', Fraction(1852, 3600))
+
+CONVERSIONS = {'mm2in': ('mm', 'in'),
+               'c2f': ('C', 'F'),
+               'c2k': ('C', 'K'),
+               'f2k': ('F', 'K'),
+               'mps2mph': ('m/s', 'mph')}
+
+
+def compose_transforms(*transforms):
+    """
+    Fuses affine transforms, applied in the given order, into one.
+
+    :param: transforms (tuple) - (scale, offset) of each transform
+    :return: transform (tuple) - fused (scale, offset)
+    """
+    scale = 1
+    offset = 0
+    for transform_scale, transform_offset in transforms:
+        scale *= transform_scale
+        offset = offset * transform_scale + transform_offset
+    return scale, offset
+
+
+@profiler.Timer()
+def get_transform(from_unit, to_unit):
+    """
+    Gets the affine transform between two registered units.
+
+    :param: from_unit (str) - unit of input
+    :param: to_unit (str) - unit of output
+    :return: transform (tuple) - (scale, offset) so that
+                                 output = input * scale + offset
+    """
+    for unit in (from_unit, to_unit):
+        if unit not in UNITS:
+            print('Unit {} is not registered; see register_unit!'
+                  .format(unit))
+            raise(Unsupported)
+    from_kind, from_scale, from_offset = UNITS[from_unit]
+    to_kind, to_scale, to_offset = UNITS[to_unit]
+    if from_kind != to_kind:
+        print('Unable to convert {} ({}) to {} ({})!'
+              .format(from_unit, from_kind, to_unit, to_kind))
+        raise(Unsupported)
+    scale, offset = compose_transforms((from_scale, from_offset),
+                                       (1 / to_scale, -to_offset / to_scale))
+    return float(scale), float(offset)
+
+
+@profiler.Timer()
+def apply_transform(variable, transform, out=None, inplace=False):
+    """
+    Applies an affine transform with one multiply and one add, writing into
+    out (or variable itself if inplace) instead of allocating. Floating
+    point dtypes are preserved; out (or variable if inplace) has to be
+    floating point.
+
+    :param: variable (np.array) - variable values
+    :param: transform (tuple) - (scale, offset)
+    :param: out (np.array) - array to write the result into
+    :param: inplace (boolean) - overwrite variable with the result
+    :return: conv_var (np.array) - converted variable values
+    """
+    scale, offset = float(transform[0]), float(transform[1])
+    variable = np.asanyarray(variable)
+    if inplace:
+        out = variable
+    if out is not None and not np.issubdtype(out.dtype, np.floating):
+        print('Unable to write converted values into an array of dtype {}; '
+              'use a floating point array!'.format(out.dtype))
+        raise(Unsupported)
+    if out is None:
+        out = variable * scale
+    elif out is variable:
+        out *= scale
+    else:
+        np.multiply(variable, scale, out=out)
+    if offset != 0:
+        out += offset
+    return out
+
+
+@profiler.Timer()
+def convert_units(variable, from_unit, to_unit, out=None, inplace=False):
+    """
+    Converts the variable between two registered units.
+
+    :param: variable (np.array) - variable values
+    :param: from_unit (str) - unit of input (e.g. 'C')
+    :param: to_unit (str) - unit of output (e.g. 'F')
+    :param: out (np.array) - array to write the result into
+    :param: inplace (boolean) - overwrite variable with the result
+    :return: conv_var (np.array) - converted variable values
+    """
+    return apply_transform(variable, get_transform(from_unit, to_unit),
+                           out=out, inplace=inplace)
+
+
+@profiler.Timer()
 def convert(variable,
             mm2in=False,
             c2f=False,
             c2k=False,
             f2k=False,
             mps2mph=False,
-            reverse=False
+            reverse=False,
+            out=None,
+            inplace=False
             ):
     """
     Converts the variable from one unit to another.
@@ -133,180 +756,560 @@ def convert(variable,
     :param: f2k (boolean) - Fahrenheit to Kelvin
     :param: mps2mph (boolean) - meters per second to miles per hour
     :param: reverse (boolean) - reverses the conversions (mm2in becomes in2mm)
+    :param: out (np.array) - array to write the result into
+    :param: inplace (boolean) - overwrite variable with the result
     :return: conv_var (np.array) - converted variable values
     """
-    np_var = np.array(variable)
-    if not reverse:
-        if mm2in:
-            conv_var = np_var / 25.4
-        elif c2f:
-            conv_var = np_var * 1.8 + 32
-        elif c2k:
-            conv_var = np.var + 273.15
-        elif f2k:
-            conv_var = np_var * 1.8 + 32 + 273.15
-        elif mps2mph:
-            conv_var = np_var / 1609.344 * 3600
-    elif reverse:
-        if mm2in:
-            conv_var = np_var * 25.4
-        elif c2f:
-            conv_var = (np_var - 32) / 1.8
-        elif c2k:
-            conv_var = np.var - 273.15
-        elif f2k:
-            conv_var = (np_var - 32) / 1.8 - 273.15
-        elif mps2mph:
-            conv_var = np_var * 1609.344 / 3600
-    return conv_var
-
-
-def get_norm_anom(data_avg):
+    flags = (('mm2in', mm2in),
+             ('c2f', c2f),
+             ('c2k', c2k),
+             ('f2k', f2k),
+             ('mps2mph', mps2mph))
+    for name, flag in flags:
+        if flag:
+            from_unit, to_unit = CONVERSIONS[name]
+            if reverse:
+                from_unit, to_unit = to_unit, from_unit
+            return convert_units(variable, from_unit, to_unit,
+                                 out=out, inplace=inplace)
+    print('Please select a conversion, e.g. c2f=True!')
+    raise(MissingInput)
+
+
+@profiler.Timer()
+def get_norm_anom(data_avg, dtype=None):
     """
     Finds the normalized anomaly of some averaged data
 
     :param: data_avg (np.ma.array) - average data values
+    :param: dtype (np.dtype) - compute precision; float32 or float64
     :return: data_anom (float) - normalized anomaly
     """
+    if dtype is not None:
+        data_avg = np.ma.asarray(data_avg, dtype=_get_dtype(dtype))
     data_std = np.std(data_avg)
     data_clim = np.mean(data_avg)
-    data_anom = np.zeros_like(data_avg)
     data_anom = (data_avg - data_clim) / data_std
     return data_anom
 
 
+class RollingNormAnom(object):
+    """
+    Keeps a running mean and variance so the normalized anomaly of each new
+    value can be found without recomputing over the whole record. Uses
+    Welford's updates, over either an expanding window (all values so far)
+    or a fixed window of the latest values. Values can be scalars or whole
+    grids, in which case every grid point is tracked separately.
+
+    :param: window (int) - number of latest values to use; None to expand
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.buffer = None
+
+    def update(self, value):
+        """
+        Adds a new value and finds its normalized anomaly relative to the
+        values in the window, including itself.
+
+        :param: value (float/np.array) - new value or grid
+        :return: norm_anom (float/np.array) - normalized anomaly
+        """
+        value = np.asarray(value, dtype=float)
+        if self.mean is None:
+            self.mean = np.zeros_like(value)
+            self.m2 = np.zeros_like(value)
+            if self.window is not None:
+                self.buffer = np.zeros((self.window,) + value.shape)
+
+        if self.window is not None and self.count >= self.window:
+            pos = self.count % self.window
+            old_value = self.buffer[pos].copy()
+            old_mean = self.mean.copy()
+            self.mean += (value - old_value) / self.window
+            self.m2 += (value - old_value) * \
+                (value - self.mean + old_value - old_mean)
+            self.m2 = np.maximum(self.m2, 0)
+        else:
+            count = self.count + 1
+            delta = value - self.mean
+            self.mean += delta / count
+            self.m2 += delta * (value - self.mean)
+
+        if self.window is not None:
+            self.buffer[self.count % self.window] = value
+        self.count += 1
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (value - self.mean) / self.get_std()
+
+    def get_std(self):
+        """
+        Finds the standard deviation of the values in the window.
+
+        :return: std (float/np.array) - population standard deviation
+        """
+        if self.window is None:
+            count = self.count
+        else:
+            count = min(self.count, self.window)
+        return np.sqrt(self.m2 / max(count, 1))
+
+
+@profiler.Timer()
+def get_rolling_norm_anom(data, window=None, axis=0):
+    """
+    Finds the normalized anomaly of every value along an axis relative to
+    the values up to and including it, over an expanding or fixed window.
+    The last value of an expanding window matches get_norm_anom.
+
+    :param: data (np.array) - data values
+    :param: window (int) - number of latest values to use; None to expand
+    :param: axis (int) - axis to roll along (e.g. time)
+    :return: data_anom (np.array) - normalized anomalies, same shape as data
+    """
+    data = np.moveaxis(np.asarray(data, dtype=float), axis, 0)
+    data_anom = np.zeros_like(data)
+    rolling = RollingNormAnom(window=window)
+    for i in range(data.shape[0]):
+        data_anom[i] = rolling.update(data[i])
+    return np.moveaxis(data_anom, 0, axis)
+
+
+def _get_partial_avg(block, axis, dtype=None):
+    """
+    Sums a block and counts its valid values over the given axis.
+
+    :param: block (np.ma.array) - block of data
+    :param: axis (tuple) - axis to sum over
+    :param: dtype (np.dtype) - compute precision; None for the data's
+    :return: block_sum, block_count (np.array, np.array) - sum and count
+    """
+    block = np.ma.asarray(block, dtype=dtype)
+    block_sum = np.ma.filled(np.ma.sum(block, axis=axis, dtype=dtype), 0)
+    block_count = np.ma.count(block, axis=axis)
+    return block_sum, block_count
+
+
+def _get_avg(data, selection, axis, workers, chunk_size, split_axis,
+             use_processes, dtype=None):
+    """
+    Averages the selection of data over axis, serially or in parallel blocks.
+
+    :param: data (np.ma.array/netCDF4.Variable) - input data
+    :param: selection (tuple) - slice or index array per dimension
+    :param: axis (tuple) - axis to average over
+    :param: workers (int) - number of parallel workers; None for serial
+    :param: chunk_size (int) - length of each block along split_axis
+    :param: split_axis (int) - axis to split the blocks along
+    :param: use_processes (boolean) - use a process pool instead of threads
+    :param: dtype (np.dtype) - compute precision; None for the data's
+    :return: avg (np.ma.array) - average over given parameters
+    """
+    if workers is None and chunk_size is None:
+        if dtype is None:
+            block = ext.read_selection(data, selection)
+            ext.add_nc_bytes_read(data, block)
+            return np.ma.average(block, axis=axis)
+        if dtype == np.float32:
+            chunk_size = SINGLE_CHUNK_SIZE
+
+    ndim = len(selection)
+    if axis is None:
+        axis = tuple(range(ndim))
+    elif np.isscalar(axis):
+        axis = (axis,)
+    axis = tuple(sorted(ax % ndim for ax in axis))
+    split_axis = split_axis % ndim
+
+    split_sel = selection[split_axis]
+    if isinstance(split_sel, slice):
+        split_idc = np.arange(*split_sel.indices(data.shape[split_axis]))
+    else:
+        split_idc = split_sel
+    len_split = len(split_idc)
+    if len_split == 0:
+        return np.ma.average(
+            np.ma.asarray(ext.read_selection(data, selection), dtype=dtype),
+            axis=axis)
+    if chunk_size is None and workers is None:
+        chunk_size = len_split
+    elif chunk_size is None:
+        chunk_size = int(np.ceil(len_split / float(workers)))
+    if workers is None:
+        workers = 1
+
+    def read_blocks():
+        for start, end in _get_chunks(len_split, chunk_size):
+            block_selection = list(selection)
+            block_selection[split_axis] = ext.get_selection(
+                split_idc[start:end], data.shape[split_axis])
+            block = ext.read_selection(data, tuple(block_selection))
+            ext.add_nc_bytes_read(data, block)
+            yield block
+
+    if use_processes:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers)
+
+    partials = []
+    with pool:
+        pending = []
+        for block in read_blocks():
+            pending.append(pool.submit(_get_partial_avg, block, axis, dtype))
+            if len(pending) >= workers:
+                partials.append(pending.pop(0).result())
+        partials.extend(future.result() for future in pending)
+
+    if split_axis in axis:
+        avg_sum = partials[0][0]
+        comp = np.zeros_like(avg_sum)
+        for partial in partials[1:]:
+            avg_sum, comp = _kahan_add(avg_sum, comp, partial[0])
+        avg_count = sum(partial[1] for partial in partials)
+    else:
+        out_axis = split_axis - len([ax for ax in axis if ax < split_axis])
+        avg_sum = np.concatenate(
+            [partial[0] for partial in partials], axis=out_axis)
+        avg_count = np.concatenate(
+            [partial[1] for partial in partials], axis=out_axis)
+
+    avg_count = np.asarray(avg_count)
+    avg = avg_sum / np.maximum(avg_count, 1)
+    if dtype is not None:
+        avg = np.asarray(avg).astype(dtype)
+    avg = np.ma.masked_where(avg_count == 0, avg)
+    if avg.ndim == 0:
+        return avg[()]
+    return avg
+
+
+@profiler.Timer()
 def get_avg(data, axis=(0),
             times_idc=None,
             lats_idc=None,
             lons_idc=None,
             lvls_idc=None,
-            change_lvl_order=False):
+            change_lvl_order=False,
+            workers=None,
+            chunk_size=None,
+            split_axis=0,
+            use_processes=False,
+            dims=None,
+            idc=None,
+            dtype=None):
     """
-    Finds the areal and/or time average and/or level, but first,
+    Finds the areal and/or time average and/or level. Unless dims is given,
     data dimensions must be in these orders:
     lat, lon
     time, lat, lon
     time, level, lat, lon OR time, lat, lon, level (if change_lvl_order)
 
+    Any dimension can be named in dims and selected through idc with an
+    index array, boolean mask or slice; the named *_idc inputs fill in the
+    'time', 'lat', 'lon' and 'lvl' dimensions. Evenly spaced indices are
+    read as slices (views), and only irregular ones are gathered. Every
+    given index is included.
+
+    If workers or chunk_size is given, the selection is split into blocks
+    along split_axis (e.g. 0 for time, 1 for level); each block's sums and
+    counts are reduced on a thread (or process) pool and combined exactly,
+    so only a few blocks are in memory at once.
+
+    With dtype=np.float32, blocks are summed in single precision and their
+    partial sums are combined with Kahan compensation.
+
     :param: data (np.ma.array) - input data
-    :param: axis (tuple) - axis to average over
+    :param: axis (tuple) - axis (int or dimension name) to average over
     :param: times_idc (np.array) - time indices
     :param: lats_idc (np.array) - latitude indices
     :param: lons_idc (np.array) - longitude indices
     :param: lvls_idc (float) - level indices
     :param: change_lvl_order (boolean) - changes order of level dimension
+    :param: workers (int) - number of parallel workers; None for serial
+    :param: chunk_size (int) - length of each block along split_axis
+    :param: split_axis (int) - axis (or dimension name) to split blocks along
+    :param: use_processes (boolean) - use a process pool instead of threads
+    :param: dims (tuple) - names of the data dimensions, in order
+    :param: idc (dict) - dimension name to indices, mask or slice
+    :param: dtype (np.dtype) - compute precision; float32 or float64
 
     :return: avg (np.array) - average over given parameters
     """
-    data_shp = data.shape
+    ndim = len(data.shape)
 
-    if len(data_shp) == 2:
-        if lats_idc is None:
-            lat_start_idc = 0
-            lat_end_idc = data_shp[0]
-        else:
-            lat_start_idc = lats_idc.min()
-            lat_end_idc = lats_idc.max()
-        if lons_idc is None:
-            lon_start_idc = 0
-            lon_end_idc = data_shp[1]
-        else:
-            lon_start_idc = lons_idc.min()
-            lon_end_idc = lons_idc.max()
-        return np.ma.average(data[
-                               lat_start_idc:lat_end_idc,
-                               lon_start_idc:lon_end_idc
-                               ],
-                             axis=axis)
-
-    if len(data_shp) == 3:
-        if times_idc is None:
-            time_start_idc = 0
-            time_end_idc = data_shp[0]
-        else:
-            time_start_idc = times_idc.min()
-            time_end_idc = times_idc.max()
-        if lats_idc is None:
-            lat_start_idc = 0
-            lat_end_idc = data_shp[1]
+    if dims is None:
+        if ndim == 2:
+            dims = ('lat', 'lon')
+        elif ndim == 3:
+            dims = ('time', 'lat', 'lon')
+        elif ndim == 4 and change_lvl_order:
+            dims = ('time', 'lat', 'lon', 'lvl')
+        elif ndim == 4:
+            dims = ('time', 'lvl', 'lat', 'lon')
         else:
-            lat_start_idc = lats_idc.min()
-            lat_end_idc = lats_idc.max()
-        if lons_idc is None:
-            lon_start_idc = 0
-            lon_end_idc = data_shp[2]
-        else:
-            lon_start_idc = lons_idc.min()
-            lon_end_idc = lons_idc.max()
-        return np.ma.average(data[
-                               time_start_idc:time_end_idc,
-                               lat_start_idc:lat_end_idc,
-                               lon_start_idc:lon_end_idc
-                               ],
-                             axis=axis)
-
-    if len(data_shp) == 4:
-        if change_lvl_order:
-            if times_idc is None:
-                time_start_idc = 0
-                time_end_idc = data_shp[0]
-            else:
-                time_start_idc = times_idc.min()
-                time_end_idc = times_idc.max()
-            if lats_idc is None:
-                lat_start_idc = 0
-                lat_end_idc = data_shp[1]
-            else:
-                lat_start_idc = lats_idc.min()
-                lat_end_idc = lats_idc.max()
-            if lons_idc is None:
-                lon_start_idc = 0
-                lon_end_idc = data_shp[2]
-            else:
-                lon_start_idc = lons_idc.min()
-                lon_end_idc = lons_idc.max()
-            if lvls_idc is None:
-                lvl_start_idc = 0
-                lvl_end_idc = data_shp[3]
-            else:
-                lvl_start_idc = lvls_idc.min()
-                lvl_end_idc = lvls_idc.max()
-            return np.ma.average(data[
-                                   time_start_idc:time_end_idc,
-                                   lat_start_idc:lat_end_idc,
-                                   lon_start_idc:lon_end_idc,
-                                   lvl_start_idc:lvl_end_idc,
-                                   ],
-                                 axis=axis)
+            print('Please name the {} dimensions with dims!'.format(ndim))
+            raise(MissingInput)
+    dims = tuple(dims)
+    if len(dims) != ndim:
+        print('Given dims {} do not match data with {} dimensions!'
+              .format(dims, ndim))
+        raise(Unsupported)
+
+    dims_idc = {'time': times_idc,
+                'lat': lats_idc,
+                'lon': lons_idc,
+                'lvl': lvls_idc}
+    if idc is not None:
+        dims_idc.update(idc)
+    selection = tuple(ext.get_selection(dims_idc.get(dim), length)
+                      for dim, length in zip(dims, data.shape))
+
+    if isinstance(axis, str):
+        axis = dims.index(axis)
+    elif axis is not None and not np.isscalar(axis):
+        axis = tuple(dims.index(ax) if isinstance(ax, str) else ax
+                     for ax in axis)
+    if isinstance(split_axis, str):
+        split_axis = dims.index(split_axis)
+
+    if dtype is not None:
+        dtype = _get_dtype(dtype)
+    return _get_avg(data, selection, axis, workers, chunk_size, split_axis,
+                    use_processes, dtype=dtype)
+
+
+def _is_global(lons):
+    """
+    Checks whether longitudes go all the way around the globe.
+
+    :param: lons (np.array) - cell center longitudes
+    :return: is_global (boolean) - whether the last cell meets the first
+    """
+    if len(lons) < 2:
+        return False
+    step = np.median(np.abs(np.diff(lons)))
+    span = np.ptp(lons)
+    return bool(np.isclose(span + step, 360, atol=step * 1e-3))
+
+
+def _get_linear_weights(src, dst, periodic=False):
+    """
+    Finds 1D linear interpolation weights; destination points outside the
+    source range get no weights.
+
+    :param: src (np.array) - source coordinates, in any monotonic order
+    :param: dst (np.array) - destination coordinates
+    :param: periodic (boolean) - wrap around 360 degrees
+    :return: weights (scipy.sparse.csr_matrix) - (len(dst), len(src))
+    """
+    order = np.argsort(src, kind='mergesort')
+    src_sorted = src[order]
+    if periodic:
+        src_sorted = np.append(src_sorted, src_sorted[0] + 360)
+        order = np.append(order, order[0])
+        dst = (dst - src_sorted[0]) % 360 + src_sorted[0]
+
+    valid = (dst >= src_sorted[0]) & (dst <= src_sorted[-1])
+    rows = np.where(valid)[0]
+    dst = dst[valid]
+    if len(src_sorted) < 2:
+        cols = np.zeros(len(rows), dtype=int)
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                 shape=(len(valid), len(src)))
+
+    idc = np.clip(np.searchsorted(src_sorted, dst, side='right') - 1,
+                  0, len(src_sorted) - 2)
+    width = src_sorted[idc + 1] - src_sorted[idc]
+    upper = np.where(width > 0,
+                     (dst - src_sorted[idc]) / np.where(width > 0, width, 1),
+                     0)
+    return sparse.csr_matrix(
+        (np.concatenate((1 - upper, upper)),
+         (np.concatenate((rows, rows)),
+          np.concatenate((order[idc], order[idc + 1])))),
+        shape=(len(valid), len(src)))
+
+
+def _get_bounds(centers, lower=-np.inf, upper=np.inf):
+    """
+    Guesses cell bounds halfway between centers, extrapolating at the ends.
+
+    :param: centers (np.array) - cell centers, in monotonic order
+    :param: lower (float) - lowest allowed bound
+    :param: upper (float) - highest allowed bound
+    :return: lows, highs (np.array, np.array) - lower and upper bounds
+    """
+    if len(centers) < 2:
+        edges = np.array([centers[0] - 0.5, centers[0] + 0.5])
+    else:
+        mids = (centers[1:] + centers[:-1]) / 2.
+        edges = np.concatenate(([2 * centers[0] - mids[0]], mids,
+                                [2 * centers[-1] - mids[-1]]))
+    edges = np.clip(edges, lower, upper)
+    return np.minimum(edges[:-1], edges[1:]), np.maximum(edges[:-1],
+                                                         edges[1:])
+
+
+def _get_overlap_weights(src_lows, src_highs, dst_lows, dst_highs,
+                         shifts=(0,)):
+    """
+    Finds the fraction of each destination cell covered by each source cell
+    in 1D.
+
+    :param: src_lows, src_highs (np.array, np.array) - source cell bounds
+    :param: dst_lows, dst_highs (np.array, np.array) - destination bounds
+    :param: shifts (tuple) - offsets of the source cells to also try
+                             (i.e. -360, 0 and 360 for longitudes)
+    :return: weights (scipy.sparse.csr_matrix) - (len(dst), len(src))
+    """
+    overlap = 0
+    for shift in shifts:
+        overlap = overlap + np.clip(
+            np.minimum(dst_highs[:, None], src_highs[None, :] + shift) -
+            np.maximum(dst_lows[:, None], src_lows[None, :] + shift),
+            0, None)
+    size = dst_highs - dst_lows
+    overlap = overlap / np.where(size > 0, size, 1)[:, None]
+    return sparse.csr_matrix(overlap)
+
+
+def _get_regrid_key(src_lats, src_lons, dst_lats, dst_lons, method):
+    """
+    Fingerprints a pair of grids and a method.
+
+    :param: src_lats, src_lons (np.array, np.array) - source grid
+    :param: dst_lats, dst_lons (np.array, np.array) - destination grid
+    :param: method (str) - regridding method
+    :return: key (str) - hex digest
+    """
+    key_hash = hashlib.sha1(method.encode('utf-8'))
+    for coord in (src_lats, src_lons, dst_lats, dst_lons):
+        key_hash.update(str(coord.shape).encode('utf-8'))
+        key_hash.update(np.ascontiguousarray(coord).tobytes())
+    return key_hash.hexdigest()
+
+
+@profiler.Timer()
+def get_regrid_weights(src_lats, src_lons, dst_lats, dst_lons,
+                       method='bilinear', cache_dir=None):
+    """
+    Computes (once) the sparse matrix that maps a rectilinear source grid
+    onto a rectilinear destination grid. Bilinear weights interpolate
+    between the four surrounding centers; conservative weights are the
+    fraction of each destination cell's area covered by each source cell.
+    Longitudes spanning the globe wrap around. Weights are kept in memory
+    and, if a cache directory is set, on disk keyed by both grids.
+
+    :param: src_lats (np.array) - source latitudes
+    :param: src_lons (np.array) - source longitudes
+    :param: dst_lats (np.array) - destination latitudes
+    :param: dst_lons (np.array) - destination longitudes
+    :param: method (str) - 'bilinear' or 'conservative'
+    :param: cache_dir (str) - directory of .npz weights; defaults to the
+                              directory given to ext.set_coord_cache
+    :return: weights (scipy.sparse.csr_matrix) - (destination points,
+             source points) with points in (lat, lon) order
+    """
+    if method not in REGRID_METHODS:
+        print('Method {} is not one of {}!'.format(method, REGRID_METHODS))
+        raise(Unsupported)
+    src_lats, src_lons, dst_lats, dst_lons = [
+        np.asarray(coord, dtype=np.float64).ravel()
+        for coord in (src_lats, src_lons, dst_lats, dst_lons)]
+
+    key = _get_regrid_key(src_lats, src_lons, dst_lats, dst_lons, method)
+    if key in REGRID_CACHE:
+        REGRID_CACHE[key] = REGRID_CACHE.pop(key)
+        return REGRID_CACHE[key]
+
+    if cache_dir is None:
+        cache_dir = ext.COORD_CACHE_SETTINGS['directory']
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir,
+                                  'regrid_{}_{}.npz'.format(method, key))
+
+    if cache_path is not None and os.path.isfile(cache_path):
+        with np.load(cache_path) as fi_in:
+            weights = sparse.csr_matrix(
+                (fi_in['data'], fi_in['indices'], fi_in['indptr']),
+                shape=tuple(fi_in['shape']))
+    else:
+        periodic = _is_global(src_lons)
+        if method == 'bilinear':
+            lat_weights = _get_linear_weights(src_lats, dst_lats)
+            lon_weights = _get_linear_weights(src_lons, dst_lons,
+                                              periodic=periodic)
         else:
-            if times_idc is None:
-                time_start_idc = 0
-                time_end_idc = data_shp[0]
-            else:
-                time_start_idc = times_idc.min()
-                time_end_idc = times_idc.max()
-            if lvls_idc is None:
-                lvl_start_idc = 0
-                lvl_end_idc = data_shp[1]
-            else:
-                lvl_start_idc = lvls_idc.min()
-                lvl_end_idc = lvls_idc.max()
-            if lats_idc is None:
-                lat_start_idc = 0
-                lat_end_idc = data_shp[2]
-            else:
-                lat_start_idc = lats_idc.min()
-                lat_end_idc = lats_idc.max()
-            if lons_idc is None:
-                lon_start_idc = 0
-                lon_end_idc = data_shp[3]
-            else:
-                lon_start_idc = lons_idc.min()
-                lon_end_idc = lons_idc.max()
-            return np.ma.average(data[
-                                   time_start_idc:time_end_idc,
-                                   lvl_start_idc:lvl_end_idc,
-                                   lat_start_idc:lat_end_idc,
-                                   lon_start_idc:lon_end_idc,
-                                   ],
-                                 axis=axis)
+            src_sin = [np.sin(np.radians(bounds)) for bounds in
+                       _get_bounds(src_lats, -90, 90)]
+            dst_sin = [np.sin(np.radians(bounds)) for bounds in
+                       _get_bounds(dst_lats, -90, 90)]
+            lat_weights = _get_overlap_weights(*(src_sin + dst_sin))
+            lon_weights = _get_overlap_weights(
+                *(_get_bounds(src_lons) + _get_bounds(dst_lons)),
+                shifts=(-360, 0, 360))
+        weights = sparse.kron(lat_weights, lon_weights, format='csr')
+        weights.eliminate_zeros()
+        if cache_path is not None:
+            np.savez(cache_path, data=weights.data, indices=weights.indices,
+                     indptr=weights.indptr, shape=np.array(weights.shape))
+
+    REGRID_CACHE[key] = weights
+    while len(REGRID_CACHE) > REGRID_CACHE_SIZE:
+        REGRID_CACHE.popitem(last=False)
+    return weights
+
+
+@profiler.Timer()
+def regrid(data, src_lats, src_lons, dst_lats, dst_lons,
+           method='bilinear', weights=None, cache_dir=None, dtype=None):
+    """
+    Regrids a stack of fields between rectilinear grids with one sparse
+    product for all of its leading (i.e. time) indices. Masked or NaN
+    source points are left out and the weights of the rest renormalized;
+    destination points with no valid source are masked.
+
+    :param: data (np.ma.array/netCDF4.Variable) - data shaped
+                                                  (..., lat, lon)
+    :param: src_lats (np.array) - source latitudes
+    :param: src_lons (np.array) - source longitudes
+    :param: dst_lats (np.array) - destination latitudes
+    :param: dst_lons (np.array) - destination longitudes
+    :param: method (str) - 'bilinear' or 'conservative'
+    :param: weights (scipy.sparse.csr_matrix) - precomputed weights from
+                                                get_regrid_weights
+    :param: cache_dir (str) - directory of .npz weights
+    :param: dtype (np.dtype) - compute precision
+    :return: regridded (np.ma.array) - data shaped (..., dst lat, dst lon)
+    """
+    dtype = _get_dtype(dtype)
+    if weights is None:
+        weights = get_regrid_weights(src_lats, src_lons, dst_lats, dst_lons,
+                                     method=method, cache_dir=cache_dir)
+    values = data[...]
+    ext.add_nc_bytes_read(data, values)
+    data = np.ma.asarray(values)
+    lead_shape = data.shape[:-2]
+    stack = np.ma.asarray(data, dtype=dtype).reshape(-1, weights.shape[1])
+
+    values = np.ma.getdata(stack)
+    valid = ~np.ma.getmaskarray(stack) & np.isfinite(values)
+    if valid.all():
+        total = weights.dot(values.T).T
+        norm = np.asarray(weights.sum(axis=1)).ravel()[None, :]
+    else:
+        total = weights.dot(np.where(valid, values, 0).T).T
+        norm = weights.dot(valid.T.astype(dtype)).T
+    covered = norm > 1e-6
+    regridded = np.ma.masked_where(
+        ~np.broadcast_to(covered, total.shape),
+        total / np.where(covered, norm, 1))
+    return regridded.astype(dtype).reshape(
+        lead_shape + (len(np.ravel(dst_lats)), len(np.ravel(dst_lons))))
\ No newline at end of file
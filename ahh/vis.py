@@ -10,6 +10,8 @@ import matplotlib.pyplot as plt
 from matplotlib.dates import YearLocator, MonthLocator, DayLocator,\
                              HourLocator, DateFormatter
 
+from ahh import profiler
+
 __author__ = 'huang.andrew12@gmail.com'
 __copyright__ = 'Andrew Huang'
 
@@ -22,6 +24,7 @@ class Unsupported(Exception):
     pass
 
 
+@profiler.Timer()
 def plot(
          x,
          y,
@@ -358,6 +361,7 @@ def plot(
     return fig
 
 
+@profiler.Timer()
 def plot_map(
              data, lat, lon,
              vmin, vmax,
@@ -469,6 +473,7 @@ def plot_map(
     return fig, ax
 
 
+@profiler.Timer()
 def prettify_plot(ax):
     """
     Input ax and get a pretty plot back!
@@ -495,6 +500,7 @@ def prettify_plot(ax):
     return ax
 
 
+@profiler.Timer()
 def set_labels(ax, xlabel, ylabel, title=''):
     """
     Input ax and names of xlabel and ylabel to return a
@@ -510,6 +516,7 @@ def set_labels(ax, xlabel, ylabel, title=''):
     ax.set_title(title, fontsize=21, y=1.03, color='.50')
 
 
+@profiler.Timer()
 def set_legend(ax,
                color='0.5',
                fontsize='16.5',
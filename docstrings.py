@@ -10,16 +10,84 @@ __copyright__ = 'Andrew Huang'
 ##############################################################################
 
 
-def wget_fi(base_url, glob_str, user=None, pwd=None, directory=None):
+class Downloader(object):
     """
-    Wrapper of wget; downloads files that matches the given glob_str. Can input
-    username and password if authentication is required.
+    Fetches files of a remote HTTP(S) or FTP directory concurrently over a
+    bounded pool of reused connections (one per worker at most). Partial
+    downloads are kept as .part files and resumed with HTTP range requests
+    or FTP REST; failed attempts are retried with exponential backoff.
+    HTTP redirects are followed, up to MAX_REDIRECTS at a time.
+    Credentials are sent as HTTP basic auth or an FTP login, never on a
+    command line, and are looked up in ~/.netrc if not given; basic auth
+    is not sent to hosts the server redirects to.
 
     :param: base_url (str) - the dir of all the to be downloaded files
-    :param: glob_str (str) - the naming pattern of the files
     :param: user (str) - username
     :param: pwd (str) - password
+    :param: workers (int) - number of concurrent downloads and connections
+    :param: retries (int) - retries per file after the first attempt
+    :param: backoff (float) - seconds to wait before the first retry,
+                              doubled for each retry after
+    :param: timeout (float) - seconds to wait on the network
+    """
+
+
+def get_checksum(file_path, algorithm='sha256'):
+    """
+    Computes the checksum of a file, reading it in chunks.
+
+    :param: file_path (str) - path of the file
+    :param: algorithm (str) - any algorithm of hashlib
+    :return: checksum (str) - hex digest
+    """
+
+
+class Manifest(object):
+    """
+    Local record of every file downloaded into a directory: its remote size,
+    modification time and ETag, its sha256 checksum, and whether it was
+    completed, saved as JSON after each change so interrupted runs keep
+    what they finished.
+
+    :param: file_path (str) - path of the manifest
+    """
+
+
+def wget_fi(base_url, glob_str, user=None, pwd=None, directory=None,
+            workers=4, retries=3, backoff=1., timeout=60., clobber=False,
+            manifest=True, verify='size', check_remote=True,
+            adopt_unverified=False):
+    """
+    Downloads files that match the given glob_str from an HTTP(S) or FTP
+    directory, several at a time over reused connections; interrupted
+    downloads are resumed and failures retried with backoff. A manifest in
+    the directory records what was downloaded, so re-runs only fetch new,
+    changed or incomplete files. Can input username and password if
+    authentication is required; they are never put on a command line.
+
+    :param: base_url (str) - the dir of all the to be downloaded files
+    :param: glob_str (str) - the naming pattern of the files
+    :param: user (str) - username; defaults to ~/.netrc
+    :param: pwd (str) - password; defaults to ~/.netrc
     :param: directory (str) - name of directory for files to be saved
+    :param: workers (int) - number of concurrent downloads
+    :param: retries (int) - retries per file after the first attempt
+    :param: backoff (float) - seconds before the first retry, then doubled
+    :param: timeout (float) - seconds to wait on the network
+    :param: clobber (boolean) - download files that already exist
+    :param: manifest (boolean) - keep a manifest; if False existing files
+                                 are skipped by name only, like wget -nc
+    :param: verify (str) - check files already downloaded by 'size',
+                           'checksum' or not at all (None)
+    :param: check_remote (boolean) - ask the server whether downloaded
+                                     files changed, by a HEAD request (no
+                                     body) per file or the FTP listing
+    :param: adopt_unverified (boolean) - keep files already on disk that
+                                         the server gives no size for,
+                                         instead of downloading them again
+    :return: results (OrderedDict) - file name to a dict of path, status
+             ('downloaded', 'skipped' or 'failed'), bytes, attempts,
+             error and, with a manifest, the reason it was fetched
     """
 
 
@@ -52,6 +120,45 @@ def concat_nc(glob_str, output_fi, directory='./', rec_dim=None):
 ##############################################################################
 
 
+def add_nc_bytes_read(source, block):
+    """
+    Credits the bytes of block to the running timers if it was read from a
+    netCDF4 variable; arrays already in memory are not counted, and
+    LazyVar and MultiFileVar credit their own reads.
+
+    :param: source (np.array/netCDF4.Variable) - data the block came from
+    :param: block (np.ma.array) - values read
+    """
+
+
+
+def get_summary(variable,
+                fillval_high=99999.,
+                fillval_low=-99999.,
+                quantiles=(0.01, 0.25, 0.5, 0.75, 0.99),
+                sample_size=100000,
+                chunk_size=None,
+                seed=0):
+    """
+    Summarizes a variable in a single chunked pass along its first axis,
+    so lazy netCDF4 variables (or LazyVar/MultiFileVar) never have to be
+    loaded whole. Mean and standard deviation are merged chunk by chunk;
+    quantiles are approximated from a uniform random sample of the valid
+    values (exact if there are fewer than sample_size).
+
+    :param: variable (array/netCDF4.Variable) - variable to be summarized
+    :param: fillval_high (float) - values equal/greater are counted as fill
+    :param: fillval_low (float) - values equal/less are counted as fill
+    :param: quantiles (tuple) - quantiles to approximate, from 0 to 1
+    :param: sample_size (int) - number of values kept for the quantiles
+    :param: chunk_size (int) - number of first-axis rows to read at a time;
+                               defaults to about 10 million values per read
+    :param: seed (int) - seed of the random sample
+    :return: summary (dict) - size, valid, masked, nan and fill counts,
+             min, max, mean, std and quantiles
+    """
+
+
 def ahh(variable,
         n='ahh',
         center=3,
@@ -60,15 +167,19 @@ def ahh(variable,
         precision=2,
         edgeitems=5,
         suppress=True,
-        fillval_high=9999.,
-        fillval_low=-9999.,
+        fillval_high=99999.,
+        fillval_low=-99999.,
         snippet=True,
         time=0,
         level=0,
+        stream=False,
+        chunk_size=None,
         ):
     """
     Explores type, unnested type, length, and shape of a variable.
     Can optionally include a name to differentiate from other 'ahh's.
+    If stream, the statistics come from get_summary in one chunked pass and
+    only the snippet is read, so lazy netCDF4 variables are never loaded.
 
     :param: variable (array) - variable to be evaluated
     :param: n (boolean) - name of variable
@@ -85,6 +196,9 @@ def ahh(variable,
     :param: snippet (boolean) - whether to exclude snippet of values
     :param: time (integer) - index of time to print in snippet
     :param: level (integer) - index of time to print in snippet
+    :param: stream (boolean) - summarize in chunks without loading variable
+    :param: chunk_size (int) - number of first-axis rows to read at a time
+    :return: summary (dict) - if stream, the summary from get_summary
     """
 
 
@@ -97,13 +211,32 @@ def p(num=1):
     print('\n######## MARK {} ########\n'.format(num))
 
 
-def lonw2e(lon, array=False, reverse=False):
+def lonw2e(lon, reverse=False):
     """
     Converts a west longitude to east longitude, can also do in reverse.
-    :param: lon (int) - a west longitude
-    :param: reverse (boolean) - indicator whether input is an array
-    :param: array (boolean) - indicator whether to go the other direction
-    :return: translated_lon (int) - translated longitude
+    Works on scalars and arrays alike.
+
+    :param: lon (float/np.array) - west longitude(s)
+    :param: reverse (boolean) - indicator whether to go the other direction
+    :return: translated_lon (float/np.array) - translated longitude(s)
+    """
+
+
+class RecenteredVar(object):
+    """
+    Reader of a variable with its longitude axis rotated to another
+    convention (i.e. 0 to 360 as -180 to 180) without copying it. Indices
+    are given in the new convention and translated to at most two
+    hyperslabs of the original, one per side of the seam; a request that
+    falls on one side is returned as a view for arrays (or one read for
+    netCDF4 variables), and only a request spanning the seam is joined.
+
+    :param: variable (np.array/netCDF4.Variable/LazyVar/MultiFileVar) -
+            data with a longitude axis
+    :param: lons (np.array) - ascending longitudes of the variable
+    :param: west (float) - western edge of the new convention; -180 for
+                           -180 to 180, 0 for 0 to 360
+    :param: axis (int) - longitude axis of the variable
     """
 
 
@@ -115,9 +248,16 @@ def get_idc(lats,
             right_lon,
             maxmin=False,
             w2e=False,
-            e2w=False):
+            e2w=False,
+            slices=False,
+            monotonic=None):
     """
     Finds the indices for given latitudes and longitudes boundary.
+    Monotonic (ascending or descending) coordinates are searched by binary
+    search; others fall back to a full scan. If left_lon is greater than
+    right_lon, the box is taken to wrap around the end of the longitudes
+    (i.e. 350 to 10) and the indices from both sides are returned in
+    west-to-east order.
 
     :param: lats (np.array) - array of latitudes
     :param: lons (np.array) - array of longitudes
@@ -128,35 +268,52 @@ def get_idc(lats,
     :param: maxmin (boolean) - return only the max and min of lat/lon idc
     :param: w2e (boolean) - convert input west longitudes to east longitudes
     :param: e2w (boolean) - convert input east longitudes to west longitudes
+    :param: slices (boolean) - return ready-to-use slices instead of indices;
+                               a wrapped lon box gives a tuple of two slices
+    :param: monotonic (boolean) - whether lats and lons are known to be
+                                  sorted, to skip checking their order;
+                                  False to always scan
     :return: lats_idc, lons_idc (np.array, np.array) - indices of lats/lons
     :return: lat_start_idc, lat_end_idc, lon_start_idc, lon_end_idc -
              (np.int64, np.int64, np.int64, np.int64)
              the lowest and highest lat/lon indices
+    :return: lat_slice, lon_slice (slice, slice) - if slices
     """
 
 
-def get_lvl_idc(lvls, lower_lvl, upper_lvl, maxmin=False):
+def get_lvl_idc(lvls, lower_lvl, upper_lvl, maxmin=False, slices=False,
+                monotonic=None):
     """
     Finds the level indices for given lower and upper boundary.
+    Monotonic levels are searched by binary search.
 
     :param: lvls (np.array) - array of levels
     :param: lower_lvl (float) - lower level boundary
     :param: upper_lvl (float) - upper level boundary
     :param: maxmin (boolean) - return only the max and min of level idc
+    :param: slices (boolean) - return a ready-to-use slice instead
+    :param: monotonic (boolean) - whether lvls are known to be sorted, to
+                                  skip checking their order; False to
+                                  always scan
     :return: lvls_idc (np.array) - indices of levels
     :return: lvl_start_idc, lvl_end_idc - (np.int64, np.int64)
              the lowest and highest level indices
+    :return: lvl_slice (slice) - if slices
     """
 
 
 def get_time_idc(times, start_yr, end_yr,
                  start_mth=1, end_mth=12,
                  start_day=1, end_day=31,
-                 maxmin=False):
+                 maxmin=False,
+                 slices=False,
+                 monotonic=None):
     """
     Finds the time indices for given start time and end time.
+    Monotonic times are searched by binary search; np.datetime64 times
+    are compared natively.
 
-    :param: times (np.array) - array of datetimes
+    :param: times (np.array) - array of datetimes or np.datetime64
     :param: start_yr (int) - lower year boundary
     :param: end_yr (int) - upper year boundary
     :param: start_mth (int) - lower month boundary
@@ -164,9 +321,14 @@ def get_time_idc(times, start_yr, end_yr,
     :param: start_day (int) - lower day boundary
     :param: end_day (int) - upper day boundary
     :param: maxmin (boolean) - return only the max and min of time idc
+    :param: slices (boolean) - return a ready-to-use slice instead
+    :param: monotonic (boolean) - whether times are known to be sorted, to
+                                  skip checking their order; False to
+                                  always scan
     :return: times_idc (np.array) - indices of times
     :return: time_start_idc, time_end_idc - (np.int64, np.int64)
              the lowest and highest time indices
+    :return: time_slice (slice) - if slices
     """
 
 
@@ -182,6 +344,114 @@ def get_closest(data, target_val, type_var='typical'):
     """
 
 
+def get_closest_arr(data, target_vals, type_var='typical'):
+    """
+    Get the closest values and indices to many target values at once, with
+    one sort of data and a binary search per target. Ties go to the smaller
+    value, and repeated values to their first index.
+
+    :param: data (np.array) - data
+    :param: target_vals (np.array) - target values
+    :param: type_var (str) - typical (float) or datetime (datetime.datetime,
+                             cftime or np.datetime64)
+
+    :return: closest_vals, closest_val_idc (np.array, np.array) -
+             the closest values to the target values and their indices
+    """
+
+
+class GridTree(object):
+    """
+    Spatial index of a grid, built once as a KD-tree on the unit sphere so
+    nearest gridpoint lookups work on curvilinear (2D lat/lon) grids, near
+    the poles and across the dateline alike. See get_grid_tree to reuse a
+    tree between calls and runs.
+
+    :param: lats (np.array) - 2D latitudes, or 1D for a rectilinear grid
+    :param: lons (np.array) - 2D longitudes, or 1D for a rectilinear grid
+    :param: mask (np.array) - True where gridpoints are left out
+                              (i.e. land on an ocean grid)
+    """
+
+
+def get_grid_tree(lats, lons, mask=None, cache=True):
+    """
+    Builds a GridTree, or reuses one of an identical grid; trees are kept in
+    memory and, if ext.set_coord_cache was given a directory, on disk so
+    later runs skip the build.
+
+    :param: lats (np.array) - 2D latitudes, or 1D for a rectilinear grid
+    :param: lons (np.array) - 2D longitudes, or 1D for a rectilinear grid
+    :param: mask (np.array) - True where gridpoints are left out
+    :param: cache (boolean) - look up and store the tree in the cache
+    :return: grid_tree (GridTree) - spatial index of the grid
+    """
+
+
+def get_selection(idc, length=None):
+    """
+    Turns the indices of one dimension into the cheapest way to read them:
+    a slice if they are evenly spaced and increasing, else an index array.
+    Negative indices count from the end of the dimension, which needs its
+    length; without it they are left as an index array for read_selection.
+
+    :param: idc (np.array/slice) - indices, boolean mask or slice; None for
+                                   the whole dimension
+    :param: length (int) - length of the dimension
+    :return: selection (slice/np.array) - slice or index array
+    """
+
+
+def read_selection(data, selection):
+    """
+    Reads the selection out of data; slices are taken as views (or one
+    hyperslab read for netCDF4 variables) and index arrays are gathered
+    only from within their bounding slice. Negative indices count from
+    the end of their dimension.
+
+    :param: data (np.ma.array/netCDF4.Variable) - input data
+    :param: selection (tuple) - slice or index array per dimension
+    :return: block (np.ma.array) - selected data
+    """
+
+
+class LazyVar(object):
+    """
+    Handle to a netCDF4 variable that reads nothing until asked, and then
+    only the requested hyperslab. Dimensions can be selected by index
+    arrays, masks or slices, or by coordinate bounds; evenly spaced indices
+    are read as one slice per dimension.
+
+    :param: variable (netCDF4.Variable) - unopened variable
+    :param: fi_in (netCDF4.Dataset) - dataset holding coordinate variables
+    :param: roles (dict) - short names (i.e. 'lat', 'lon', 'time') to the
+                           variable's dimension names
+    :param: coord_names (dict) - dimension names to the names of their
+                                 coordinate variables, if these differ
+                                 (i.e. 'lat' to 'latitude')
+    """
+
+
+def set_coord_cache(size=128, directory=None):
+    """
+    Configures the coordinate cache used by read_nc. Coordinates and decoded
+    times are kept per file (keyed by path, size and modification time), so
+    a cached file is not even opened unless more than those is asked for.
+    Spatial indices from get_grid_tree are kept per grid as well. The least
+    recently used entries are evicted beyond size.
+
+    :param: size (int) - max number of entries kept in memory; 0 to disable
+    :param: directory (str) - directory to also persist entries in, so they
+                              survive across runs; None to keep in memory
+    """
+
+
+def clear_coord_cache():
+    """
+    Empties the in-memory coordinate cache; persisted entries are kept.
+    """
+
+
 def read_nc(file_path,
             lat='lat',
             lon='lon',
@@ -192,10 +462,16 @@ def read_nc(file_path,
             extra2=None,
             extra3=None,
             original=False,
-            already=True):
+            already=False,
+            lazy=False,
+            cache=True,
+            dt64=False):
     """
     Reads the netCDF4 file's lats, lons, and time and returns those
-    parameters in addition to an opened netCDF4 dataset.
+    parameters in addition to an opened netCDF4 dataset. If lazy, the
+    extras are returned as LazyVar handles that only read the requested
+    subset from disk (the file is then left open). Coordinates and decoded
+    times are cached per file; see set_coord_cache.
 
     :param: file_path (str) - path to file
     :param: peek (boolean) - print out description of netCDF4 dataset
@@ -205,12 +481,52 @@ def read_nc(file_path,
     :param: extra3 (str) - return a third variable given name of variable
     :param: already (boolean) - whether lat, lon, time is already imported
                                 if so, only return the extras
+    :param: lazy (boolean) - return the extras as LazyVar handles
+    :param: cache (boolean) - use the coordinate cache
+    :param: dt64 (boolean) - with num2date, decode time to np.datetime64
     :return: fi_in, time, lats, lons
             (netCDF4.Dataset, np.array, np.array, np.array)
             netCDF4 dataset, time array, latitude array, longitude array
     """
 
 
+class MultiFileVar(object):
+    """
+    Virtual concatenation of a variable along time over many files, i.e.
+    daily files of one series. Nothing is copied or written; any read is
+    routed to the files that hold the requested time steps, which are
+    opened only for that read. Every file must share the grid (the
+    dimensions other than time) of the first one. Can be sliced like a
+    netCDF4 variable and passed to functions that read in blocks (i.e.
+    sci.get_scores).
+
+    :param: file_paths (list) - paths of files, in time order
+    :param: var_name (str) - name of the variable
+    :param: lat (str) - name of the latitude variable
+    :param: lon (str) - name of the longitude variable
+    :param: time (str) - name of the time (record) variable
+    """
+
+
+def read_mfnc(glob_str, var_name, directory='./',
+              lat='lat', lon='lon', time='time'):
+    """
+    Opens every netCDF file matching glob_str as one virtual variable
+    concatenated along time, without writing a concatenated file like
+    pre.concat_nc.
+
+    :param: glob_str (str) - the naming pattern of the files
+    :param: var_name (str) - name of the variable
+    :param: directory (str) - directory of files
+    :param: lat (str) - name of the latitude variable
+    :param: lon (str) - name of the longitude variable
+    :param: time (str) - name of the time (record) variable
+    :return: time, lats, lons, mf_var
+             (np.array, np.array, np.array, MultiFileVar)
+             datetime array, latitude array, longitude array, virtual variable
+    """
+
+
 def export_nc(lat, lon, var_list, name_list, units_list,
               out='untitled', time=None, z=None, description=None,
               format='NETCDF3_64BIT', time_name='time', z_name='z',
@@ -240,32 +556,87 @@ def export_nc(lat, lon, var_list, name_list, units_list,
     """
 
 
-def create_dt_arr(time_var, calendar='standard'):
+class NCWriter(object):
+    """
+    Writes a netCDF file one time step at a time along an unlimited time
+    dimension, so only one step has to be in memory. If the file already
+    exists it is opened for appending, and time steps that are not after
+    the last one written are skipped, so re-running with new days only
+    adds the new days. NETCDF4 formats support zlib/shuffle compression
+    and chunk sizes.
+
+    :param: out (str) - name of output file (without .nc)
+    :param: lat (np.array) - array of latitudes
+    :param: lon (np.array) - array of longitudes
+    :param: name_list (list) - list of variable names in string
+    :param: units_list (list) - list of units names in string
+    :param: z (np.array) - z/level/depth variable
+    :param: description (str) - description of data
+    :param: format (str) - output format
+    :param: time_name (str) - what to name the time variable
+    :param: z_name (str) - what to name the z variable
+    :param: lat_units (str) - units of latitude
+    :param: lon_units (str) - units of longitude
+    :param: time_units (str) - units of time
+    :param: z_units (str) - units of z
+    :param: time_calendar (str) - type of calendar
+    :param: dtype (str) - data type of the variables
+    :param: zlib (boolean) - compress the variables (NETCDF4 only)
+    :param: complevel (int) - compression level from 1 to 9
+    :param: shuffle (boolean) - shuffle bytes before compressing
+    :param: chunksizes (tuple) - chunk sizes of the variables; defaults to
+                                 one time step
+    :param: fill_value (float) - fill value of the variables
+    """
+
+
+def num2dt64(nums, units, calendar='proleptic_gregorian'):
+    """
+    Converts numeric times to np.datetime64 with array arithmetic instead
+    of building a datetime object per element. Only valid for the standard
+    (proleptic) Gregorian calendar; masked times become NaT. Singular and
+    abbreviated units (i.e. 'hour', 'hr', 'd') are accepted; units not
+    in TIME_UNITS_US fall back to num2date with the given calendar.
+
+    :param: nums (np.array) - numeric times
+    :param: units (str) - CF time units (i.e. 'hours since 1900-01-01')
+    :param: calendar (str) - one of DT64_CALENDARS
+    :return: datetime_array (np.array) - array of np.datetime64[us]
+    """
+
+
+def create_dt_arr(time_var, calendar='standard', dt64=False):
     """
     Creates a datetime array based on an unopened time variable.
 
     :param: time_var (netCDF4.Variable) - unopened time variable
-    :param: calendar (str) - type of calendar
+    :param: calendar (str) - type of calendar, used if time_var has none
+                             or it cannot be decoded with its own
+    :param: dt64 (boolean) - decode to np.datetime64 arithmetically; only
+                             for Gregorian calendars, else falls back
     :return: datetime_array (np.array) - array of datetimes
     """
 
 
 def dt2jul(dt):
     """
-    Return julian day out of a datetime.
+    Return julian day out of a datetime, or an array of julian days out of
+    an array of datetimes; datetime.datetime and np.datetime64 values are
+    converted arithmetically, cftime ones use their own calendar.
 
-    :param: dt (datetime.datetime/int) - datetime
-    :return: jday (int) - julian day
+    :param: dt (datetime.datetime/np.datetime64/np.array) - datetime(s)
+    :return: jday (int/np.array) - julian day(s); an int for a scalar
     """
 
 
 def jul2dt(jday, year):
     """
-    Find the datetime from a julian date.
+    Find the datetime from a julian date. Arrays of julian days and years
+    are converted together into an np.datetime64 array.
 
-    :param: jday (int) - julian day
-    :param: year (int) - year to determine if leap
-    :return: dt (datetime.datetime) - respective datetime
+    :param: jday (int/np.array) - julian day(s)
+    :param: year (int/np.array) - year(s) to determine if leap
+    :return: dt (datetime.datetime/np.array) - respective datetime(s)
     """
 
 
@@ -286,52 +657,258 @@ def clockit(start, n=''):
     """
 
 
+##############################################################################
+### profiler.py ##############################################################
+##############################################################################
+
+
+def enable_profiling(memory=False, max_samples=10000):
+    """
+    Turns on the instrumentation of ahh's public functions; same as setting
+    the AHH_PROFILE (and AHH_PROFILE_MEMORY) environment variable before
+    import.
+
+    :param: memory (boolean) - capture the peak memory of each call with
+                               tracemalloc, which slows calls down
+    :param: max_samples (int) - latest call times kept per function for p95
+    """
+
+
+def disable_profiling():
+    """
+    Turns off the instrumentation; collected stats are kept.
+    """
+
+
+def reset_profiling():
+    """
+    Clears the collected stats.
+    """
+
+
+def add_bytes_read(nbytes):
+    """
+    Credits bytes read from disk to every timer running in this thread.
+
+    :param: nbytes (int) - number of bytes read
+    """
+
+
+class Timer(object):
+    """
+    Times a block of code, or every call of a function when used as a
+    decorator, with a monotonic high resolution clock. Calls of the same
+    name are aggregated into PROFILE_STATS; nothing is recorded unless
+    profiling is enabled, through enable_profiling or the AHH_PROFILE
+    environment variable. Nested timers are inclusive.
+
+    :param: name (str) - label of the block; defaults to module.function
+                         when used as a decorator
+    """
+
+
+def get_profile_report():
+    """
+    Aggregates the collected stats, slowest total first.
+
+    :return: report (OrderedDict) - name to calls, total, mean, p95 and max
+             seconds, bytes read and peak memory in bytes (None unless
+             memory capture is on)
+    """
+
+
+def dump_profile_report(file_path=None):
+    """
+    Writes the profile report as JSON; registered at exit when the
+    AHH_PROFILE_REPORT environment variable names a file.
+
+    :param: file_path (str) - output file; defaults to AHH_PROFILE_REPORT
+    :return: report (OrderedDict) - report that was written
+    """
+
+
 ##############################################################################
 ### sci.py ###################################################################
 ##############################################################################
 
 
-def get_uac(obs, fcst, clim):
+def get_scores(obs, fcst, clim=None, idc=None,
+               scores=('uac', 'cac', 'rmse', 'mse', 'bias', 'mae'),
+               chunk_size=None, dtype=None):
+    """
+    Calculates several verification scores from a single read of obs, fcst
+    and clim. For each block of time steps, the anomalies and errors are
+    computed once and every requested score is reduced from them over the
+    box. Grid points masked in either obs or fcst are left out of every sum.
+    With dtype=np.float32, blocks are read and reduced in single precision;
+    each spatial sum is a pairwise reduction over a contiguous row, which
+    keeps the rounding error close to that of float64.
+
+    Available scores:
+    uac - uncentered anomaly correlation (needs clim)
+    cac - centered anomaly correlation (needs clim)
+    rmse - root mean square error
+    mse - mean square error
+    bias - mean error (fcst - obs)
+    mae - mean absolute error
+
+    :param: obs (np.array/netCDF4.Variable) - observation
+    :param: fcst (np.array/netCDF4.Variable) - forecast
+    :param: clim (np.array) - climatology
+    :param: idc (np.array) - indices of grid points; None for whole grid
+    :param: scores (tuple) - names of scores to compute
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
+    :return: scores_dict (dict) - score name to np.array over time
     """
-    Calculates the uncentered anomaly correlation
+
+
+def get_uac(obs, fcst, clim, chunk_size=None, dtype=None):
+    """
+    Calculates the uncentered anomaly correlation for all time steps at once,
+    reducing over the spatial axes. Masked grid points are ignored. If
+    chunk_size is given, only that many time steps are read and held in
+    memory at a time, so obs and fcst may be lazy netCDF4 variables.
 
     :param: obs (np.array) - observation
     :param: fcst (np.array) - forecast
     :param: clim - (np.array) - climatology
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
     return: uac - (np.array) - uncentered anomaly correlation
     """
 
 
-def get_cac(obs, fcst, clim, idc):
+def get_cac(obs, fcst, clim, idc, chunk_size=None, dtype=None):
     """
-    Calculates the centered anomaly correlation
+    Calculates the centered anomaly correlation for all time steps at once.
+    Each anomaly is computed only once; the means, covariance and variances
+    are then reduced over the box for every time step together. Grid points
+    masked in either obs or fcst are left out of every sum.
 
     :param: obs (np.array) - observation
     :param: fcst (np.array) - forecast
     :param: clim - (np.array) - climatology
     :param: idc - (np.array) - indices of grid points
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
     return: cac - (np.array) - centered anomaly correlation
     """
 
 
-def get_rmse(obs, fcst, idc):
+def get_rmse(obs, fcst, idc, chunk_size=None, dtype=None):
     """
-    Calculates the root mean square error
+    Calculates the root mean square error for all time steps at once, over
+    the valid (non-masked) grid points in the box; same as the 'rmse' of
+    get_scores.
 
     :param: obs (np.array) - observation
     :param: fcst (np.array) - forecast
     :param: idc - (np.array) - indices of grid points
+    :param: chunk_size (int) - number of time steps to process per block
+    :param: dtype (np.dtype) - compute precision; float32 or float64
     return: rmse - (np.array) - root mean square error
     """
 
 
+class RMSEAccumulator(object):
+    """
+    Accumulates squared errors block by block so the root mean square error
+    of an archive can be found without holding it in memory. Blocks can be
+    numpy arrays or lazy netCDF4 variables from separate files; partial
+    accumulators from separate workers can be combined with merge.
+
+    As in get_rmse, the mean is taken over the valid (non-masked) grid
+    points that were actually added.
+
+    :param: idc (np.array) - indices of grid points; None for whole grid
+    """
+
+
+class Climatology(object):
+    """
+    Builds a daily or monthly climatology incrementally. Data is streamed
+    block by block and merged into running means (and optionally variances)
+    per bin, so only the climatology itself is held in memory. Files that
+    have already been added are remembered, and the climatology can be
+    saved and loaded again to add new years later.
+
+    :param: freq (str) - daily (366 day of year bins) or monthly (12 bins)
+    :param: variance (boolean) - whether to also accumulate the variance
+    """
+
+
+def register_unit(unit, kind, scale, offset=0):
+    """
+    Adds a unit to the registry as an affine transform to the base unit of
+    its kind (base = value * scale + offset). Factors are kept as exact
+    fractions so that composed transforms do not accumulate rounding.
+
+    :param: unit (str) - name of unit
+    :param: kind (str) - kind of unit (e.g. temperature); only units of the
+                         same kind can be converted between
+    :param: scale (float/Fraction) - scale factor to the base unit
+    :param: offset (float/Fraction) - offset to the base unit after scaling
+    """
+
+
+def compose_transforms(*transforms):
+    """
+    Fuses affine transforms, applied in the given order, into one.
+
+    :param: transforms (tuple) - (scale, offset) of each transform
+    :return: transform (tuple) - fused (scale, offset)
+    """
+
+
+def get_transform(from_unit, to_unit):
+    """
+    Gets the affine transform between two registered units.
+
+    :param: from_unit (str) - unit of input
+    :param: to_unit (str) - unit of output
+    :return: transform (tuple) - (scale, offset) so that
+                                 output = input * scale + offset
+    """
+
+
+def apply_transform(variable, transform, out=None, inplace=False):
+    """
+    Applies an affine transform with one multiply and one add, writing into
+    out (or variable itself if inplace) instead of allocating. Floating
+    point dtypes are preserved; out (or variable if inplace) has to be
+    floating point.
+
+    :param: variable (np.array) - variable values
+    :param: transform (tuple) - (scale, offset)
+    :param: out (np.array) - array to write the result into
+    :param: inplace (boolean) - overwrite variable with the result
+    :return: conv_var (np.array) - converted variable values
+    """
+
+
+def convert_units(variable, from_unit, to_unit, out=None, inplace=False):
+    """
+    Converts the variable between two registered units.
+
+    :param: variable (np.array) - variable values
+    :param: from_unit (str) - unit of input (e.g. 'C')
+    :param: to_unit (str) - unit of output (e.g. 'F')
+    :param: out (np.array) - array to write the result into
+    :param: inplace (boolean) - overwrite variable with the result
+    :return: conv_var (np.array) - converted variable values
+    """
+
+
 def convert(variable,
             mm2in=False,
             c2f=False,
             c2k=False,
             f2k=False,
             mps2mph=False,
-            reverse=False
+            reverse=False,
+            out=None,
+            inplace=False
             ):
     """
     Converts the variable from one unit to another.
@@ -343,44 +920,145 @@ def convert(variable,
     :param: f2k (boolean) - Fahrenheit to Kelvin
     :param: mps2mph (boolean) - meters per second to miles per hour
     :param: reverse (boolean) - reverses the conversions (mm2in becomes in2mm)
+    :param: out (np.array) - array to write the result into
+    :param: inplace (boolean) - overwrite variable with the result
     :return: conv_var (np.array) - converted variable values
     """
 
 
-def get_norm_anom(data_avg):
+def get_norm_anom(data_avg, dtype=None):
     """
     Finds the normalized anomaly of some averaged data
 
     :param: data_avg (np.ma.array) - average data values
+    :param: dtype (np.dtype) - compute precision; float32 or float64
     :return: data_anom (float) - normalized anomaly
     """
 
 
+class RollingNormAnom(object):
+    """
+    Keeps a running mean and variance so the normalized anomaly of each new
+    value can be found without recomputing over the whole record. Uses
+    Welford's updates, over either an expanding window (all values so far)
+    or a fixed window of the latest values. Values can be scalars or whole
+    grids, in which case every grid point is tracked separately.
+
+    :param: window (int) - number of latest values to use; None to expand
+    """
+
+
+def get_rolling_norm_anom(data, window=None, axis=0):
+    """
+    Finds the normalized anomaly of every value along an axis relative to
+    the values up to and including it, over an expanding or fixed window.
+    The last value of an expanding window matches get_norm_anom.
+
+    :param: data (np.array) - data values
+    :param: window (int) - number of latest values to use; None to expand
+    :param: axis (int) - axis to roll along (e.g. time)
+    :return: data_anom (np.array) - normalized anomalies, same shape as data
+    """
+
+
 def get_avg(data, axis=(0),
             times_idc=None,
             lats_idc=None,
             lons_idc=None,
             lvls_idc=None,
-            change_lvl_order=False):
+            change_lvl_order=False,
+            workers=None,
+            chunk_size=None,
+            split_axis=0,
+            use_processes=False,
+            dims=None,
+            idc=None,
+            dtype=None):
     """
-    Finds the areal and/or time average and/or level, but first,
+    Finds the areal and/or time average and/or level. Unless dims is given,
     data dimensions must be in these orders:
     lat, lon
     time, lat, lon
     time, level, lat, lon OR time, lat, lon, level (if change_lvl_order)
 
+    Any dimension can be named in dims and selected through idc with an
+    index array, boolean mask or slice; the named *_idc inputs fill in the
+    'time', 'lat', 'lon' and 'lvl' dimensions. Evenly spaced indices are
+    read as slices (views), and only irregular ones are gathered. Every
+    given index is included.
+
+    If workers or chunk_size is given, the selection is split into blocks
+    along split_axis (e.g. 0 for time, 1 for level); each block's sums and
+    counts are reduced on a thread (or process) pool and combined exactly,
+    so only a few blocks are in memory at once.
+
+    With dtype=np.float32, blocks are summed in single precision and their
+    partial sums are combined with Kahan compensation.
+
     :param: data (np.ma.array) - input data
-    :param: axis (tuple) - axis to average over
+    :param: axis (tuple) - axis (int or dimension name) to average over
     :param: times_idc (np.array) - time indices
     :param: lats_idc (np.array) - latitude indices
     :param: lons_idc (np.array) - longitude indices
     :param: lvls_idc (float) - level indices
     :param: change_lvl_order (boolean) - changes order of level dimension
+    :param: workers (int) - number of parallel workers; None for serial
+    :param: chunk_size (int) - length of each block along split_axis
+    :param: split_axis (int) - axis (or dimension name) to split blocks along
+    :param: use_processes (boolean) - use a process pool instead of threads
+    :param: dims (tuple) - names of the data dimensions, in order
+    :param: idc (dict) - dimension name to indices, mask or slice
+    :param: dtype (np.dtype) - compute precision; float32 or float64
 
     :return: avg (np.array) - average over given parameters
     """
 
 
+def get_regrid_weights(src_lats, src_lons, dst_lats, dst_lons,
+                       method='bilinear', cache_dir=None):
+    """
+    Computes (once) the sparse matrix that maps a rectilinear source grid
+    onto a rectilinear destination grid. Bilinear weights interpolate
+    between the four surrounding centers; conservative weights are the
+    fraction of each destination cell's area covered by each source cell.
+    Longitudes spanning the globe wrap around. Weights are kept in memory
+    and, if a cache directory is set, on disk keyed by both grids.
+
+    :param: src_lats (np.array) - source latitudes
+    :param: src_lons (np.array) - source longitudes
+    :param: dst_lats (np.array) - destination latitudes
+    :param: dst_lons (np.array) - destination longitudes
+    :param: method (str) - 'bilinear' or 'conservative'
+    :param: cache_dir (str) - directory of .npz weights; defaults to the
+                              directory given to ext.set_coord_cache
+    :return: weights (scipy.sparse.csr_matrix) - (destination points,
+             source points) with points in (lat, lon) order
+    """
+
+
+def regrid(data, src_lats, src_lons, dst_lats, dst_lons,
+           method='bilinear', weights=None, cache_dir=None, dtype=None):
+    """
+    Regrids a stack of fields between rectilinear grids with one sparse
+    product for all of its leading (i.e. time) indices. Masked or NaN
+    source points are left out and the weights of the rest renormalized;
+    destination points with no valid source are masked.
+
+    :param: data (np.ma.array/netCDF4.Variable) - data shaped
+                                                  (..., lat, lon)
+    :param: src_lats (np.array) - source latitudes
+    :param: src_lons (np.array) - source longitudes
+    :param: dst_lats (np.array) - destination latitudes
+    :param: dst_lons (np.array) - destination longitudes
+    :param: method (str) - 'bilinear' or 'conservative'
+    :param: weights (scipy.sparse.csr_matrix) - precomputed weights from
+                                                get_regrid_weights
+    :param: cache_dir (str) - directory of .npz weights
+    :param: dtype (np.dtype) - compute precision
+    :return: regridded (np.ma.array) - data shaped (..., dst lat, dst lon)
+    """
+
+
 ##############################################################################
 ### vis.py ###################################################################
 ##############################################################################
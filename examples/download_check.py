@@ -0,0 +1,340 @@
+"""
+Checks pre.wget_fi against local HTTP servers: resuming truncated
+downloads, following redirects within and across hosts (without passing
+on credentials), giving up on redirect loops, adopting files already
+on disk and fetching files changed on the server. The FTP path is
+checked against a local FTP server: listing with MLSD or NLST, SIZE and
+MDTM, resuming with REST, and failing files the server refuses. Run with
+python examples/download_check.py; it needs no network.
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, StreamRequestHandler, TCPServer
+import threading
+import socket
+import tempfile
+import shutil
+import os
+
+from ahh import pre
+
+FILES = {'data_{:02d}.bin'.format(i): os.urandom(100000 + i)
+         for i in range(4)}
+STATE = {'fail': {}, 'auth': {}, 'heads': 0, 'gets': 0, 'sizeless': False}
+FTP_STATE = {'fail': {}, 'mlsd': True, 'rests': [], 'retrs': 0,
+             'refused': 'data_03.bin'}
+MODIFY = '20170101000000'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves FILES under /data/ with range requests, and redirects /old/ to
+    /data/, /moved/ to the other server and /loop/ to itself.
+    """
+    protocol_version = 'HTTP/1.1'
+    other = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if self.command != 'HEAD' or not STATE['sizeless']:
+            self.send_header('Content-Length', len(body))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _serve(self):
+        path = self.path.split('?')[0]
+        port = self.server.server_port
+        STATE['auth'][port] = self.headers.get('Authorization')
+        for prefix, target in (
+                ('/old/', '/data/'),
+                ('/moved/', 'http://127.0.0.1:{}/data/'.format(self.other)),
+                ('/loop/', '/loop/')):
+            if path.startswith(prefix):
+                return self._send(302, headers={
+                    'Location': target + path[len(prefix):]})
+        if path == '/data/':
+            body = ''.join('<a href="{0}">{0}</a>'.format(name)
+                           for name in sorted(FILES)).encode('utf-8')
+            return self._send(200, body)
+        name = path[len('/data/'):]
+        if not path.startswith('/data/') or name not in FILES:
+            return self._send(404)
+        data = FILES[name]
+        if STATE['fail'].get(name):
+            STATE['fail'][name] -= 1
+            self.send_response(200)
+            self.send_header('Content-Length', len(data))
+            self.end_headers()
+            self.wfile.write(data[:len(data) // 2])
+            self.close_connection = True
+            return
+        headers = {'ETag': '"{}"'.format(len(data))}
+        byte_range = self.headers.get('Range')
+        if byte_range:
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                start, len(data) - 1, len(data))
+            return self._send(206, data[start:], headers)
+        return self._send(200, data, headers)
+
+    def do_GET(self):
+        STATE['gets'] += 1
+        self._serve()
+
+    def do_HEAD(self):
+        STATE['heads'] += 1
+        self._serve()
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FTPHandler(StreamRequestHandler):
+    """
+    Serves FILES over passive mode FTP, with just the commands ftplib and
+    pre.Downloader use. A transfer in FTP_STATE['fail'] is aborted half way
+    and the file in FTP_STATE['refused'] can be listed but not retrieved.
+    """
+
+    def _reply(self, line):
+        self.wfile.write('{}\r\n'.format(line).encode('utf-8'))
+
+    def _transfer(self, pasv, data):
+        conn = pasv.accept()[0]
+        conn.sendall(data)
+        conn.close()
+        pasv.close()
+
+    def handle(self):
+        self._reply('220 ready')
+        pasv = None
+        rest = 0
+        while True:
+            line = self.rfile.readline().decode('utf-8').strip()
+            if not line:
+                return
+            cmd, _, arg = line.partition(' ')
+            cmd = cmd.upper()
+            if cmd == 'USER':
+                self._reply('331 password please')
+            elif cmd == 'PASS':
+                self._reply('230 logged in')
+            elif cmd == 'TYPE':
+                self._reply('200 type set')
+            elif cmd == 'CWD':
+                self._reply('250 ok')
+            elif cmd == 'PASV':
+                pasv = socket.socket()
+                pasv.bind(('127.0.0.1', 0))
+                pasv.listen(1)
+                port = pasv.getsockname()[1]
+                self._reply('227 Entering Passive Mode (127,0,0,1,{},{})'
+                            .format(port // 256, port % 256))
+            elif cmd == 'REST':
+                rest = int(arg)
+                FTP_STATE['rests'].append(rest)
+                self._reply('350 restarting')
+            elif cmd in ('SIZE', 'MDTM'):
+                if arg not in FILES:
+                    self._reply('550 no such file')
+                elif cmd == 'SIZE':
+                    self._reply('213 {}'.format(len(FILES[arg])))
+                else:
+                    self._reply('213 {}'.format(MODIFY))
+            elif cmd == 'MLSD' and FTP_STATE['mlsd']:
+                self._reply('150 listing')
+                self._transfer(pasv, ''.join(
+                    'type=file;size={};modify={}; {}\r\n'.format(
+                        len(data), MODIFY, name)
+                    for name, data in sorted(FILES.items())).encode('utf-8'))
+                self._reply('226 done')
+            elif cmd == 'NLST':
+                self._reply('150 listing')
+                self._transfer(pasv, ''.join(
+                    '{}\r\n'.format(name)
+                    for name in sorted(FILES)).encode('utf-8'))
+                self._reply('226 done')
+            elif cmd == 'RETR':
+                if arg not in FILES or arg == FTP_STATE['refused']:
+                    self._reply('550 permission denied')
+                    continue
+                FTP_STATE['retrs'] += 1
+                data = FILES[arg][rest:]
+                rest = 0
+                self._reply('150 sending')
+                if FTP_STATE['fail'].get(arg):
+                    FTP_STATE['fail'][arg] -= 1
+                    self._transfer(pasv, data[:len(data) // 2])
+                    self._reply('426 transfer aborted')
+                    continue
+                self._transfer(pasv, data)
+                self._reply('226 done')
+            elif cmd == 'QUIT':
+                self._reply('221 bye')
+                return
+            else:
+                self._reply('502 not implemented')
+
+
+class FTPServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(server_class=None, handler_class=Handler):
+    """
+    Starts a server on a free local port in a background thread.
+
+    :param: server_class (class) - server class; defaults to Server
+    :param: handler_class (class) - request handler class
+    :return: server (Server) - running server
+    """
+    server = (server_class or Server)(('127.0.0.1', 0), handler_class)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def check(base_url, directory, **kwargs):
+    """
+    Downloads all files from base_url and checks their contents.
+
+    :param: base_url (str) - directory to download from
+    :param: directory (str) - directory to download into
+    :return: results (OrderedDict) - results of wget_fi
+    """
+    results = pre.wget_fi(base_url, 'data_*.bin', directory=directory,
+                          backoff=0.01, **kwargs)
+    for name, result in results.items():
+        assert result['status'] in ('downloaded', 'skipped'), result
+        with open(os.path.join(directory, name), 'rb') as fi_in:
+            assert fi_in.read() == FILES[name], name
+    return results
+
+
+def check_ftp(directory):
+    """
+    Downloads FILES from the local FTP server, with and without MLSD, and
+    checks resuming and refused files.
+
+    :param: directory (str) - directory to download into
+    """
+    server = start_server(FTPServer, FTPHandler)
+    url = 'ftp://127.0.0.1:{}/pub/'.format(server.server_address[1])
+    try:
+        with pre.Downloader(url, backoff=0.01) as downloader:
+            assert downloader.list_files('data_*.bin') == sorted(FILES)
+            assert downloader.stat('data_00.bin')['size'] == \
+                len(FILES['data_00.bin'])
+            result = downloader.fetch(FTP_STATE['refused'], directory)
+            assert result['status'] == 'failed', result
+            assert result['attempts'] == 1, result
+        print('FTP: listed with MLSD and gave up on a refused file')
+
+        FTP_STATE['mlsd'] = False
+        FTP_STATE['fail'] = {'data_01.bin': 1}
+        refused = FTP_STATE['refused']
+        FTP_STATE['refused'] = None
+        with pre.Downloader(url, backoff=0.01) as downloader:
+            meta = downloader.stat('data_02.bin')
+            assert meta['size'] == len(FILES['data_02.bin'])
+            assert meta['mtime'] == MODIFY
+        results = check(url, directory)
+        assert results['data_01.bin']['attempts'] == 2
+        assert len(FILES['data_01.bin']) // 2 in FTP_STATE['rests']
+        print('FTP: listed with NLST, stated with SIZE/MDTM and resumed '
+              'with REST')
+
+        retrs = FTP_STATE['retrs']
+        results = check(url, directory)
+        assert FTP_STATE['retrs'] == retrs
+        assert all(result['status'] == 'skipped'
+                   for result in results.values())
+        print('FTP: skipped unchanged files')
+        FTP_STATE['refused'] = refused
+    finally:
+        server.shutdown()
+
+
+def main():
+    server = start_server()
+    other = start_server()
+    Handler.other = other.server_port
+    url = 'http://127.0.0.1:{}/'.format(server.server_port)
+    directory = tempfile.mkdtemp()
+    try:
+        STATE['fail'] = {'data_01.bin': 2}
+        results = check(url + 'data/', directory)
+        assert results['data_01.bin']['attempts'] == 3
+        print('resumed truncated downloads')
+
+        shutil.rmtree(directory)
+        check(url + 'old/', directory, user='user', pwd='pwd')
+        assert STATE['auth'][server.server_port] is not None
+        print('followed a redirect on the same host')
+
+        shutil.rmtree(directory)
+        check(url + 'moved/', directory, user='user', pwd='pwd')
+        assert STATE['auth'][other.server_port] is None
+        print('followed a redirect to another host without credentials')
+
+        try:
+            pre.wget_fi(url + 'loop/', 'data_*.bin', directory=directory,
+                        retries=0)
+        except pre.DownloadError as error:
+            assert 'redirects' in str(error)
+            print('gave up on a redirect loop')
+        else:
+            raise AssertionError('redirect loop was followed')
+
+        shutil.rmtree(directory)
+        os.makedirs(directory)
+        for name, data in FILES.items():
+            with open(os.path.join(directory, name), 'wb') as fi_out:
+                fi_out.write(data)
+        STATE['gets'] = 0
+        STATE['heads'] = 0
+        results = check(url + 'data/', directory)
+        assert all(result['status'] == 'skipped'
+                   for result in results.values())
+        assert STATE['gets'] == 1 and STATE['heads'] == len(FILES)
+        print('adopted files already on disk without downloading them')
+
+        FILES['data_02.bin'] = os.urandom(100020)
+        results = check(url + 'data/', directory)
+        assert [name for name, result in results.items()
+                if result['status'] == 'downloaded'] == ['data_02.bin']
+        assert results['data_02.bin']['reason'] == 'changed'
+        print('fetched a file that changed on the server')
+
+        os.remove(os.path.join(directory, pre.MANIFEST_NAME))
+        STATE['sizeless'] = True
+        results = check(url + 'data/', directory)
+        assert all(result['reason'] == 'unverified'
+                   for result in results.values())
+        os.remove(os.path.join(directory, pre.MANIFEST_NAME))
+        results = check(url + 'data/', directory, adopt_unverified=True)
+        assert all(result['status'] == 'skipped'
+                   for result in results.values())
+        STATE['sizeless'] = False
+        print('downloaded files it could not verify unless told to adopt')
+
+        shutil.rmtree(directory)
+        os.makedirs(directory)
+        check_ftp(directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        server.shutdown()
+        other.shutdown()
+    print('all checks passed')
+
+
+if __name__ == '__main__':
+    main()